@@ -2,4 +2,4 @@
 
 python manage.py collectstatic --no-input
 
-gunicorn ultima_tea.wsgi:application --bind 0.0.0.0:8000
+gunicorn ultima_tea.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+
+# Claims of access token describing user, see add_user_claims
+USER_CLAIMS = ("machine_id", "is_staff", "is_superuser")
+
+
+def user_claims(user):
+    return {claim: getattr(user, claim) for claim in USER_CLAIMS}
+
+
+def add_user_claims(token, user):
+    for claim, value in user_claims(user).items():
+        token[claim] = value
+    return token
+
+
+def user_state_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def state_timeout():
+    # Older access tokens are expired, their users need no cached state
+    return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+# State of user who can not authenticate (inactive or deleted)
+INACTIVE = {"active": False}
+
+
+def user_state(user):
+    "What token authentication needs to know about user"
+    if user is None or not user.is_active:
+        return INACTIVE
+    return {"active": True, "claims": user_claims(user)}
+
+
+def publish_user_state(user_id, state):
+    "Replace cached state of user, called after user change is committed"
+    cache.set(user_state_key(user_id), state, state_timeout())
+
+
+def load_user_state(user_id):
+    """
+    Cached state of user, read from database on cache miss. Database stays the source of
+    truth, evicted entry costs one query and never lets deactivated user in.
+    """
+    key = user_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = CustomUser.objects.filter(pk=user_id).values("is_active", *USER_CLAIMS).first()
+        state = user_state(row and CustomUser(**row))
+        # State published by concurrent change is newer, it is not overwritten
+        cache.add(key, state, state_timeout())
+    return state
+
+
+def claims_user(user_id, claims):
+    """
+    User rebuilt from claims without database. Only id, machine_id and permission flags
+    are set, it is enough for filters and permission checks but must never be saved.
+    """
+    user = CustomUser(
+        # Token stores id as string
+        id=CustomUser._meta.pk.to_python(user_id),
+        machine_id=claims.get("machine_id"),
+        is_staff=claims.get("is_staff", False),
+        is_superuser=claims.get("is_superuser", False),
+        is_active=True,
+    )
+    user._state.adding = False
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication without per-request user SELECT. User is rebuilt from its state
+    (active flag and claims) kept in cache, loaded from database on cache miss and replaced
+    after every user change (authorization/signals.py). Cache has to be shared by all
+    workers (SHARED_CACHE), otherwise changes made in one worker would not reach others
+    and user is loaded from database like in JWTAuthentication. Tokens without claims
+    (issued before claims were added) are authenticated from database too.
+    Revocation is per user: deactivated or deleted user is rejected with all tokens,
+    single token is not revoked and stays valid until it expires.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        if not settings.SHARED_CACHE or "machine_id" not in validated_token:
+            return super().get_user(validated_token)
+
+        state = load_user_state(user_id)
+        if not state["active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return claims_user(user_id, state["claims"])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='favourites_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
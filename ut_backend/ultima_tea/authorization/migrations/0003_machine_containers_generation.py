@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0002_machine_favourites_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='containers_generation',
+            field=models.IntegerField(default=0),
+        ),
+    ]
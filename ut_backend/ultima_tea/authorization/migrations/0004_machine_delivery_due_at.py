@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0003_machine_containers_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='delivery_due_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
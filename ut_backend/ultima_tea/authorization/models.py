@@ -51,6 +51,9 @@ class Machine(models.Model):
         OFF = 0
         ON = 1
 
+    # Machine stays in MIXING state after tea is made, until user acknowledges it
+    FINISHED_STATE = StatesOfTeaMakingProcess.MIXING
+
     machine_id = models.CharField(primary_key=True, max_length=12)
     brewing_temperature = models.FloatField(default=0, null=True)
     air_temperature = models.FloatField(default=0, null=True)
@@ -65,6 +68,12 @@ class Machine(models.Model):
     machine_status = models.IntegerField(
         default=0, choices=MachineStates.choices, null=True
     )
+    # Bumped with every favourites change sent to machine (main_app/favourites.py)
+    favourites_version = models.IntegerField(default=0)
+    # Bumped with every container edit, debounces container sync (main_app/container_sync.py)
+    containers_generation = models.IntegerField(default=0)
+    # Time of scheduled delivery of machine messages (main_app/delivery.py)
+    delivery_due_at = models.DateTimeField(null=True)
 
     class Meta:
         db_table = "machine"
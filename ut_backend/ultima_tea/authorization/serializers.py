@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from .models import CustomUser
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import add_user_claims
 
 class UserSerializer(serializers.ModelSerializer):
     #machine = serializers.CharField(validators=[required,check_machine_id])
@@ -26,6 +28,11 @@ class UserSerializer(serializers.ModelSerializer):
 
 class TokenObtainLifetimeSerializer(TokenObtainPairSerializer):
 
+    @classmethod
+    def get_token(cls, user):
+        # Requests are authenticated from these claims, without loading user
+        return add_user_claims(super().get_token(user), user)
+
     def validate(self, attrs):
         data = super().validate(attrs)
         refresh = self.get_token(self.user)
@@ -37,7 +44,13 @@ class TokenObtainLifetimeSerializer(TokenObtainPairSerializer):
 class TokenRefreshLifetimeSerializer(TokenRefreshSerializer):
 
     def validate(self, attrs):
-        data = super().validate(attrs)
-        refresh = RefreshToken(attrs['refresh'])
-        data['lifetime'] = int(refresh.access_token.lifetime.total_seconds())
-        return data
\ No newline at end of file
+        # Access token keeps claims of refresh token, authentication reads their current
+        # values from user state (authentication.py)
+        try:
+            data = super().validate(attrs)
+        except CustomUser.DoesNotExist:
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'], 'no_active_account'
+            )
+        data['lifetime'] = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        return data
@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import INACTIVE, publish_user_state, user_state
+from .models import CustomUser
+
+
+# Token authentication reads users from cache (authentication.py), changes replace them
+
+
+@receiver(post_save, sender=CustomUser)
+def update_user_state(sender, instance, **kwargs):
+    user_id, state = instance.pk, user_state(instance)
+    transaction.on_commit(lambda: publish_user_state(user_id, state))
+
+
+@receiver(post_delete, sender=CustomUser)
+def deactivate_deleted_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: publish_user_state(user_id, INACTIVE))
@@ -0,0 +1,44 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView with async handlers, served by event loop of ASGI worker (ultima_tea/asgi.py).
+    Authentication and permission checks run in database thread, user usually comes
+    from cache without query (authorization/authentication.py). Database work of handlers
+    goes through async ORM or sync_to_async. All handlers of view have to be async.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Same as APIView.dispatch, awaiting handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+async def publish(task, *args):
+    """
+    Send Celery task without blocking event loop. Broker I/O runs in its own thread,
+    not in the one shared by database calls.
+    """
+    return await sync_to_async(task.delay, thread_sensitive=False)(*args)
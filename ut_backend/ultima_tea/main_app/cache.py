@@ -0,0 +1,84 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Ingredients, Teas
+
+CATALOG_TIMEOUT = 60 * 60
+
+
+def data_etag(data):
+    "Strong ETag of JSON serializable response data"
+    etag = hashlib.md5(
+        json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    ).hexdigest()
+    return f'"{etag}"'
+
+
+class Catalog:
+    """
+    Cached copy of a rarely changing table (teas, ingredients). One cache entry keeps
+    serialized list returned by API, its ETag and id -> object map used by write
+    serializers. Entry is dropped by post_save/post_delete signals (see signals.py).
+    Serializer is given by name, because serializers validate against catalogs.
+    """
+
+    def __init__(self, name, model, serializer_name):
+        self.key = f"catalog:{name}"
+        self.model = model
+        self.serializer_name = serializer_name
+
+    def get(self):
+        entry = cache.get(self.key)
+        if entry is None:
+            entry = self.build()
+            cache.set(self.key, entry, CATALOG_TIMEOUT)
+        return entry
+
+    def build(self):
+        from . import serializers
+
+        serializer_class = getattr(serializers, self.serializer_name)
+        objects = list(self.model.objects.order_by("id"))
+        data = json.loads(
+            json.dumps(serializer_class(objects, many=True).data, default=str)
+        )
+        return {
+            "data": data,
+            "etag": data_etag(data),
+            "objects": {obj.pk: obj for obj in objects},
+        }
+
+    @property
+    def data(self):
+        return self.get()["data"]
+
+    @property
+    def etag(self):
+        return self.get()["etag"]
+
+    def in_bulk(self, ids):
+        """
+        Return {id: object} for given ids, missing ids are left out. Entry may be stale
+        (object created by other worker), if any id is not in it the database decides.
+        """
+        objects = self.get()["objects"]
+        if all(pk in objects for pk in ids):
+            return {pk: objects[pk] for pk in ids}
+        found = self.model.objects.in_bulk(ids)
+        if len(found) > sum(pk in objects for pk in ids):
+            cache.delete(self.key)
+        return found
+
+    def invalidate(self):
+        cache.delete(self.key)
+        # Drop entry once more after commit, so it is not rebuilt from data
+        # read by other request before the change became visible
+        transaction.on_commit(lambda: cache.delete(self.key))
+
+
+teas_catalog = Catalog("teas", Teas, "TeaSerializer")
+ingredients_catalog = Catalog("ingredients", Ingredients, "IngredientSerializer")
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models import F
+
+from authorization.models import Machine
+from .models import MachineContainers
+from .streams import serialize_container
+from .tasks import sync_containers, update_all_containers, update_single_container
+from .wire import containers_message
+
+# Seconds without container edits after which machine is synchronized
+SYNC_QUIET_WINDOW = 3
+
+
+def schedule_container_sync(machine_id, container_number):
+    """
+    Mark container as changed and schedule synchronization of machine after quiet window.
+    Every edit delays synchronization, burst of edits ends with single message to machine.
+    Pending edits and generation are kept in database, so web workers and Celery see
+    the same state.
+    """
+    with transaction.atomic():
+        MachineContainers.objects.filter(
+            machine_id=machine_id, container_number=container_number
+        ).update(sync_pending=True)
+        # Machine row stays locked until commit, concurrent edits get distinct generations
+        Machine.objects.filter(pk=machine_id).update(
+            containers_generation=F("containers_generation") + 1
+        )
+        generation = (
+            Machine.objects.filter(pk=machine_id)
+            .values_list("containers_generation", flat=True)
+            .get()
+        )
+    sync_containers.apply_async((machine_id, generation), countdown=SYNC_QUIET_WINDOW)
+
+
+def containers_payload(containers):
+    return {
+        "tea_containers": [
+            serialize_container(container)
+            for container in containers
+            if container.container_number <= 2
+        ],
+        "ingredient_containers": [
+            serialize_container(container)
+            for container in containers
+            if container.container_number >= 3
+        ],
+    }
+
+
+def flush_container_sync(machine_id, generation):
+    """
+    Send pending container changes of machine, unless it was edited again after generation
+    was scheduled (then later task sends them). Single changed container is sent with
+    update_single_container, more with update_all_containers. Return True if message was sent.
+    """
+    with transaction.atomic():
+        current = (
+            Machine.objects.filter(pk=machine_id)
+            .values_list("containers_generation", flat=True)
+            .first()
+        )
+        if current != generation:
+            return False
+        # Pending flags are taken under row locks, edit made meanwhile marks its container
+        # again and is sent by its own task
+        changed = list(
+            MachineContainers.objects.select_for_update()
+            .filter(machine_id=machine_id, sync_pending=True)
+            .order_by("container_number")
+            .values_list("container_number", flat=True)
+        )
+        MachineContainers.objects.filter(
+            machine_id=machine_id, container_number__in=changed, sync_pending=True
+        ).update(sync_pending=False)
+    if not changed:
+        return False
+    containers = list(
+        MachineContainers.objects.filter(machine_id=machine_id)
+        .select_related("tea", "ingredient")
+        .order_by("container_number")
+    )
+    if len(changed) == 1:
+        container = next(
+            container
+            for container in containers
+            if container.container_number == changed[0]
+        )
+        update_single_container.delay(
+            containers_message([container]), container.container_number, machine_id
+        )
+    else:
+        update_all_containers.delay(containers_message(containers), machine_id)
+    return True
@@ -0,0 +1,283 @@
+import threading
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from authorization.models import Machine
+from .models import MachineMessage
+
+# Seconds before first retry, doubled with every failed attempt up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 10 * 60
+# Message is given up after this many attempts, next messages of machine are delivered
+MAX_ATTEMPTS = 10
+# Messages delivered by one task run, rest is delivered by next run
+DELIVERY_BATCH = 50
+# Seconds for which worker owns delivery to machine, longer than send of one message
+LEASE_SECONDS = 30
+# Messages remembered by device simulator per machine
+SIMULATOR_HISTORY = 1000
+
+
+class DeliveryError(Exception):
+    "Message was not acknowledged by machine"
+
+
+def envelope(message):
+    "What is sent to machine, key lets machine drop messages it already handled"
+    return {
+        "key": message.key,
+        "seq": message.id,
+        "type": message.message_type,
+        "payload": message.payload,
+    }
+
+
+class DeviceSimulator:
+    """
+    In-memory machines, used in tests and local development (never in production, messages
+    are acknowledged without reaching any machine). Every machine acknowledges message by
+    storing it, message with already seen key is acknowledged but not stored again. Only
+    last SIMULATOR_HISTORY messages are kept. Failures of next sends can be requested
+    with fail_next.
+    """
+
+    received = defaultdict(list)
+    failures = defaultdict(int)
+    lock = threading.Lock()
+
+    def send(self, machine_id, message):
+        with self.lock:
+            if self.failures[machine_id]:
+                self.failures[machine_id] -= 1
+                raise DeliveryError(f"Machine {machine_id} did not acknowledge message")
+            keys = {item["key"] for item in self.received[machine_id]}
+            if message["key"] not in keys:
+                self.received[machine_id].append(message)
+                del self.received[machine_id][:-SIMULATOR_HISTORY]
+
+    @classmethod
+    def fail_next(cls, machine_id, count=1):
+        with cls.lock:
+            cls.failures[machine_id] += count
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.received.clear()
+            cls.failures.clear()
+
+
+class HttpTransport:
+    """
+    Sends messages to machines through device gateway (DEVICE_GATEWAY_URL),
+    2xx response means machine acknowledged message.
+    """
+
+    timeout = 5
+
+    def __init__(self, url=None):
+        import requests
+
+        self.url = (url or settings.DEVICE_GATEWAY_URL).rstrip("/")
+        self.session = requests.Session()
+
+    def send(self, machine_id, message):
+        import requests
+
+        try:
+            response = self.session.post(
+                f"{self.url}/machines/{machine_id}/messages",
+                json=message,
+                headers={"Idempotency-Key": message["key"]},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as error:
+            raise DeliveryError(str(error)) from error
+        if not response.ok:
+            raise DeliveryError(f"Gateway responded {response.status_code}")
+
+
+@lru_cache(maxsize=None)
+def load_transport(path):
+    return import_string(path)()
+
+
+def get_transport():
+    """
+    Transport given by DEVICE_TRANSPORT setting, one per process. None if delivery is not
+    configured, messages then stay pending.
+    """
+    if not settings.DEVICE_TRANSPORT:
+        return None
+    return load_transport(settings.DEVICE_TRANSPORT)
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def enqueue_message(machine_id, message_type, payload, key=None):
+    """
+    Append message to queue of machine. Key identifies message, enqueueing the same key
+    again (replayed task) does not add second message. Return the message.
+    """
+    key = key or uuid.uuid4().hex
+    try:
+        with transaction.atomic():
+            return MachineMessage.objects.create(
+                machine_id=machine_id,
+                key=key,
+                message_type=message_type,
+                payload=payload,
+            )
+    except IntegrityError:
+        return MachineMessage.objects.get(key=key)
+
+
+def claim_next(machine_id):
+    """
+    Lease first pending message of machine to this worker. Lease is the lock of machine
+    queue, worker which holds it is the only one sending to machine until it expires.
+    Return (message, None) if message was leased, else (None, seconds after which
+    delivery should run again, None if queue is empty).
+    """
+    now = timezone.now()
+    message = (
+        MachineMessage.objects.filter(
+            machine_id=machine_id, status=MachineMessage.Status.PENDING
+        )
+        .order_by("id")
+        .first()
+    )
+    if message is None:
+        return None, None
+    if message.leased_until is not None and message.leased_until > now:
+        # Other worker delivers, run again if it dies
+        return None, (message.leased_until - now).total_seconds()
+    if message.next_attempt_at > now:
+        return None, (message.next_attempt_at - now).total_seconds()
+    leased_until = now + timedelta(seconds=LEASE_SECONDS)
+    claimed = MachineMessage.objects.filter(
+        pk=message.pk,
+        status=MachineMessage.Status.PENDING,
+        leased_until=message.leased_until,
+    ).update(leased_until=leased_until)
+    if not claimed:
+        # Concurrent worker was faster
+        return None, None
+    message.leased_until = leased_until
+    return message, None
+
+
+def send(message, transport):
+    """
+    Send leased message and record result, return seconds to retry after or None.
+    Message is given up after MAX_ATTEMPTS, next messages of machine are delivered.
+    """
+    message.attempts += 1
+    message.leased_until = None
+    fields = ["attempts", "leased_until"]
+    try:
+        transport.send(message.machine_id, envelope(message))
+    except DeliveryError as error:
+        message.last_error = str(error)
+        fields.append("last_error")
+        if message.attempts < MAX_ATTEMPTS:
+            delay = retry_delay(message.attempts)
+            message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            message.save(update_fields=fields + ["next_attempt_at"])
+            return delay
+        message.status = MachineMessage.Status.FAILED
+        message.save(update_fields=fields + ["status"])
+        return None
+    message.status = MachineMessage.Status.DELIVERED
+    message.delivered_at = timezone.now()
+    message.save(update_fields=fields + ["status", "delivered_at"])
+    return None
+
+
+def deliver_pending(machine_id, transport=None):
+    """
+    Deliver pending messages of machine in order they were enqueued. Every message is
+    leased in its own short statement and sent outside of transaction, no lock is held
+    during network calls. Failed message is retried with exponential backoff before any
+    later message is sent. Return seconds after which delivery should run again, None if
+    queue is empty (or delivery is not configured).
+    """
+    transport = transport or get_transport()
+    if transport is None:
+        return None
+    for _ in range(DELIVERY_BATCH):
+        message, delay = claim_next(machine_id)
+        if message is None:
+            return delay
+        delay = send(message, transport)
+        if delay is not None:
+            return delay
+    return 0
+
+
+def schedule_delivery(machine_id, delay):
+    """
+    Make sure delivery to machine runs in delay seconds. Machine has at most one scheduled
+    delivery task, if one already runs earlier, no task is added. Return True if task
+    was scheduled.
+    """
+    from .tasks import deliver_machine_messages
+
+    now = timezone.now()
+    due = now + timedelta(seconds=delay)
+    scheduled = (
+        Machine.objects.filter(pk=machine_id)
+        .filter(
+            Q(delivery_due_at__isnull=True)
+            | Q(delivery_due_at__lte=now)
+            | Q(delivery_due_at__gt=due)
+        )
+        .update(delivery_due_at=due)
+    )
+    if scheduled:
+        deliver_machine_messages.apply_async((machine_id,), countdown=delay)
+    return bool(scheduled)
+
+
+def delivery_metrics(since):
+    """
+    Throughput and latency (enqueue to acknowledge) of messages enqueued since given time,
+    per message type.
+    """
+    seconds = max((timezone.now() - since).total_seconds(), 1)
+    latency = F("delivered_at") - F("created_at")
+    rows = (
+        MachineMessage.objects.filter(created_at__gte=since)
+        .values("message_type", "status")
+        .annotate(
+            count=Count("id"),
+            avg_latency=Avg(latency),
+            max_latency=Max(latency),
+            attempts=Avg("attempts"),
+        )
+        .order_by("message_type", "status")
+    )
+    metrics = {}
+    for row in rows:
+        item = metrics.setdefault(
+            row["message_type"],
+            {"pending": 0, "delivered": 0, "failed": 0, "throughput": 0.0},
+        )
+        status = MachineMessage.Status(row["status"]).name.lower()
+        item[status] = row["count"]
+        if row["status"] == MachineMessage.Status.DELIVERED:
+            item["throughput"] = row["count"] / seconds
+            item["avg_latency"] = row["avg_latency"].total_seconds()
+            item["max_latency"] = row["max_latency"].total_seconds()
+            item["avg_attempts"] = row["attempts"]
+    return metrics
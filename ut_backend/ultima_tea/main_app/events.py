@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+# Events waiting for slow subscriber, when it is full they are dropped for RESYNC
+SUBSCRIBER_QUEUE_SIZE = 100
+# Seconds before reconnecting lost Redis subscription, doubled up to RECONNECT_MAX_DELAY
+RECONNECT_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+# Delivered to all subscribers when events may have been lost, they have to reload state
+RESYNC = object()
+
+logger = logging.getLogger(__name__)
+
+
+def machine_channel(machine_id):
+    return f"machine:{machine_id}"
+
+
+class Subscription:
+    """
+    Async iterator over messages of one channel. Messages are delivered from any thread
+    into queue of event loop which created subscription.
+    """
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, message):
+        # Called in event loop thread
+        if self.queue.full():
+            # Subscriber fell behind, it reloads whole state instead of missed events
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = RESYNC
+        self.queue.put_nowait(message)
+
+    def deliver(self, message):
+        self.loop.call_soon_threadsafe(self.put, message)
+
+    async def get(self, timeout=None):
+        "Next message, None if there was none for timeout seconds"
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """
+    In-process pub/sub, events reach only subscribers connected to the same process.
+    Every subscriber (connected client) costs one queue, publishing does not touch
+    database or network.
+    """
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        "Must be called from running event loop"
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def resync(self):
+        with self.lock:
+            subscriptions = [
+                subscription
+                for channel_subscriptions in self.subscriptions.values()
+                for subscription in channel_subscriptions
+            ]
+        for subscription in subscriptions:
+            subscription.deliver(RESYNC)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Pub/sub shared by all processes through Redis (MACHINE_EVENTS_REDIS_URL). Every process
+    keeps one Redis subscription, listened in background thread, and fans messages out to
+    its local subscribers. Lost connection is reopened, subscribers then get RESYNC,
+    because events published meanwhile did not reach them.
+    """
+
+    prefix = "ultimatea:events:"
+
+    def __init__(self, url=None):
+        import redis
+
+        super().__init__()
+        self.redis = redis.Redis.from_url(url or settings.MACHINE_EVENTS_REDIS_URL)
+        self.listener = None
+
+    def subscribe(self, channel):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        return super().subscribe(channel)
+
+    def publish(self, channel, message):
+        self.redis.publish(
+            self.prefix + channel, json.dumps(message, cls=DjangoJSONEncoder)
+        )
+
+    def listen(self):
+        import redis
+
+        delay, lost = RECONNECT_DELAY, False
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + "*")
+                if lost:
+                    self.resync()
+                delay, lost = RECONNECT_DELAY, False
+                for item in pubsub.listen():
+                    channel = item["channel"].decode()[len(self.prefix) :]
+                    self.deliver(channel, json.loads(item["data"]))
+            except redis.RedisError:
+                logger.exception("Machine events subscription lost, reconnecting")
+            lost = True
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    "Broker given by MACHINE_EVENTS_BROKER setting, one per process"
+    return import_string(settings.MACHINE_EVENTS_BROKER)()
+
+
+def publish_machine_event(machine_id, event, data):
+    get_broker().publish(machine_channel(machine_id), {"event": event, "data": data})
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models import F
+
+from authorization.models import Machine
+from .models import Recipes
+from .readiness import load_recipe
+from .wire import recipe_message
+
+ADD = "add"
+REMOVE = "remove"
+
+
+def bump_favourites_version(machine_id):
+    "Increment favourites version of machine, return the new version"
+    with transaction.atomic():
+        Machine.objects.filter(pk=machine_id).update(
+            favourites_version=F("favourites_version") + 1
+        )
+        return (
+            Machine.objects.filter(pk=machine_id)
+            .values_list("favourites_version", flat=True)
+            .get()
+        )
+
+
+def favourites_delta(user, recipe):
+    """
+    Message with single favourites change of user's machine: operation and data with new
+    version and compact recipe (added) or its id (removed). Machine applies it if it holds
+    previous version, otherwise asks for full list (favourites_snapshot).
+    """
+    version = bump_favourites_version(user.machine_id)
+    if recipe.is_favourite:
+        return ADD, {"version": version, "recipe": recipe_message(load_recipe(user, recipe.id))}
+    return REMOVE, {"version": version, "id": recipe.id}
+
+
+def favourites_snapshot(user, version=None):
+    """
+    Current favourites version of user's machine with all favourite recipes (compact),
+    recipes are left out if machine already holds the version.
+    """
+    current = (
+        Machine.objects.filter(pk=user.machine_id)
+        .values_list("favourites_version", flat=True)
+        .get()
+    )
+    if version == current:
+        return {"version": current, "recipes": None}
+    recipes = (
+        Recipes.objects.filter(author=user, is_favourite=True)
+        .prefetch_related("ingredients")
+        .order_by("id")
+    )
+    return {"version": current, "recipes": [recipe_message(recipe) for recipe in recipes]}
@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from authorization.models import CustomUser
+from main_app.models import Ingredients, IngredientsRecipes, Recipes, Teas
+
+BENCHMARK_USER_EMAIL = "benchmark@ultimatea.local"
+NAME_WORDS = (
+    "green",
+    "black",
+    "white",
+    "earl",
+    "grey",
+    "mint",
+    "lemon",
+    "honey",
+    "ginger",
+    "jasmine",
+    "raspberry",
+    "morning",
+    "evening",
+    "winter",
+    "summer",
+    "spicy",
+    "sweet",
+    "classic",
+    "herbal",
+    "chai",
+)
+
+
+def seed_public_recipes(count, batch_size=5000, seed=0):
+    """
+    Create count synthetic public recipes (with 1-3 ingredients each) owned by benchmark user.
+    Return the author.
+    """
+    rng = random.Random(seed)
+    author, _ = CustomUser.objects.get_or_create(email=BENCHMARK_USER_EMAIL)
+    teas = list(Teas.objects.all()[:10]) or [
+        Teas.objects.create(tea_name=f"Benchmark tea {i}") for i in range(5)
+    ]
+    ingredients = list(Ingredients.objects.all()[:20]) or [
+        Ingredients.objects.create(ingredient_name=f"Benchmark {i}", type=1)
+        for i in range(10)
+    ]
+    for start in range(0, count, batch_size):
+        recipes = Recipes.objects.bulk_create(
+            [
+                Recipes(
+                    author=author,
+                    recipe_name=" ".join(rng.sample(NAME_WORDS, 3)) + f" {number}",
+                    descripction=" ".join(rng.sample(NAME_WORDS, 8)),
+                    is_public=True,
+                    is_favourite=rng.random() < 0.05,
+                    score=round(rng.uniform(0, 5), 2),
+                    votes=rng.randint(0, 100),
+                    brewing_temperature=rng.randint(60, 100),
+                    brewing_time=rng.randint(30, 600),
+                    mixing_time=rng.randint(0, 60),
+                    tea_type=rng.choice(teas),
+                )
+                for number in range(start, min(start + batch_size, count))
+            ]
+        )
+        IngredientsRecipes.objects.bulk_create(
+            [
+                IngredientsRecipes(recipe=recipe, ingredient=ingredient, ammount=10)
+                for recipe in recipes
+                for ingredient in rng.sample(ingredients, rng.randint(1, 3))
+            ]
+        )
+    return author
+
+
+def measure(func, repeat):
+    "Call func repeat times, return durations in miliseconds"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return f"mean {statistics.mean(timings):8.2f} ms, p50 {statistics.median(timings):8.2f} ms, p99 {p99:8.2f} ms"
+
+
+class SeededDataCommand(BaseCommand):
+    """
+    Base for commands working on seeded data. Whole command runs in one transaction,
+    which is rolled back at the end, so seeded data never stays in database (unless --keep).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep", action="store_true", help="Commit seeded data to database."
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(**options)
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def run(self, **options):
+        raise NotImplementedError
+
+
+class BenchmarkCommand(SeededDataCommand):
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def run(self, **options):
+        self.benchmark(**options)
+
+    def benchmark(self, **options):
+        raise NotImplementedError
+
+    def report(self, name, timings):
+        self.stdout.write(f"{name:<40} {summary(timings)}")
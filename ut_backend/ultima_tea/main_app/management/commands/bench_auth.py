@@ -0,0 +1,55 @@
+import statistics
+
+from asgiref.sync import async_to_sync
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from authorization.authentication import ClaimsJWTAuthentication
+from authorization.models import CustomUser, Machine
+from authorization.serializers import TokenObtainLifetimeSerializer
+from main_app.management.benchmark import BENCHMARK_USER_EMAIL, BenchmarkCommand, measure
+from main_app.views import CheckTokenView, MachineView
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measure polling endpoints with database and token claims authentication. "
+        "Benchmark runs in one process, so local memory cache counts as shared."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Requests in one run."
+        )
+
+    @override_settings(SHARED_CACHE=True)
+    def benchmark(self, repeat, requests, **options):
+        machine, _ = Machine.objects.get_or_create(machine_id="benchmark")
+        user, _ = CustomUser.objects.get_or_create(email=BENCHMARK_USER_EMAIL)
+        user.machine = machine
+        user.save()
+        token = TokenObtainLifetimeSerializer.get_token(user).access_token
+        factory = APIRequestFactory()
+        endpoints = [("check_token/", CheckTokenView), ("machine/", MachineView)]
+        for path, view_class in endpoints:
+            for authentication in (JWTAuthentication, ClaimsJWTAuthentication):
+                # Async views are called like ASGI handler calls them
+                view = async_to_sync(
+                    view_class.as_view(authentication_classes=[authentication])
+                )
+
+                def poll():
+                    for _ in range(requests):
+                        request = factory.get(
+                            f"/{path}", HTTP_AUTHORIZATION=f"Bearer {token}"
+                        )
+                        response = view(request)
+                        assert response.status_code == 200, response.data
+
+                timings = measure(poll, repeat)
+                self.report(f"{path} {authentication.__name__}", timings)
+                self.stdout.write(
+                    f"  {requests / statistics.mean(timings) * 1000:,.0f} requests/s"
+                )
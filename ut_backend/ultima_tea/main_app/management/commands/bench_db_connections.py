@@ -0,0 +1,48 @@
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from authorization.models import Machine
+from main_app.management.benchmark import measure, summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure short requests (one query between request_started and request_finished, "
+        "which open and close connections) with new connection per request and with "
+        "persistent connection. Run it against PostgreSQL, for pgbouncer and pool run it "
+        "again with DB_CONN_MODE set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests in one run."
+        )
+
+    def handle(self, repeat, requests, **options):
+        configured = connection.settings_dict["CONN_MAX_AGE"]
+        modes = [("new connection", 0), ("persistent", 60)]
+        if configured not in (0, 60):
+            modes.append((f"CONN_MAX_AGE={configured}", configured))
+        try:
+            for name, max_age in modes:
+                connection.close()
+                connection.settings_dict["CONN_MAX_AGE"] = max_age
+
+                def serve():
+                    for _ in range(requests):
+                        request_started.send(sender=self.__class__)
+                        Machine.objects.filter(machine_id="benchmark").exists()
+                        request_finished.send(sender=self.__class__)
+
+                timings = measure(serve, repeat)
+                self.stdout.write(
+                    f"{name:<30} {summary([timing / requests for timing in timings])} "
+                    f"per request, {requests / statistics.mean(timings) * 1000:,.0f} requests/s"
+                )
+        finally:
+            connection.close()
+            connection.settings_dict["CONN_MAX_AGE"] = configured
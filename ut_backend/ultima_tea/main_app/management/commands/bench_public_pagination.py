@@ -0,0 +1,49 @@
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from main_app.management.benchmark import (
+    BenchmarkCommand,
+    measure,
+    seed_public_recipes,
+)
+from main_app.models import Recipes
+from main_app.views import ListPublicRecipes
+
+
+class Command(BenchmarkCommand):
+    help = "Compare latency of page number and cursor pagination of public recipes on deep pages."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument(
+            "--pages", type=int, nargs="+", default=[1, 100, 1000, 10000]
+        )
+
+    def benchmark(self, recipes, pages, repeat, **options):
+        author = seed_public_recipes(recipes)
+        view = async_to_sync(ListPublicRecipes.as_view())
+        factory = APIRequestFactory()
+        paginator = ListPublicRecipes.RecipesKeysetPagination()
+        ordered = Recipes.objects.filter(is_public=True).order_by(*paginator.ordering)
+
+        def get(params):
+            request = factory.get("/public_recipes/", params)
+            force_authenticate(request, user=author)
+            response = view(request)
+            response.render()
+            return response
+
+        for page in pages:
+            self.stdout.write(f"Page {page}")
+            self.report("  page number", measure(lambda: get({"page": page}), repeat))
+            # Cursor pointing right after last recipe of previous page
+            position = (page - 1) * paginator.page_size - 1
+            params = {"pagination": "cursor"}
+            if position >= 0:
+                paginator.base_url = "/"
+                link = paginator.encode_cursor(False, ordered[position])
+                params["cursor"] = parse_qs(urlparse(link).query)["cursor"][0]
+            self.report("  cursor", measure(lambda: get(params), repeat))
@@ -0,0 +1,41 @@
+from main_app.management.benchmark import (
+    BenchmarkCommand,
+    measure,
+    seed_public_recipes,
+)
+from main_app.models import Recipes
+from main_app.search import search_recipes
+
+PHRASES = ("green", "mint honey", "jasmin", "winter chai 42")
+
+
+class Command(BenchmarkCommand):
+    help = "Compare old regex name filter with search mode of public recipes."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=100000)
+
+    def benchmark(self, recipes, repeat, **options):
+        seed_public_recipes(recipes)
+        public = Recipes.objects.filter(is_public=True)
+        self.stdout.write(f"Public recipes: {public.count()}")
+        for phrase in PHRASES:
+            self.stdout.write(f'Phrase "{phrase}"')
+            self.report(
+                "  regex (old name filter)",
+                self.measure_page(
+                    public.filter(recipe_name__iregex=f".*(?={phrase}).*"), repeat
+                ),
+            )
+            self.report(
+                "  name",
+                self.measure_page(public.filter(recipe_name__icontains=phrase), repeat),
+            )
+            self.report(
+                "  search", self.measure_page(search_recipes(public, phrase), repeat)
+            )
+
+    def measure_page(self, queryset, repeat):
+        # First page of public recipes, same as ListPublicRecipes returns
+        return measure(lambda: list(queryset[:6]), repeat)
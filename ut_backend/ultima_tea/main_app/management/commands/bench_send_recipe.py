@@ -0,0 +1,68 @@
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.db.models import Q
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from authorization.models import Machine
+from main_app.management.benchmark import (
+    BenchmarkCommand,
+    measure,
+    seed_public_recipes,
+)
+from main_app.models import MachineContainers, Recipes
+from main_app.readiness import check_readiness, load_machine, load_recipe
+from main_app.serializers import PrepareRecipeSerializer
+from main_app.views import SendRecipeView
+
+
+def old_readiness_check(user, recipe_id):
+    "Queries made by SendRecipeView before readiness service"
+    recipe = PrepareRecipeSerializer(Recipes.objects.get(pk=recipe_id)).data
+    machine = Machine.objects.get(pk=user.machine.machine_id)
+    for container in MachineContainers.objects.filter(
+        Q(machine=machine) & Q(container_number__lte=2)
+    ):
+        container.tea
+    for ingredient in recipe["ingredients"]:
+        for container in MachineContainers.objects.filter(
+            Q(machine=user.machine) & Q(container_number__gte=3)
+        ):
+            container.ingredient
+
+
+class Command(BenchmarkCommand):
+    help = "Measure latency of readiness check of send_recipe, before and after readiness service."
+
+    def benchmark(self, repeat, **options):
+        author = seed_public_recipes(1)
+        author.machine, _ = Machine.objects.get_or_create(
+            machine_id="benchmark",
+            defaults={"machine_status": 1, "is_mug_ready": True},
+        )
+        author.save()
+        recipe = Recipes.objects.filter(author=author).first()
+        for number in range(1, 5):
+            MachineContainers.objects.get_or_create(
+                machine=author.machine, container_number=number
+            )
+
+        def new_readiness_check():
+            check_readiness(
+                *load_machine(author.machine_id), load_recipe(author, recipe.id)
+            )
+
+        view = async_to_sync(SendRecipeView.as_view())
+        factory = APIRequestFactory()
+
+        def post():
+            request = factory.post("/send_recipe/", {"id": recipe.id}, format="json")
+            force_authenticate(request, user=author)
+            return view(request)
+
+        self.report(
+            "old check", measure(lambda: old_readiness_check(author, recipe.id), repeat)
+        )
+        self.report("readiness service", measure(new_readiness_check, repeat))
+        with patch("main_app.views.send_recipe.delay"):
+            self.report("send_recipe endpoint", measure(post, repeat))
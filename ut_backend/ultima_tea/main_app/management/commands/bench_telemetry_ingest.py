@@ -0,0 +1,70 @@
+import random
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from authorization.models import CustomUser, Machine
+from main_app.management.benchmark import BENCHMARK_USER_EMAIL, BenchmarkCommand, measure
+from main_app.models import MachineTelemetry
+from main_app.views import MAX_TELEMETRY_SAMPLES, MachineTelemetryView
+
+
+class Command(BenchmarkCommand):
+    help = "Measure telemetry ingestion of many simulated machines pushing batches of samples."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--machines", type=int, default=10000)
+        parser.add_argument(
+            "--samples", type=int, default=10, help="Samples in batch of every machine."
+        )
+
+    def benchmark(self, machines, samples, repeat, **options):
+        rng = random.Random(0)
+        admin, _ = CustomUser.objects.get_or_create(email=BENCHMARK_USER_EMAIL)
+        # Requests are force authenticated, permission check reads only this flag
+        admin.is_staff = True
+        machine_ids = [f"bench{number}" for number in range(machines)]
+        Machine.objects.bulk_create(
+            [Machine(machine_id=machine_id) for machine_id in machine_ids],
+            ignore_conflicts=True,
+        )
+        # Every request carries batches of as many machines as fits in sample limit,
+        # like gateway forwarding readings of machines connected to it
+        per_request = max(1, MAX_TELEMETRY_SAMPLES // samples)
+        view = MachineTelemetryView.as_view()
+        factory = APIRequestFactory()
+
+        def push_all():
+            now = timezone.now()
+            for offset in range(0, machines, per_request):
+                data = [
+                    {
+                        "machine_id": machine_id,
+                        "samples": [
+                            {
+                                "recorded_at": (now + timedelta(seconds=second)).isoformat(),
+                                "brewing_temperature": rng.uniform(20, 100),
+                                "air_temperature": rng.uniform(15, 30),
+                                "mug_temperature": rng.uniform(15, 90),
+                                "water_container_weight": rng.uniform(0, 2000),
+                            }
+                            for second in range(samples)
+                        ],
+                    }
+                    for machine_id in machine_ids[offset : offset + per_request]
+                ]
+                request = factory.post("/machine/telemetry/", data, format="json")
+                force_authenticate(request, user=admin)
+                response = view(request)
+                assert response.status_code == 201, response.data
+
+        timings = measure(push_all, repeat)
+        total = machines * samples
+        self.report(f"{machines} machines x {samples} samples", timings)
+        best = min(timings) / 1000
+        self.stdout.write(
+            f"Throughput {total / best:,.0f} samples/s, "
+            f"{MachineTelemetry.objects.count()} rows stored"
+        )
@@ -0,0 +1,71 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from authorization.models import Machine
+from main_app.container_sync import containers_payload
+from main_app.management.benchmark import BenchmarkCommand, measure, seed_public_recipes
+from main_app.models import MachineContainers, Recipes
+from main_app.readiness import load_machine, load_recipe
+from main_app.serializers import PrepareRecipeSerializer
+from main_app.wire import (
+    JSON,
+    MSGPACK,
+    containers_message,
+    dumps,
+    loads,
+    msgpack,
+    recipe_message,
+)
+
+
+class Command(BenchmarkCommand):
+    help = "Compare size and encode/decode time of machine messages, serializer output vs compact format."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--messages", type=int, default=1000, help="Messages encoded in one run."
+        )
+
+    def benchmark(self, repeat, messages, **options):
+        author = seed_public_recipes(1)
+        recipe = load_recipe(author, Recipes.objects.filter(author=author).first().id)
+        machine, _ = Machine.objects.get_or_create(machine_id="benchmark")
+        for number in range(1, 5):
+            MachineContainers.objects.get_or_create(machine=machine, container_number=number)
+        _, containers = load_machine(machine.pk)
+
+        payloads = {
+            "send_recipe": (
+                PrepareRecipeSerializer(recipe, context={"tea_portion": ""}).data,
+                recipe_message(recipe),
+            ),
+            "update_all_containers": (
+                containers_payload(containers),
+                containers_message(containers),
+            ),
+        }
+        codecs = [
+            ("json", lambda data: json.dumps(data, cls=DjangoJSONEncoder).encode(), json.loads),
+            ("compact json", lambda data: dumps(data, JSON), loads),
+        ]
+        if msgpack is not None:
+            codecs.append(("compact msgpack", lambda data: dumps(data, MSGPACK), loads))
+        else:
+            self.stdout.write("msgpack is not installed, skipping it")
+
+        for task, (full, compact) in payloads.items():
+            self.stdout.write(task)
+            for name, encode, decode in codecs:
+                data = full if name == "json" else compact
+                encoded = encode(data)
+                self.stdout.write(f"  {name:<20} {len(encoded):6} bytes")
+                self.report(
+                    f"  encode x{messages}",
+                    measure(lambda: [encode(data) for _ in range(messages)], repeat),
+                )
+                self.report(
+                    f"  decode x{messages}",
+                    measure(lambda: [decode(encoded) for _ in range(messages)], repeat),
+                )
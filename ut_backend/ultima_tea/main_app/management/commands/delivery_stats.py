@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main_app.delivery import delivery_metrics
+
+
+class Command(BaseCommand):
+    help = "Throughput and latency of messages delivered to machines, per message type."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--minutes", type=int, default=60, help="Messages enqueued in last minutes."
+        )
+
+    def handle(self, minutes, **options):
+        metrics = delivery_metrics(timezone.now() - timedelta(minutes=minutes))
+        if not metrics:
+            self.stdout.write("No messages.")
+        for message_type, item in metrics.items():
+            line = (
+                f"{message_type}: delivered {item['delivered']}, "
+                f"pending {item['pending']}, failed {item['failed']}, "
+                f"{item['throughput']:.2f} msg/s"
+            )
+            if item["delivered"]:
+                line += (
+                    f", latency avg {item['avg_latency'] * 1000:.1f} ms"
+                    f" max {item['max_latency'] * 1000:.1f} ms"
+                    f", {item['avg_attempts']:.2f} attempts"
+                )
+            self.stdout.write(line)
@@ -0,0 +1,85 @@
+from django.core.management.base import CommandError
+from django.db import connection
+
+from main_app.management.benchmark import SeededDataCommand, seed_public_recipes
+from main_app.models import Ingredients, Recipes, Teas
+from main_app.views import filter_recipes
+
+# Every filter supported by public_recipes/ alone, then typical combinations
+FILTERS = (
+    {},
+    {"tea_type": "{tea}"},
+    {"brewing_temperature_down": "97"},
+    {"brewing_temperature_up": "62"},
+    {"brewing_time_down": "580"},
+    {"brewing_time_up": "40"},
+    {"mixing_time_down": "58"},
+    {"mixing_time_up": "2"},
+    {"min_score": "4.9"},
+    {"name": "raspberry"},
+    {"search": "raspberry"},
+    {"ingredients": "{ingredients}"},
+    {"ingredients": "{ingredients}", "ingredients_match": "any"},
+    {"brewing_temperature_down": "95", "brewing_temperature_up": "97"},
+    {"brewing_time_down": "30", "brewing_time_up": "40", "min_score": "4"},
+    {"tea_type": "{tea}", "mixing_time_up": "2"},
+)
+
+
+class Command(SeededDataCommand):
+    help = (
+        "Run EXPLAIN (ANALYZE on PostgreSQL) for every public recipes filter on "
+        "seeded data and report filters falling back to sequential scan of recipes."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument(
+            "--verbose-plans", action="store_true", help="Print full query plans."
+        )
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Fail when any filter uses sequential scan.",
+        )
+
+    def run(self, recipes, verbose_plans, strict, **options):
+        seed_public_recipes(recipes)
+        with connection.cursor() as cursor:
+            # Fresh statistics, otherwise planner does not know about seeded rows
+            cursor.execute("ANALYZE recipes")
+        tea = Teas.objects.order_by("pk").first().pk
+        ingredients = ",".join(
+            str(pk) for pk in Ingredients.objects.values_list("pk", flat=True)[:2]
+        )
+        postgresql = connection.vendor == "postgresql"
+
+        seq_scans = []
+        for params in FILTERS:
+            params = {
+                key: value.format(tea=tea, ingredients=ingredients)
+                for key, value in params.items()
+            }
+            queryset = filter_recipes(params, Recipes.objects.filter(is_public=True))
+            # First page, same as ListPublicRecipes
+            queryset = queryset[:6]
+            plan = queryset.explain(analyze=True) if postgresql else queryset.explain()
+            seq_scan = self.is_seq_scan(plan, postgresql)
+            if seq_scan:
+                seq_scans.append(params)
+            self.stdout.write(
+                f"{'SEQ SCAN' if seq_scan else 'OK':<10} {params or 'no filters'}"
+            )
+            if verbose_plans:
+                self.stdout.write(plan)
+
+        if seq_scans and strict:
+            raise CommandError(f"{len(seq_scans)} filters use sequential scan.")
+
+    def is_seq_scan(self, plan, postgresql):
+        if postgresql:
+            return "Seq Scan on recipes" in plan
+        # SQLite reports every scan of whole table or whole index as "SCAN recipes ...",
+        # only "SEARCH recipes USING ..." reads part of an index
+        return "SCAN recipes" in plan or "SEARCH recipes USING" not in plan
@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.management.benchmark import summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of running server: concurrent clients polling endpoints. Run it against "
+        "sync workers (gunicorn ultima_tea.wsgi:application) and uvicorn workers "
+        "(gunicorn ultima_tea.asgi:application -k uvicorn.workers.UvicornWorker) "
+        "with the same --workers to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Paths like /check_token/.")
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument("--email", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--clients", type=int, default=50)
+        parser.add_argument(
+            "--requests", dest="count", type=int, default=2000, help="Requests per path."
+        )
+
+    def handle(self, paths, url, email, password, clients, count, **options):
+        url = url.rstrip("/")
+        response = self.session().post(
+            f"{url}/token/", {"email": email, "password": password}
+        )
+        if response.status_code != 200:
+            raise CommandError(f"Can not obtain token: {response.text}")
+        headers = {"Authorization": f"Bearer {response.json()['access']}"}
+        sessions = threading.local()
+
+        def call(path):
+            if not hasattr(sessions, "session"):
+                sessions.session = self.session()
+            start = time.perf_counter()
+            response = sessions.session.get(url + path, headers=headers)
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+        for path in paths:
+            with ThreadPoolExecutor(clients) as executor:
+                start = time.perf_counter()
+                results = list(executor.map(call, [path] * count))
+                duration = time.perf_counter() - start
+            errors = sum(1 for _, status in results if status >= 400)
+            self.stdout.write(
+                f"{path:<30} {count / duration:8,.0f} requests/s, "
+                f"{summary([timing for timing, _ in results])}, {errors} errors"
+            )
+
+    def session(self):
+        return requests.Session()
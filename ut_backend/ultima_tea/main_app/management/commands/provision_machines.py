@@ -0,0 +1,56 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authorization.models import Machine
+from main_app.provisioning import PROVISION_CHUNK_SIZE, provision_machines
+
+MACHINE_ID_LENGTH = Machine._meta.get_field("machine_id").max_length
+
+
+class Command(BaseCommand):
+    help = (
+        "Create machines with empty containers from ids given as arguments or in CSV file "
+        "(first column). Already existing machines are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("machine_ids", nargs="*")
+        parser.add_argument(
+            "--csv", dest="csv_path", help="CSV file with machine id in first column."
+        )
+        parser.add_argument(
+            "--header", action="store_true", help="Skip first line of CSV file."
+        )
+        parser.add_argument("--chunk-size", type=int, default=PROVISION_CHUNK_SIZE)
+
+    def handle(self, machine_ids, csv_path, header, chunk_size, **options):
+        machine_ids = list(machine_ids)
+        if csv_path:
+            machine_ids += self.read_csv(csv_path, header)
+        machine_ids = [machine_id.strip() for machine_id in machine_ids]
+        wrong = [
+            machine_id
+            for machine_id in machine_ids
+            if not machine_id or len(machine_id) > MACHINE_ID_LENGTH
+        ]
+        if wrong:
+            raise CommandError(
+                f"Machine ids must have 1-{MACHINE_ID_LENGTH} characters: {wrong[:10]}"
+            )
+        if not machine_ids:
+            raise CommandError("No machine ids given.")
+
+        start = time.perf_counter()
+        result = provision_machines(machine_ids, chunk_size)
+        duration = time.perf_counter() - start
+        self.stdout.write(
+            f"Created {result['created']}, skipped {result['skipped']} existing machines "
+            f"in {duration:.2f} s ({len(machine_ids) / duration:,.0f} machines/s)"
+        )
+
+    def read_csv(self, path, header):
+        with open(path, newline="") as file:
+            rows = [row for row in csv.reader(file) if row]
+        return [row[0] for row in rows[1 if header else 0 :]]
@@ -0,0 +1,48 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models.functions import Cast, Upper
+
+# Expressions must match main_app.search.SEARCH_VECTOR and RECIPE_NAME_TRIGRAM
+SEARCH_INDEXES = [
+    GinIndex(
+        SearchVector("recipe_name", weight="A", config="simple")
+        + SearchVector("descripction", weight="B", config="simple"),
+        name="recipes_public_search_gin",
+        condition=models.Q(is_public=True),
+    ),
+    GinIndex(
+        OpClass(Upper(Cast("recipe_name", models.TextField())), name="gin_trgm_ops"),
+        name="recipes_public_name_trgm",
+        condition=models.Q(is_public=True),
+    ),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # GIN indexes and pg_trgm exist only in PostgreSQL, other databases use fallback search
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    recipes = apps.get_model("main_app", "Recipes")
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(recipes, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    recipes = apps.get_model("main_app", "Recipes")
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(recipes, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0002_recipes_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["-is_favourite", "recipe_name", "id"],
+                name="recipes_pub_order_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["tea_type"],
+                name="recipes_pub_tea_type_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["brewing_temperature"],
+                name="recipes_pub_brew_temp_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["brewing_time"],
+                name="recipes_pub_brew_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["mixing_time"],
+                name="recipes_pub_mix_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["-score"],
+                name="recipes_pub_score_idx",
+            ),
+        ),
+    ]
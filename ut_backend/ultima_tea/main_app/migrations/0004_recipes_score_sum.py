@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:17
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast
+
+
+def fill_score_sum(apps, schema_editor):
+    # Recalculate votes and score of voted recipes from VotedRecipes
+    Recipes = apps.get_model("main_app", "Recipes")
+    VotedRecipes = apps.get_model("main_app", "VotedRecipes")
+    votes = VotedRecipes.objects.filter(recipe=OuterRef("pk")).values("recipe")
+    score_sum = Subquery(votes.annotate(total=Sum("score")).values("total"))
+    count = Subquery(votes.annotate(total=Count("pk")).values("total"))
+    Recipes.objects.filter(pk__in=VotedRecipes.objects.values("recipe")).update(
+        score_sum=score_sum,
+        votes=count,
+        score=Cast(score_sum, FloatField()) / count,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0003_recipes_public_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipes",
+            name="score_sum",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_score_sum, migrations.RunPython.noop),
+    ]
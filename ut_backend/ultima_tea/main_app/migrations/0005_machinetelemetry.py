@@ -0,0 +1,65 @@
+from django.contrib.postgres.indexes import BrinIndex
+from django.db import migrations, models
+import django.db.models.deletion
+
+TELEMETRY_BRIN_INDEX = BrinIndex(
+    fields=["recorded_at"], name="telemetry_recorded_at_brin", autosummarize=True
+)
+
+
+def create_brin_index(apps, schema_editor):
+    # Rows are appended in time order, BRIN index of few pages covers whole table
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.add_index(
+        apps.get_model("main_app", "MachineTelemetry"), TELEMETRY_BRIN_INDEX
+    )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.remove_index(
+        apps.get_model("main_app", "MachineTelemetry"), TELEMETRY_BRIN_INDEX
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authorization", "0001_initial"),
+        ("main_app", "0004_recipes_score_sum"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MachineTelemetry",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("recorded_at", models.DateTimeField()),
+                ("brewing_temperature", models.FloatField(null=True)),
+                ("air_temperature", models.FloatField(null=True)),
+                ("mug_temperature", models.FloatField(null=True)),
+                ("water_container_weight", models.FloatField(null=True)),
+                (
+                    "machine",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="telemetry",
+                        to="authorization.machine",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "machine_telemetry",
+                "indexes": [
+                    models.Index(
+                        fields=["machine", "recorded_at"],
+                        name="telemetry_machine_time_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0001_initial'),
+        ('main_app', '0005_machinetelemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryRollupState',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'telemetry_rollup_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='MachineTelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField(choices=[(60, 'Minute'), (3600, 'Hour')])),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.IntegerField(default=0)),
+                ('brewing_temperature_min', models.FloatField(null=True)),
+                ('brewing_temperature_max', models.FloatField(null=True)),
+                ('brewing_temperature_sum', models.FloatField(default=0)),
+                ('brewing_temperature_count', models.IntegerField(default=0)),
+                ('air_temperature_min', models.FloatField(null=True)),
+                ('air_temperature_max', models.FloatField(null=True)),
+                ('air_temperature_sum', models.FloatField(default=0)),
+                ('air_temperature_count', models.IntegerField(default=0)),
+                ('mug_temperature_min', models.FloatField(null=True)),
+                ('mug_temperature_max', models.FloatField(null=True)),
+                ('mug_temperature_sum', models.FloatField(default=0)),
+                ('mug_temperature_count', models.IntegerField(default=0)),
+                ('water_container_weight_min', models.FloatField(null=True)),
+                ('water_container_weight_max', models.FloatField(null=True)),
+                ('water_container_weight_sum', models.FloatField(default=0)),
+                ('water_container_weight_count', models.IntegerField(default=0)),
+                ('machine', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_rollups', to='authorization.machine')),
+            ],
+            options={
+                'db_table': 'machine_telemetry_rollup',
+                'constraints': [models.UniqueConstraint(fields=('machine', 'resolution', 'bucket'), name='telemetry_rollup_bucket_uniq')],
+            },
+        ),
+    ]
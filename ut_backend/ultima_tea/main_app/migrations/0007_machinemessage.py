@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0001_initial'),
+        ('main_app', '0006_machinetelemetryrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('message_type', models.CharField(max_length=32)),
+                ('payload', models.JSONField()),
+                ('status', models.IntegerField(choices=[(0, 'Pending'), (1, 'Delivered'), (2, 'Failed')], default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(auto_now_add=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('machine', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='authorization.machine')),
+            ],
+            options={
+                'db_table': 'machine_message',
+                'indexes': [models.Index(condition=models.Q(('status', 0)), fields=['machine', 'id'], name='machine_message_pending_idx'), models.Index(fields=['created_at'], name='machine_message_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0007_machinemessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machinecontainers',
+            name='sync_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0008_machinecontainers_sync_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machinemessage',
+            name='leased_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
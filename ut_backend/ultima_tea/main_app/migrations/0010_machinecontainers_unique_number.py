@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_containers(apps, schema_editor):
+    "Keep the oldest container of every (machine, container_number)"
+    MachineContainers = apps.get_model("main_app", "MachineContainers")
+    seen = set()
+    duplicates = []
+    for pk, machine_id, number in MachineContainers.objects.order_by("pk").values_list(
+        "pk", "machine_id", "container_number"
+    ):
+        if (machine_id, number) in seen:
+            duplicates.append(pk)
+        seen.add((machine_id, number))
+    MachineContainers.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_machinemessage_leased_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_containers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='machinecontainers',
+            constraint=models.UniqueConstraint(
+                fields=('machine', 'container_number'),
+                name='machine_container_number_uniq',
+            ),
+        ),
+    ]
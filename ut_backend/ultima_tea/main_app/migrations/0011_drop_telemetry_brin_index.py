@@ -0,0 +1,18 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# No query filters on recorded_at alone, reads and rollups use the (machine, recorded_at)
+# index or id ranges, so BRIN index only slowed down inserts
+initial = import_module("main_app.migrations.0005_machinetelemetry")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0010_machinecontainers_unique_number"),
+    ]
+
+    operations = [
+        migrations.RunPython(initial.drop_brin_index, initial.create_brin_index),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models, router
 from authorization.models import CustomUser, Machine
 
 # Create your models here.
@@ -35,12 +35,75 @@ class Teas(models.Model):
         return self.tea_name
 
 
+class RecipesQuerySet(models.QuerySet):
+    def for_read(self):
+        """
+        Load everything needed to serialize recipes: tea type, author and ingredients
+        with their Ingredients rows, in constant number of queries.
+        """
+        return self.select_related("tea_type", "author").prefetch_related(
+            models.Prefetch(
+                "ingredients",
+                queryset=IngredientsRecipes.objects.select_related("ingredient"),
+            )
+        )
+
+    def with_user_vote(self, user):
+        """
+        Annotate every recipe with score given to it by user (None if user did not vote),
+        so voting state of whole page is fetched with main query.
+        """
+        return self.annotate(
+            user_voted_score=models.Subquery(
+                VotedRecipes.objects.filter(
+                    recipe=models.OuterRef("pk"), user=user
+                ).values("score")[:1]
+            )
+        )
+
+    def add_vote(self, pk, score):
+        """
+        Add new vote to score of recipe in single UPDATE, so concurrent votes are not lost.
+        Return new score, None if there is no such recipe.
+        """
+        return self._update_score(
+            pk,
+            "votes = votes + 1, score_sum = score_sum + %s,"
+            " score = (score_sum + %s) * 1.0 / (votes + 1)",
+            [score, score],
+        )
+
+    def change_vote(self, pk, previous_score, score):
+        "Replace previous score of existing vote in single UPDATE, return new score"
+        delta = score - previous_score
+        return self._update_score(
+            pk,
+            "score_sum = score_sum + %s, score = (score_sum + %s) * 1.0 / votes",
+            [delta, delta],
+        )
+
+    def _update_score(self, pk, assignments, params):
+        # Right side of assignments sees row before update. QuerySet.update can not return
+        # new values, so score is returned with RETURNING instead of another SELECT.
+        connection = connections[router.db_for_write(self.model)]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET {assignments} WHERE id = %s RETURNING score",
+                [*params, pk],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
 class Recipes(models.Model):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     last_modification = models.DateTimeField(auto_now_add=True)
     descripction = models.TextField(max_length=256, default="Brak")
     recipe_name = models.CharField(max_length=64)
     score = models.FloatField(default=0)
+    # Sum of all votes, score is always recalculated from it
+    score_sum = models.IntegerField(default=0)
     votes = models.IntegerField(default=0)
     is_public = models.BooleanField(default=False)
     brewing_temperature = models.FloatField(default=80)
@@ -51,13 +114,48 @@ class Recipes(models.Model):
     tea_herbs_ammount = models.FloatField(default=15)
     tea_portion = models.FloatField(default=200)
 
+    objects = RecipesQuerySet.as_manager()
+
     class Meta:
         db_table = "recipes"
         ordering = (
             "-is_favourite",
             "recipe_name",
         )
-        indexes = [models.Index(fields=["author"])]
+        indexes = [
+            models.Index(fields=["author"]),
+            # Partial indexes for filters and default ordering of public recipes
+            models.Index(
+                fields=["-is_favourite", "recipe_name", "id"],
+                name="recipes_pub_order_idx",
+                condition=models.Q(is_public=True),
+            ),
+            models.Index(
+                fields=["tea_type"],
+                name="recipes_pub_tea_type_idx",
+                condition=models.Q(is_public=True),
+            ),
+            models.Index(
+                fields=["brewing_temperature"],
+                name="recipes_pub_brew_temp_idx",
+                condition=models.Q(is_public=True),
+            ),
+            models.Index(
+                fields=["brewing_time"],
+                name="recipes_pub_brew_time_idx",
+                condition=models.Q(is_public=True),
+            ),
+            models.Index(
+                fields=["mixing_time"],
+                name="recipes_pub_mix_time_idx",
+                condition=models.Q(is_public=True),
+            ),
+            models.Index(
+                fields=["-score"],
+                name="recipes_pub_score_idx",
+                condition=models.Q(is_public=True),
+            ),
+        ]
 
     def __str__(self):
         return self.recipe_name
@@ -80,6 +178,33 @@ class IngredientsRecipes(models.Model):
         return self.recipe.recipe_name
 
 
+class MachineContainersQuerySet(models.QuerySet):
+    "Bulk writes do not send post_save, they push containers to machine streams themselves"
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .streams import publish_after_commit
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if kwargs.get("ignore_conflicts"):
+            # Skipped rows are returned too, publish what is stored in the database
+            publish_after_commit(
+                containers=self.filter(
+                    machine_id__in={obj.machine_id for obj in objs}
+                ).order_by("machine_id", "container_number")
+            )
+        else:
+            publish_after_commit(containers=objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .streams import publish_after_commit
+
+        objs = list(objs)
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        publish_after_commit(containers=objs)
+        return updated
+
+
 class MachineContainers(models.Model):
 
     CONTAINER_NAME_CHOICES = (
@@ -98,10 +223,20 @@ class MachineContainers(models.Model):
     tea = models.ForeignKey(Teas, on_delete=models.CASCADE, null=True, default=None)
     ammount = models.FloatField(default=0, null=True)
     container_number = models.IntegerField(default=0, choices=CONTAINER_NAME_CHOICES)
+    # Edited, not yet sent to machine (main_app/container_sync.py)
+    sync_pending = models.BooleanField(default=False)
+
+    objects = MachineContainersQuerySet.as_manager()
 
     class Meta:
         db_table = "machine_container"
         indexes = [models.Index(fields=["machine"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["machine", "container_number"],
+                name="machine_container_number_uniq",
+            )
+        ]
 
     def __str__(self):
         return self.machine.machine_id
@@ -116,3 +251,147 @@ class VotedRecipes(models.Model):
         db_table = "voted_recipes"
         unique_together = ("user", "recipe")
         indexes = [models.Index(fields=["user", "recipe"])]
+
+
+class MachineTelemetry(models.Model):
+    """
+    Append-only history of machine sensor readings, Machine keeps only latest values.
+    Time ranges are read per machine through (machine, recorded_at) index, rollups
+    select new rows by id.
+    """
+
+    # Sensor fields shared with Machine snapshot
+    SENSOR_FIELDS = (
+        "brewing_temperature",
+        "air_temperature",
+        "mug_temperature",
+        "water_container_weight",
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # Indexed together with recorded_at below
+    machine = models.ForeignKey(
+        Machine, on_delete=models.CASCADE, related_name="telemetry", db_index=False
+    )
+    recorded_at = models.DateTimeField()
+    brewing_temperature = models.FloatField(null=True)
+    air_temperature = models.FloatField(null=True)
+    mug_temperature = models.FloatField(null=True)
+    water_container_weight = models.FloatField(null=True)
+
+    class Meta:
+        db_table = "machine_telemetry"
+        indexes = [
+            models.Index(
+                fields=["machine", "recorded_at"], name="telemetry_machine_time_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id} {self.recorded_at}"
+
+
+class MachineTelemetryRollup(models.Model):
+    """
+    Min/max/sum/count of every sensor field of MachineTelemetry in minute and hour buckets.
+    Sum and count (of non empty values) are kept instead of average, so buckets can be merged.
+    Built incrementally by rollup_telemetry task (main_app/telemetry.py).
+    """
+
+    class Resolution(models.IntegerChoices):
+        MINUTE = 60
+        HOUR = 3600
+
+    # Indexed by unique constraint below
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name="telemetry_rollups",
+        db_index=False,
+    )
+    resolution = models.IntegerField(choices=Resolution.choices)
+    bucket = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+    brewing_temperature_min = models.FloatField(null=True)
+    brewing_temperature_max = models.FloatField(null=True)
+    brewing_temperature_sum = models.FloatField(default=0)
+    brewing_temperature_count = models.IntegerField(default=0)
+    air_temperature_min = models.FloatField(null=True)
+    air_temperature_max = models.FloatField(null=True)
+    air_temperature_sum = models.FloatField(default=0)
+    air_temperature_count = models.IntegerField(default=0)
+    mug_temperature_min = models.FloatField(null=True)
+    mug_temperature_max = models.FloatField(null=True)
+    mug_temperature_sum = models.FloatField(default=0)
+    mug_temperature_count = models.IntegerField(default=0)
+    water_container_weight_min = models.FloatField(null=True)
+    water_container_weight_max = models.FloatField(null=True)
+    water_container_weight_sum = models.FloatField(default=0)
+    water_container_weight_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "machine_telemetry_rollup"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["machine", "resolution", "bucket"],
+                name="telemetry_rollup_bucket_uniq",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id} {self.resolution} {self.bucket}"
+
+
+class TelemetryRollupState(models.Model):
+    "Id of last MachineTelemetry row included in rollups"
+
+    name = models.CharField(primary_key=True, max_length=32)
+    last_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "telemetry_rollup_state"
+
+    def __str__(self):
+        return f"{self.name} {self.last_id}"
+
+
+class MachineMessage(models.Model):
+    """
+    Outbox of messages for machines (main_app/delivery.py). Messages of every machine are
+    delivered one by one in id order, key makes repeated delivery harmless on device.
+    """
+
+    class Status(models.IntegerChoices):
+        PENDING = 0
+        DELIVERED = 1
+        FAILED = 2
+
+    machine = models.ForeignKey(
+        Machine, on_delete=models.CASCADE, related_name="messages", db_index=False
+    )
+    key = models.CharField(max_length=64, unique=True)
+    message_type = models.CharField(max_length=32)
+    payload = models.JSONField()
+    status = models.IntegerField(choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default="")
+    # Worker sending the message owns queue of machine until then
+    leased_until = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "machine_message"
+        indexes = [
+            # Pending messages of machine in delivery order
+            models.Index(
+                fields=["machine", "id"],
+                name="machine_message_pending_idx",
+                condition=models.Q(status=0),
+            ),
+            models.Index(fields=["created_at"], name="machine_message_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id} {self.message_type} {self.key}"
@@ -0,0 +1,66 @@
+from django.db import transaction
+
+from authorization.models import Machine
+from .models import MachineContainers
+
+# Machines provisioned in one transaction
+PROVISION_CHUNK_SIZE = 1000
+CONTAINER_NUMBERS = [number for number, _ in MachineContainers.CONTAINER_NAME_CHOICES]
+
+
+def create_containers(machine_ids, existing=()):
+    """
+    Empty containers of machines, except (machine_id, container_number) in existing.
+    Containers inserted meanwhile by concurrent provisioning are skipped.
+    """
+    existing = set(existing)
+    return MachineContainers.objects.bulk_create(
+        [
+            MachineContainers(machine_id=machine_id, container_number=number)
+            for machine_id in machine_ids
+            for number in CONTAINER_NUMBERS
+            if (machine_id, number) not in existing
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def provision_chunk(machine_ids):
+    """
+    Create machines with their containers in one transaction. Existing machines are skipped,
+    their missing containers are created, so provisioning same ids again is harmless.
+    Return number of created machines.
+    """
+    with transaction.atomic():
+        existing = set(
+            Machine.objects.filter(pk__in=machine_ids).values_list("pk", flat=True)
+        )
+        # Rows skipped on conflict are still returned, created machines are counted below
+        Machine.objects.bulk_create(
+            [
+                Machine(machine_id=machine_id)
+                for machine_id in machine_ids
+                if machine_id not in existing
+            ],
+            ignore_conflicts=True,
+        )
+        create_containers(
+            machine_ids,
+            MachineContainers.objects.filter(machine_id__in=existing).values_list(
+                "machine_id", "container_number"
+            ),
+        )
+        created = Machine.objects.filter(pk__in=machine_ids).count() - len(existing)
+    return created
+
+
+def provision_machines(machine_ids, chunk_size=PROVISION_CHUNK_SIZE):
+    """
+    Provision machines in atomic chunks. Duplicated ids are provisioned once.
+    Return numbers of created and skipped (already existing) machines.
+    """
+    machine_ids = list(dict.fromkeys(machine_ids))
+    created = 0
+    for start in range(0, len(machine_ids), chunk_size):
+        created += provision_chunk(machine_ids[start : start + chunk_size])
+    return {"created": created, "skipped": len(machine_ids) - created}
@@ -0,0 +1,136 @@
+from django.db.models import Q
+
+from authorization.models import Machine
+from .models import IngredientsRecipes, MachineContainers, Recipes
+
+# Water needed on top of tea portion
+WATER_RESERVE = 60
+
+
+def load_machine(machine_id):
+    """
+    Load machine with all its containers (with their teas and ingredients) in one query.
+    Return machine and list of its containers.
+    """
+    containers = list(
+        MachineContainers.objects.filter(machine_id=machine_id)
+        .select_related("machine", "tea", "ingredient")
+        .order_by("container_number")
+    )
+    if containers:
+        return containers[0].machine, containers
+    # Machine without containers
+    return Machine.objects.get(pk=machine_id), containers
+
+
+def load_recipe(user, recipe_id):
+    """
+    Load recipe (own or public) with its tea type and ingredients in one query.
+    Ingredient rows are stored as prefetched, so serializing recipe does not query them again.
+    Raise Recipes.DoesNotExist if user can not send the recipe.
+    """
+    rows = list(
+        IngredientsRecipes.objects.filter(
+            Q(recipe__author=user) | Q(recipe__is_public=True), recipe_id=recipe_id
+        )
+        .select_related("recipe__tea_type", "ingredient")
+        .order_by("id")
+    )
+    if rows:
+        recipe = rows[0].recipe
+        for row in rows:
+            row.recipe = recipe
+    else:
+        # Recipe without ingredients
+        recipe = Recipes.objects.select_related("tea_type").get(
+            Q(author=user) | Q(is_public=True), pk=recipe_id
+        )
+    recipe._prefetched_objects_cache = {"ingredients": rows}
+    return recipe
+
+
+def shortfall(code, detail, **data):
+    return {"code": code, "detail": detail, **data}
+
+
+def check_readiness(machine, containers, recipe, tea_portion=None):
+    """
+    Check if machine can prepare recipe. Return list of shortfalls, empty if machine is ready.
+    Every shortfall is dict with code, readable detail and related ids and ammounts.
+    """
+    shortfalls = []
+    if machine.machine_status == Machine.MachineStates.OFF:
+        shortfalls.append(shortfall("not_connected", "Machine is not connected."))
+    if not machine.is_mug_ready:
+        shortfalls.append(shortfall("mug_not_ready", "Mug is not ready."))
+
+    # Containers 1-2 hold teas, 3-4 ingredients
+    teas = {
+        container.tea_id: container
+        for container in containers
+        if container.container_number <= 2 and container.tea_id is not None
+    }
+    ingredients = {
+        container.ingredient_id: container
+        for container in containers
+        if container.container_number >= 3 and container.ingredient_id is not None
+    }
+
+    tea_container = teas.get(recipe.tea_type_id)
+    if tea_container is None:
+        shortfalls.append(
+            shortfall(
+                "tea_not_available",
+                "Given tea type is not available in your tea containers.",
+                tea=recipe.tea_type_id,
+                required=recipe.tea_herbs_ammount,
+            )
+        )
+    elif (tea_container.ammount or 0) < recipe.tea_herbs_ammount:
+        shortfalls.append(
+            shortfall(
+                "not_enough_tea",
+                "Not enough tea herbs in container.",
+                tea=recipe.tea_type_id,
+                container_number=tea_container.container_number,
+                required=recipe.tea_herbs_ammount,
+                available=tea_container.ammount,
+            )
+        )
+
+    for row in recipe.ingredients.all():
+        container = ingredients.get(row.ingredient_id)
+        if container is None:
+            shortfalls.append(
+                shortfall(
+                    "ingredient_not_available",
+                    f"Ingredient {row.ingredient.ingredient_name}, of required ammount: {row.ammount}, is not avaible in your machine.",
+                    ingredient=row.ingredient_id,
+                    required=row.ammount,
+                )
+            )
+        elif (container.ammount or 0) < row.ammount:
+            shortfalls.append(
+                shortfall(
+                    "not_enough_ingredient",
+                    "Not enough ingredient in container.",
+                    ingredient=row.ingredient_id,
+                    container_number=container.container_number,
+                    required=row.ammount,
+                    available=container.ammount,
+                )
+            )
+
+    if tea_portion is None:
+        tea_portion = recipe.tea_portion
+    required_water = tea_portion + WATER_RESERVE
+    if (machine.water_container_weight or 0) < required_water:
+        shortfalls.append(
+            shortfall(
+                "not_enough_water",
+                "Not enough water.",
+                required=required_water,
+                available=machine.water_container_weight,
+            )
+        )
+    return shortfalls
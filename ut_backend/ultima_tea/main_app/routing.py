@@ -0,0 +1,121 @@
+"""
+Reads from replicas (DATABASE_REPLICAS). Only reads of view handlers decorated with
+reads_from_replica go to replica, all other queries (writes, locks, transactions) use
+default database. User who changed something reads from default database for
+REPLICA_STICKY_SECONDS (see replica_stickiness_middleware), so replication lag never
+hides user's own writes. Writers are remembered in cache, replicas are used only
+with cache shared by all workers (SHARED_CACHE). Handlers reading from replica must not read inside transaction.
+"""
+import contextvars
+import functools
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework import permissions
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+
+
+def sticky_key(user_id):
+    return f"db:sticky:{user_id}"
+
+
+def reads_own_writes(user):
+    "User wrote recently, replicas may not have the write yet"
+    return bool(
+        user is not None
+        and user.is_authenticated
+        and cache.get(sticky_key(user.pk)) is not None
+    )
+
+
+@contextmanager
+def replica_reads(user=None):
+    "Reads inside go to replica, unless user has to read own writes"
+    enabled = (
+        bool(settings.DATABASE_REPLICAS)
+        and settings.SHARED_CACHE
+        and not reads_own_writes(user)
+    )
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reads_from_replica(handler):
+    "Decorator of sync view handler, its reads go to replica"
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        with replica_reads(request.user):
+            return handler(self, request, *args, **kwargs)
+
+    return wrapper
+
+
+def choose_replica():
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return choose_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as default database
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def written(request, response):
+    return (
+        settings.DATABASE_REPLICAS
+        and settings.SHARED_CACHE
+        and request.method not in permissions.SAFE_METHODS
+        and response.status_code < 400
+        and getattr(request, "user", None) is not None
+        and request.user.is_authenticated
+    )
+
+
+@sync_and_async_middleware
+def replica_stickiness_middleware(get_response):
+    """
+    Remember users whose requests changed data. User is set on request by DRF
+    authentication, so it is known after the view ran.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            response = await get_response(request)
+            if written(request, response):
+                await cache.aset(
+                    sticky_key(request.user.pk), True, settings.REPLICA_STICKY_SECONDS
+                )
+            return response
+
+        return markcoroutinefunction(middleware)
+
+    def middleware(request):
+        response = get_response(request)
+        if written(request, response):
+            cache.set(sticky_key(request.user.pk), True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    return middleware
+
@@ -0,0 +1,63 @@
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, TextField, Value, When
+from django.db.models.functions import Cast, Upper
+
+# Both expressions are indexed (see migration 0002_recipes_search_indexes), they have
+# to stay identical with the ones used there, otherwise PostgreSQL will not use indexes.
+SEARCH_CONFIG = "simple"
+SEARCH_VECTOR = SearchVector(
+    "recipe_name", weight="A", config=SEARCH_CONFIG
+) + SearchVector("descripction", weight="B", config=SEARCH_CONFIG)
+RECIPE_NAME_TRIGRAM = Upper(Cast("recipe_name", TextField()))
+
+
+def search_recipes(queryset, phrase):
+    """
+    Search recipes by name and description, most relevant first.
+    On PostgreSQL full-text search is joined with trigram word similarity of recipe name,
+    so misspelled and unfinished words are found too. Other databases use plain
+    case insensitive matching.
+    """
+    phrase = phrase.strip()
+    if not phrase:
+        return queryset
+    if connections[queryset.db].vendor == "postgresql":
+        return _search_postgresql(queryset, phrase)
+    return _search_fallback(queryset, phrase)
+
+
+def _search_postgresql(queryset, phrase):
+    query = SearchQuery(phrase, search_type="websearch", config=SEARCH_CONFIG)
+    return (
+        queryset.alias(document=SEARCH_VECTOR)
+        .annotate(
+            rank=SearchRank(SEARCH_VECTOR, query)
+            + TrigramWordSimilarity(phrase, RECIPE_NAME_TRIGRAM)
+        )
+        .filter(Q(document=query) | Q(TrigramWordSimilar(RECIPE_NAME_TRIGRAM, phrase)))
+        .order_by("-rank", "-score", "id")
+    )
+
+
+def _search_fallback(queryset, phrase):
+    words = phrase.split()
+    for word in words:
+        queryset = queryset.filter(
+            Q(recipe_name__icontains=word) | Q(descripction__icontains=word)
+        )
+    return queryset.annotate(
+        rank=Case(
+            When(recipe_name__iexact=phrase, then=Value(3)),
+            When(recipe_name__istartswith=phrase, then=Value(2)),
+            When(recipe_name__icontains=phrase, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    ).order_by("-rank", "-score", "id")
@@ -3,6 +3,8 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from authorization.models import Machine
 from main_app.models import *
+from main_app.cache import ingredients_catalog, teas_catalog
+from django.db import transaction
 from django.db.models import Q
 
 
@@ -108,10 +110,73 @@ class UpdateTeasConatainerSerializer(serializers.ModelSerializer):
         fields = ("id",)
 
 
+class ContainerLayoutSerializer(serializers.Serializer):
+    container_number = serializers.ChoiceField(
+        choices=MachineContainers.CONTAINER_NAME_CHOICES
+    )
+    # Tea id for containers 1-2, ingredient id for 3-4, null empties container
+    id = serializers.IntegerField(allow_null=True)
+
+
+class ContainersLayoutSerializer(serializers.Serializer):
+    containers = ContainerLayoutSerializer(many=True)
+
+    def validate_containers(self, value):
+        numbers = sorted(container["container_number"] for container in value)
+        if numbers != [number for number, _ in MachineContainers.CONTAINER_NAME_CHOICES]:
+            raise serializers.ValidationError("Every container must be given once.")
+        # All ids are checked with one catalog lookup of each kind
+        teas = teas_catalog.in_bulk(
+            {
+                item["id"]
+                for item in value
+                if item["container_number"] <= 2 and item["id"] is not None
+            }
+        )
+        ingredients = ingredients_catalog.in_bulk(
+            {
+                item["id"]
+                for item in value
+                if item["container_number"] >= 3 and item["id"] is not None
+            }
+        )
+        errors = []
+        for item in value:
+            if item["container_number"] <= 2:
+                item["object"] = teas.get(item["id"])
+                error = "Tea does not exist."
+            else:
+                item["object"] = ingredients.get(item["id"])
+                error = "Ingredient does not exist."
+            missing = item["id"] is not None and item["object"] is None
+            errors.append({"id": [error]} if missing else {})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return value
+
+
 class MachineInfoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Machine
-        fields = "__all__"
+        # Favourites version is sent with favourites changes (main_app/favourites.py)
+        exclude = ("favourites_version", "containers_generation", "delivery_due_at")
+
+
+class ProvisionMachinesSerializer(serializers.Serializer):
+    machine_ids = serializers.ListField(
+        child=serializers.CharField(max_length=12), allow_empty=False
+    )
+
+
+class TelemetrySampleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MachineTelemetry
+        fields = ("recorded_at",) + MachineTelemetry.SENSOR_FIELDS
+
+
+class TelemetryBatchSerializer(serializers.Serializer):
+    machine_id = serializers.CharField(max_length=12)
+    samples = TelemetrySampleSerializer(many=True, allow_empty=False)
 
 
 class WriteIngredientsRecipesSerializer(serializers.ModelSerializer):
@@ -127,50 +192,81 @@ class WriteIngredientsRecipesSerializer(serializers.ModelSerializer):
             "ingredient_id",
         )
 
-    def validate(self, attrs):
-        # Validate if ingredient object exist
-        if self.context["request"].method == "PATCH":
-            # For PATCH ingredient argument is optional
-            if "ingredient_id" in attrs:
-                try:
-                    Ingredients.objects.get(pk=attrs["ingredient_id"])
-                except ObjectDoesNotExist:
-                    raise serializers.ValidationError("Ingredient does not exist")
-                except Ingredients.MultipleObjectsReturned:
-                    raise serializers.ValidationError("Ingredient was not specified")
-        else:
-            try:
-                Ingredients.objects.get(pk=attrs["ingredient_id"])
-            except ObjectDoesNotExist:
-                raise serializers.ValidationError("Ingredient does not exist")
-        return super().validate(attrs)
-
-    def validate_id(self, value):
-        # If id is specified validate if object exist
-        if IngredientsRecipes.objects.filter(pk=value).exists():
-            return value
-        raise serializers.ValidationError("Object does not exist")
-
 
 class WriteRecipesSerializer(serializers.ModelSerializer):
     ingredients = WriteIngredientsRecipesSerializer(many=True)
     # author = serializers.SerializerMethodField()
 
+    def validate_ingredients(self, value):
+        # Validate if ingredient objects exist, all ids are checked with one catalog lookup
+        # For PATCH ingredient argument is optional
+        ids = {data["ingredient_id"] for data in value if "ingredient_id" in data}
+        existing = ingredients_catalog.in_bulk(ids)
+        # If id is specified validate if object exist, all rows are checked with one query
+        rows = IngredientsRecipes.objects.filter(
+            pk__in=[data["id"] for data in value if "id" in data]
+        )
+        if self.instance is not None:
+            rows = rows.filter(recipe=self.instance)
+        existing_rows = set(rows.values_list("id", flat=True))
+        errors = []
+        for data in value:
+            error = {}
+            if "id" in data and data["id"] not in existing_rows:
+                error["id"] = ["Object does not exist"]
+            if "ingredient_id" in data and data["ingredient_id"] not in existing:
+                error["non_field_errors"] = ["Ingredient does not exist"]
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return value
+
+    def create_ingredients(self, recipe, ingredients_recipes_data):
+        "Create all IngredientsRecipes of recipe with one query"
+        # Ingredient existence is checked in validate_ingredients
+        ingredients = ingredients_catalog.in_bulk(
+            {data["ingredient_id"] for data in ingredients_recipes_data}
+        )
+        IngredientsRecipes.objects.bulk_create(
+            IngredientsRecipes(
+                recipe=recipe,
+                ammount=ingredients_data["ammount"],
+                ingredient=ingredients[ingredients_data["ingredient_id"]],
+            )
+            for ingredients_data in ingredients_recipes_data
+        )
+
+    def update_ingredients(self, recipe, ingredients_recipes_data):
+        "Update existing IngredientsRecipes of recipe with one query"
+        for ingredients_data in ingredients_recipes_data:
+            if "id" not in ingredients_data:
+                # No id of recipe to edit - raise error
+                raise serializers.ValidationError({"id": "Field is required."})
+        rows = IngredientsRecipes.objects.filter(recipe=recipe).in_bulk(
+            [data["id"] for data in ingredients_recipes_data]
+        )
+        fields = set()
+        for ingredients_data in ingredients_recipes_data:
+            row = rows[ingredients_data["id"]]
+            if "ingredient_id" in ingredients_data:
+                row.ingredient_id = ingredients_data["ingredient_id"]
+                fields.add("ingredient")
+            if "ammount" in ingredients_data:
+                row.ammount = ingredients_data["ammount"]
+                fields.add("ammount")
+        if fields:
+            IngredientsRecipes.objects.bulk_update(rows.values(), fields)
+
+    @transaction.atomic
     def create(self, validated_data):
         # Get parts with ingredients and ammounts
         ingredients_recipes_data = validated_data.pop("ingredients")
         recipe = Recipes.objects.create(**validated_data)
         # For every ingredient iwth ammount create new IngredientRecipe object
-        for ingredients_data in ingredients_recipes_data:
-            # Get specified Ingredient object
-            ingredient = Ingredients.objects.get(pk=ingredients_data["ingredient_id"])
-            IngredientsRecipes.objects.create(
-                recipe=recipe,
-                ammount=ingredients_data["ammount"],
-                ingredient=ingredient,
-            )
+        self.create_ingredients(recipe, ingredients_recipes_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if instance.is_public:
             if not (
@@ -203,28 +299,7 @@ class WriteRecipesSerializer(serializers.ModelSerializer):
                 # No ingredients
                 recipe = super().update(instance, validated_data)
                 return recipe
-            for ingredients_data in ingredients_recipes_data:
-                if "id" not in ingredients_data:
-                    # No id of recipe to edit - raise error
-                    raise serializers.ValidationError({"id": "Field is required."})
-                instance = IngredientsRecipes.objects.filter(pk=ingredients_data["id"])
-                if "ingredient_id" in ingredients_data:
-                    ingredient = Ingredients.objects.get(
-                        pk=ingredients_data["ingredient_id"]
-                    )
-                else:
-                    ingredient = None
-
-                if "ammount" in ingredients_data:
-                    ammount = ingredients_data["ammount"]
-                    if ingredient is not None:
-                        instance.update(ingredient=ingredient, ammount=ammount)
-                    else:
-                        instance.update(ammount=ammount)
-                else:
-                    if ingredient is not None:
-                        instance.update(ingredient=ingredient)
-                        return recipe
+            self.update_ingredients(recipe, ingredients_recipes_data)
         else:
             # PUT method
             try:
@@ -237,21 +312,13 @@ class WriteRecipesSerializer(serializers.ModelSerializer):
             except KeyError:
                 # No ingredients is prohibited
                 raise serializers.ValidationError({"ingredients": "Field is required"})
-            for ingredients_data in ingredients_recipes_data:
-                ingredient = Ingredients.objects.get(
-                    pk=ingredients_data["ingredient_id"]
-                )
-                # Id not specified - create new one
-                IngredientsRecipes.objects.create(
-                    recipe=recipe,
-                    ammount=ingredients_data["ammount"],
-                    ingredient=ingredient,
-                )
+            # Ids not specified - create new ones
+            self.create_ingredients(recipe, ingredients_recipes_data)
         return recipe
 
     class Meta:
         model = Recipes
-        exclude = ("author", "votes", "score", "last_modification")
+        exclude = ("author", "votes", "score", "score_sum", "last_modification")
 
 
 class IngredientsRecipesSerializer(serializers.ModelSerializer):
@@ -273,6 +340,9 @@ class RecipesSerializer(serializers.ModelSerializer):
     voted_score = serializers.SerializerMethodField()
 
     def get_voted(self, obj):
+        if hasattr(obj, "user_voted_score"):
+            # Voting state annotated by RecipesQuerySet.with_user_vote
+            return obj.user_voted_score is not None
         try:
             VotedRecipes.objects.get(Q(recipe=obj.id) & Q(user=self.context["user"]))
             return True
@@ -282,6 +352,8 @@ class RecipesSerializer(serializers.ModelSerializer):
             return False
 
     def get_voted_score(self, obj):
+        if hasattr(obj, "user_voted_score"):
+            return obj.user_voted_score or 0
         try:
             return VotedRecipes.objects.get(
                 Q(recipe=obj.id) & Q(user=self.context["user"])
@@ -293,7 +365,7 @@ class RecipesSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipes
-        fields = "__all__"
+        exclude = ("score_sum",)
 
 
 class PrepareRecipeIngredientRecipesSerializer(serializers.ModelSerializer):
@@ -347,9 +419,10 @@ class FavouritesSerializer(serializers.ModelSerializer):
 
 
 class RecipeVoteSerializer(serializers.ModelSerializer):
+    # User and recipe come from request, vote is written without validation queries
     class Meta:
         model = VotedRecipes
-        fields = "__all__"
+        fields = ("score",)
         extra_kwargs = {"score": {"required": True}}
 
     def validate_score(self, value):
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authorization.models import Machine
+from .cache import ingredients_catalog, teas_catalog
+from .events import publish_machine_event
+from .models import Ingredients, MachineContainers, Teas
+from .serializers import MachineInfoSerializer
+from .streams import serialize_container
+
+
+@receiver([post_save, post_delete], sender=Teas)
+def invalidate_teas_catalog(sender, **kwargs):
+    teas_catalog.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Ingredients)
+def invalidate_ingredients_catalog(sender, **kwargs):
+    ingredients_catalog.invalidate()
+
+
+# Changes are pushed to machine streams (streams.py) after commit, so subscribers never
+# see state which was rolled back
+
+
+@receiver(post_save, sender=Machine)
+def publish_machine_state(sender, instance, **kwargs):
+    data = MachineInfoSerializer(instance).data
+    transaction.on_commit(
+        lambda: publish_machine_event(instance.machine_id, "machine", data)
+    )
+
+
+@receiver(post_save, sender=MachineContainers)
+def publish_container_state(sender, instance, **kwargs):
+    data = serialize_container(instance)
+    transaction.on_commit(
+        lambda: publish_machine_event(instance.machine_id, "container", data)
+    )
@@ -0,0 +1,139 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from authorization.authentication import ClaimsJWTAuthentication
+from authorization.models import Machine
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .events import RESYNC, get_broker, machine_channel, publish_machine_event
+from .readiness import load_machine
+from .serializers import (
+    IngredientsConatainerSerializer,
+    MachineInfoSerializer,
+    TeasConatainerSerializer,
+)
+
+# Comment line sent when nothing happened, keeps proxies from closing connection
+HEARTBEAT_INTERVAL = 15
+# Seconds in which stream ticket has to be used
+TICKET_MAX_AGE = 30
+TICKET_SALT = "machine-stream"
+
+
+def serialize_container(container):
+    if container.container_number <= 2:
+        return TeasConatainerSerializer(container).data
+    return IngredientsConatainerSerializer(container).data
+
+
+def publish_after_commit(machine_ids=(), containers=()):
+    """
+    Push current state of machines and given containers to their streams after commit.
+    save() is published by post_save (signals.py), every write without post_save
+    (update, bulk_create, bulk_update) has to call it. Bulk writes of containers do it
+    in MachineContainersQuerySet.
+    """
+    machine_ids = list(machine_ids)
+    containers = list(containers)
+
+    def publish():
+        for machine in Machine.objects.filter(pk__in=machine_ids):
+            publish_machine_event(
+                machine.machine_id, "machine", MachineInfoSerializer(machine).data
+            )
+        for container in containers:
+            publish_machine_event(
+                container.machine_id, "container", serialize_container(container)
+            )
+
+    if machine_ids or containers:
+        transaction.on_commit(publish)
+
+
+def machine_snapshot(machine_id):
+    machine, containers = load_machine(machine_id)
+    return {
+        "machine": MachineInfoSerializer(machine).data,
+        "containers": [serialize_container(container) for container in containers],
+    }
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def stream_ticket(machine_id):
+    """
+    Signed ticket opening stream of machine, valid for TICKET_MAX_AGE seconds. EventSource
+    in browsers can not send headers, ticket is sent in query string instead of access
+    token, so tokens never get into access logs.
+    """
+    return signing.dumps({"machine_id": machine_id}, salt=TICKET_SALT)
+
+
+def authenticate(request):
+    """
+    Return (authenticated, machine id) of JWT access token from Authorization header
+    or of ticket query param. Machine id is None if user has no machine.
+    """
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        try:
+            ticket = signing.loads(
+                request.GET.get("ticket", ""), salt=TICKET_SALT, max_age=TICKET_MAX_AGE
+            )
+        except signing.BadSignature:
+            return False, None
+        return True, ticket["machine_id"]
+    try:
+        raw_token = authentication.get_raw_token(header)
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return False, None
+    return True, user.machine_id
+
+
+async def machine_stream(request):
+    """
+    Server-sent events stream of user machine. First event (snapshot) has machine info and
+    all containers, then machine and container events are pushed whenever they change.
+    Requires ASGI server, every client holds single connection.
+    """
+    authenticated, machine_id = await sync_to_async(authenticate)(request)
+    if not authenticated:
+        return JsonResponse({"detail": "Wrong or missing token."}, status=401)
+    if machine_id is None:
+        return JsonResponse(
+            {"detail": "Your account has no machine. Contact administrator."}, status=404
+        )
+
+    async def events():
+        # Subscribe before reading snapshot, so no change is lost between them
+        subscription = get_broker().subscribe(machine_channel(machine_id))
+        try:
+            snapshot = await sync_to_async(machine_snapshot)(machine_id)
+            yield server_sent_event("snapshot", snapshot)
+            while True:
+                message = await subscription.get(HEARTBEAT_INTERVAL)
+                if message is None:
+                    yield ": heartbeat\n\n"
+                elif message is RESYNC:
+                    # Changes may have been lost, send whole state again
+                    snapshot = await sync_to_async(machine_snapshot)(machine_id)
+                    yield server_sent_event("snapshot", snapshot)
+                else:
+                    yield server_sent_event(message["event"], message["data"])
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Disable response buffering of nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
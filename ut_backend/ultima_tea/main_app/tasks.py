@@ -1,23 +1,72 @@
 from celery.utils.log import get_task_logger
 from celery import shared_task
+from .delivery import deliver_pending, enqueue_message, schedule_delivery
+from .telemetry import rollup_telemetry as rollup_telemetry_rows
 logger = get_task_logger(__name__)
 
-@shared_task(name="send_recipe")
-def send_recipe(data, machine_id):
-    return 0
+def enqueue(task, machine_id, message_type, payload):
+    """
+    Put message into queue of machine and deliver it. Id of task is idempotency key,
+    task redelivered by broker does not queue the message twice.
+    """
+    enqueue_message(machine_id, message_type, payload, key=task.request.id)
+    delay = deliver_pending(machine_id)
+    if delay is not None:
+        schedule_delivery(machine_id, delay)
 
-@shared_task(name="favourites_edit_online")
-def favourites_edit_online(data, operation, machine_id):
-    return 0
 
-@shared_task(name="favourites_edit_offline")
-def favourites_edit_offline(data, machine_id):
-    return 0
+@shared_task(bind=True, name="send_recipe")
+def send_recipe(self, data, machine_id):
+    enqueue(self, machine_id, "send_recipe", data)
 
-@shared_task(name="update_single_container")
-def update_single_container(data, container_number, machine_id):
-    return 0
 
-@shared_task(name="update_all_containers")
-def update_all_containers(data, machine_id):
-    return 0
\ No newline at end of file
+@shared_task(bind=True, name="favourites_edit_online")
+def favourites_edit_online(self, data, operation, machine_id):
+    enqueue(
+        self, machine_id, "favourites_edit_online", {"data": data, "operation": operation}
+    )
+
+
+@shared_task(bind=True, name="favourites_edit_offline")
+def favourites_edit_offline(self, data, machine_id):
+    enqueue(self, machine_id, "favourites_edit_offline", data)
+
+
+@shared_task(bind=True, name="update_single_container")
+def update_single_container(self, data, container_number, machine_id):
+    enqueue(
+        self,
+        machine_id,
+        "update_single_container",
+        {"data": data, "container_number": container_number},
+    )
+
+
+@shared_task(bind=True, name="update_all_containers")
+def update_all_containers(self, data, machine_id):
+    enqueue(self, machine_id, "update_all_containers", data)
+
+
+@shared_task(name="deliver_machine_messages")
+def deliver_machine_messages(machine_id):
+    """
+    Deliver queue of machine, scheduled again while machine does not acknowledge. Chain
+    ends because every message is given up after MAX_ATTEMPTS (delivery.py).
+    """
+    delay = deliver_pending(machine_id)
+    if delay is not None:
+        schedule_delivery(machine_id, delay)
+
+
+@shared_task(name="rollup_telemetry")
+def rollup_telemetry():
+    "Periodic (CELERYBEAT_SCHEDULE in settings), builds minute and hour telemetry rollups"
+    return rollup_telemetry_rows()
+
+
+@shared_task(name="sync_containers")
+def sync_containers(machine_id, generation):
+    "Scheduled by container_sync.schedule_container_sync, debounced container updates"
+    from .container_sync import flush_container_sync
+
+    return flush_container_sync(machine_id, generation)
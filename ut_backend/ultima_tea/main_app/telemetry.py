@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Coalesce, Trunc
+
+from authorization.models import Machine
+from .models import MachineTelemetry, MachineTelemetryRollup, TelemetryRollupState
+from .streams import publish_after_commit
+
+# Rows inserted by single INSERT statement
+INSERT_BATCH_SIZE = 2000
+# Raw rows rolled up by single run of rollup_telemetry
+ROLLUP_BATCH_SIZE = 100000
+# Rows before last rolled up id, which are rolled up again. Ids are given on insert, but rows
+# become visible on commit, so rows of concurrent ingestion may appear behind last id.
+ROLLUP_OVERLAP = 10000
+ROLLUP_STATE = "telemetry"
+
+Resolution = MachineTelemetryRollup.Resolution
+RESOLUTION_UNITS = {Resolution.MINUTE: "minute", Resolution.HOUR: "hour"}
+
+
+def latest_readings(samples):
+    "Newest non empty value of every sensor field in samples"
+    latest = {}
+    for sample in sorted(samples, key=lambda sample: sample["recorded_at"]):
+        for field in MachineTelemetry.SENSOR_FIELDS:
+            if sample.get(field) is not None:
+                latest[field] = sample[field]
+    return latest
+
+
+def ingest_telemetry(batches):
+    """
+    Store validated batches ({"machine_id": ..., "samples": [...]}) of sensor readings.
+    All samples are inserted with bulk INSERTs and Machine snapshot is updated once
+    per machine with its newest readings. Return number of stored samples.
+    """
+    samples_by_machine = defaultdict(list)
+    for batch in batches:
+        samples_by_machine[batch["machine_id"]].extend(batch["samples"])
+
+    rows = [
+        MachineTelemetry(machine_id=machine_id, **sample)
+        for machine_id, samples in samples_by_machine.items()
+        for sample in samples
+    ]
+    with transaction.atomic():
+        MachineTelemetry.objects.bulk_create(rows, batch_size=INSERT_BATCH_SIZE)
+        updated = []
+        for machine_id, samples in samples_by_machine.items():
+            latest = latest_readings(samples)
+            if latest:
+                Machine.objects.filter(pk=machine_id).update(**latest)
+                updated.append(machine_id)
+        publish_after_commit(machine_ids=updated)
+    return len(rows)
+
+
+def aggregates(from_rollups):
+    "Aggregates of rollup bucket, calculated from raw rows or from finer rollups"
+    result = {"samples": Sum("samples") if from_rollups else Count("id")}
+    for field in MachineTelemetry.SENSOR_FIELDS:
+        if from_rollups:
+            result[f"{field}_min"] = Min(f"{field}_min")
+            result[f"{field}_max"] = Max(f"{field}_max")
+            result[f"{field}_sum"] = Coalesce(Sum(f"{field}_sum"), 0.0)
+            result[f"{field}_count"] = Sum(f"{field}_count")
+        else:
+            result[f"{field}_min"] = Min(field)
+            result[f"{field}_max"] = Max(field)
+            result[f"{field}_sum"] = Coalesce(Sum(field), 0.0)
+            result[f"{field}_count"] = Count(field)
+    return result
+
+
+def rebuild_buckets(resolution, source, machines, start, end):
+    """
+    Recalculate buckets of resolution for machines in [start, end) time range from source
+    queryset (raw telemetry or finer rollups) and save them, replacing existing ones.
+    """
+    from_rollups = source.model is MachineTelemetryRollup
+    time_field = "bucket" if from_rollups else "recorded_at"
+    fields = aggregates(from_rollups)
+    # Annotations can not share names with rollup fields
+    rows = (
+        source.filter(
+            machine__in=machines,
+            **{f"{time_field}__gte": start, f"{time_field}__lt": end},
+        )
+        .annotate(period=Trunc(time_field, RESOLUTION_UNITS[resolution]))
+        .values("machine", "period")
+        .annotate(**{f"new_{name}": value for name, value in fields.items()})
+        .order_by()
+    )
+    MachineTelemetryRollup.objects.bulk_create(
+        [
+            MachineTelemetryRollup(
+                machine_id=row["machine"],
+                resolution=resolution,
+                bucket=row["period"],
+                **{name: row[f"new_{name}"] for name in fields},
+            )
+            for row in rows
+        ],
+        batch_size=INSERT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["machine", "resolution", "bucket"],
+        update_fields=list(fields),
+    )
+
+
+def rollup_telemetry(batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Include telemetry rows stored since last run in minute and hour rollups.
+    Buckets touched by new rows are recalculated from scratch, so rolling up same rows again
+    is harmless. Return id of last rolled up row.
+    """
+    with transaction.atomic():
+        state, _ = TelemetryRollupState.objects.select_for_update().get_or_create(
+            name=ROLLUP_STATE
+        )
+        new_rows = MachineTelemetry.objects.filter(
+            id__gt=max(state.last_id - ROLLUP_OVERLAP, 0),
+            id__lte=state.last_id + batch_size,
+        )
+        touched = new_rows.aggregate(
+            start=Min("recorded_at"), end=Max("recorded_at"), last_id=Max("id")
+        )
+        if touched["last_id"] is None:
+            return state.last_id
+        machines = set(new_rows.values_list("machine", flat=True).distinct())
+
+        start = touched["start"].replace(second=0, microsecond=0)
+        end = touched["end"].replace(second=0, microsecond=0) + timedelta(minutes=1)
+        rebuild_buckets(
+            Resolution.MINUTE,
+            MachineTelemetry.objects.all(),
+            machines,
+            start,
+            end,
+        )
+        start = start.replace(minute=0)
+        end = touched["end"].replace(minute=0, second=0, microsecond=0) + timedelta(
+            hours=1
+        )
+        rebuild_buckets(
+            Resolution.HOUR,
+            MachineTelemetryRollup.objects.filter(resolution=Resolution.MINUTE),
+            machines,
+            start,
+            end,
+        )
+        state.last_id = max(state.last_id, touched["last_id"])
+        state.save()
+        return state.last_id
+
+
+def pick_resolution(machine_id, start, end, points):
+    """
+    Finest resolution which fits into points budget in [start, end) window: raw samples
+    (None) if there are not more than points of them, else minute or hour buckets.
+    Hour buckets are used for windows too long for any budget.
+    """
+    raw = MachineTelemetry.objects.filter(
+        machine_id=machine_id, recorded_at__gte=start, recorded_at__lt=end
+    )
+    if raw[: points + 1].count() <= points:
+        return None
+    seconds = (end - start).total_seconds()
+    for resolution in Resolution:
+        if seconds / resolution <= points:
+            return resolution
+    return Resolution.HOUR
+
+
+def sample_point(sample):
+    point = {"time": sample.recorded_at}
+    for field in MachineTelemetry.SENSOR_FIELDS:
+        value = getattr(sample, field)
+        point[field] = {"min": value, "max": value, "avg": value}
+    return point
+
+
+def bucket_point(bucket):
+    point = {"time": bucket.bucket}
+    for field in MachineTelemetry.SENSOR_FIELDS:
+        count = getattr(bucket, f"{field}_count")
+        point[field] = {
+            "min": getattr(bucket, f"{field}_min"),
+            "max": getattr(bucket, f"{field}_max"),
+            "avg": getattr(bucket, f"{field}_sum") / count if count else None,
+        }
+    return point
+
+
+def query_telemetry(machine_id, start, end, points):
+    """
+    Sensor curves of machine in [start, end) window, in at most points points (unless window
+    is too long even for hour buckets). Return name of used resolution and list of points,
+    every point has time and min/max/avg of every sensor field.
+    """
+    resolution = pick_resolution(machine_id, start, end, points)
+    if resolution is None:
+        samples = MachineTelemetry.objects.filter(
+            machine_id=machine_id, recorded_at__gte=start, recorded_at__lt=end
+        ).order_by("recorded_at")
+        return "raw", [sample_point(sample) for sample in samples]
+    # Bucket containing start is included too
+    buckets = MachineTelemetryRollup.objects.filter(
+        machine_id=machine_id,
+        resolution=resolution,
+        bucket__gt=start - timedelta(seconds=resolution),
+        bucket__lt=end,
+    ).order_by("bucket")
+    return RESOLUTION_UNITS[resolution], [bucket_point(bucket) for bucket in buckets]
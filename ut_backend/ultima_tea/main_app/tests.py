@@ -1,21 +1,73 @@
 import requests
+import base64
+import io
+import threading
 import unittest
-from django.test import TestCase, client
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    client,
+    override_settings,
+    skipUnlessDBFeature,
+)
 import json
-from django.test import Client
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.test import AsyncClient, Client
 import rest_framework
 
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from kombu.serialization import dumps as kombu_dumps, loads as kombu_loads
+from django.db import IntegrityError, connection, connections, transaction
 from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
 from rest_framework.response import Response
+from rest_framework_simplejwt.tokens import AccessToken
 from authorization.models import CustomUser
 from .models import (
     Ingredients,
     IngredientsRecipes,
     Machine,
     MachineContainers,
+    MachineMessage,
+    MachineTelemetry,
+    MachineTelemetryRollup,
     Recipes,
     Teas,
+    VotedRecipes,
+)
+from .management.commands.explain_public_filters import FILTERS
+from .cache import ingredients_catalog
+from .delivery import (
+    DeviceSimulator,
+    deliver_pending,
+    delivery_metrics,
+    schedule_delivery,
+)
+from .events import (
+    RESYNC,
+    SUBSCRIBER_QUEUE_SIZE,
+    LocalBroker,
+    RedisBroker,
+    get_broker,
+    machine_channel,
 )
+from .provisioning import create_containers
+from .readiness import load_recipe
+from . import routing
+from .routing import ReplicaRouter, replica_reads
+from .serializers import PrepareRecipeSerializer
+from .tasks import send_recipe, sync_containers, update_all_containers
+from .telemetry import ingest_telemetry, rollup_telemetry
+from .views import MAX_RECIPES_PER_USER, filter_recipes
+from . import wire
+from .wire import recipe_message
 
 
 class TestCases(TestCase):
@@ -79,6 +131,7 @@ class TestCases(TestCase):
         IngredientsRecipes.objects.create(recipe=recipe_pub2, ingredient=ing1, ammount=13.33)
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = self.User("test@wp.pl", "Test1234", "123")
         self.machine = Machine.objects.create(machine_id="123")
@@ -426,7 +479,7 @@ class TestCases(TestCase):
         }
         response = self.client.post("/send_recipe/", send_data, content_type="application/json")
         data = response.json()
-        self.assertEqual(data, {'detail': ['Machine is not connected.', 'Mug is not ready.', 'Not enough tea herbs in container.', 'Given tea type is not available in your tea containers.', 'Not enough ingredient in container.', 'Ingredient Cukier, of required ammount: 12.5, is not avaible in your machine.', 'Ingredient Sok z cytryny, of required ammount: 3.33, is not avaible in your machine.', 'Not enough water.']})
+        self.assertEqual(data['detail'], ['Machine is not connected.', 'Mug is not ready.', 'Not enough tea herbs in container.', 'Not enough ingredient in container.', 'Ingredient Sok z cytryny, of required ammount: 3.33, is not avaible in your machine.', 'Not enough water.'])
 
 
         send_data = {
@@ -434,7 +487,7 @@ class TestCases(TestCase):
         }
         response = self.client.post("/send_recipe/", send_data, content_type="application/json")
         data = response.json()
-        self.assertEqual(data, {'detail': ['Machine is not connected.', 'Mug is not ready.', 'Not enough tea herbs in container.', 'Given tea type is not available in your tea containers.', 'Ingredient Syrop malinowy, of required ammount: 27.33, is not avaible in your machine.', 'Not enough water.']})
+        self.assertEqual(data['detail'], ['Machine is not connected.', 'Mug is not ready.', 'Not enough tea herbs in container.', 'Ingredient Syrop malinowy, of required ammount: 27.33, is not avaible in your machine.', 'Not enough water.'])
 
         recipe_default = Recipes.objects.create(
             author=CustomUser.objects.get(pk=self.user.user_id),
@@ -525,3 +578,1822 @@ class TestCases(TestCase):
         self.assertEqual(data, recipe_reference)
         
         return True
+
+
+# Tests run in one process, local memory cache is seen by every request
+@override_settings(SHARED_CACHE=True)
+class QueryCountTestCase(TestCase):
+    """
+    Base for tests counting database queries of recipe endpoints
+    """
+
+    password = "Test1234"
+
+    def setUp(self):
+        cache.clear()
+        self.machine = Machine.objects.create(machine_id="qc1")
+        # Publishes user to cache, as after commit of real request
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = CustomUser.objects.create_user(
+                "querycount@wp.pl", self.password, machine=self.machine
+            )
+        response = Client().post(
+            "/token/", {"email": self.user.email, "password": self.password}
+        )
+        self.client = Client(
+            HTTP_AUTHORIZATION="Bearer {}".format(response.json()["access"])
+        )
+        self.tea = Teas.objects.create(tea_name="Czarna herbata")
+        self.ingredients = [
+            Ingredients.objects.create(ingredient_name=f"Skladnik {i}", type=1)
+            for i in range(3)
+        ]
+
+    def create_recipes(self, count, **kwargs):
+        recipes = []
+        for i in range(count):
+            recipe = Recipes.objects.create(
+                author=self.user,
+                recipe_name=f"recipe {len(recipes)} {i}",
+                tea_type=self.tea,
+                **kwargs,
+            )
+            for ingredient in self.ingredients:
+                IngredientsRecipes.objects.create(
+                    recipe=recipe, ingredient=ingredient, ammount=10
+                )
+            recipes.append(recipe)
+        return recipes
+
+    def count_queries(self, url, table=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = [query["sql"] for query in context.captured_queries]
+        if table is not None:
+            queries = [sql for sql in queries if f'"{table}"' in sql]
+        return len(queries), response.json()
+
+
+class VotedRecipesQueryCountTests(QueryCountTestCase):
+    def test_public_recipes_vote_state_fetched_once(self):
+        recipes = self.create_recipes(1, is_public=True)
+        VotedRecipes.objects.create(user=self.user, recipe=recipes[0], score=4)
+        single, _ = self.count_queries("/public_recipes/", "voted_recipes")
+
+        recipes += self.create_recipes(5, is_public=True)
+        for recipe in recipes[1:]:
+            VotedRecipes.objects.create(user=self.user, recipe=recipe, score=3)
+        full, data = self.count_queries("/public_recipes/", "voted_recipes")
+
+        self.assertEqual(single, 1)
+        self.assertEqual(full, single)
+        self.assertEqual(len(data["results"]), 6)
+        self.assertTrue(all(recipe["voted"] for recipe in data["results"]))
+        self.assertEqual(
+            sorted(recipe["voted_score"] for recipe in data["results"]),
+            [3, 3, 3, 3, 3, 4],
+        )
+
+    def test_user_recipes_vote_state(self):
+        voted, not_voted = self.create_recipes(2)
+        VotedRecipes.objects.create(user=self.user, recipe=voted, score=2)
+        count, data = self.count_queries("/recipes/", "voted_recipes")
+        self.assertEqual(count, 1)
+        data = {recipe["id"]: recipe for recipe in data}
+        self.assertEqual(data[voted.id]["voted_score"], 2)
+        self.assertTrue(data[voted.id]["voted"])
+        self.assertFalse(data[not_voted.id]["voted"])
+
+
+class RecipesReadQueryCountTests(QueryCountTestCase):
+    def test_user_recipes_constant_queries(self):
+        self.create_recipes(1)
+        single, _ = self.count_queries("/recipes/")
+        self.create_recipes(MAX_RECIPES_PER_USER - 1)
+        full, data = self.count_queries("/recipes/")
+        self.assertEqual(len(data), MAX_RECIPES_PER_USER)
+        self.assertEqual(full, single)
+        self.assertEqual(len(data[0]["ingredients"]), len(self.ingredients))
+
+    def test_public_recipes_constant_queries(self):
+        self.create_recipes(1, is_public=True)
+        single, _ = self.count_queries("/public_recipes/")
+        self.create_recipes(10, is_public=True)
+        full, data = self.count_queries("/public_recipes/")
+        self.assertEqual(len(data["results"]), 6)
+        self.assertEqual(full, single)
+
+    def test_retrieve_recipe_queries(self):
+        recipe = self.create_recipes(1)[0]
+        count, data = self.count_queries(f"/recipes/{recipe.id}/")
+        self.assertEqual(data["tea_type"]["tea_name"], self.tea.tea_name)
+        # recipe with tea type and author, ingredients with Ingredients rows
+        self.assertEqual(count, 2)
+
+    def test_favourites_constant_queries(self):
+        recipes = self.create_recipes(MAX_RECIPES_PER_USER, is_favourite=True)
+        Recipes.objects.filter(pk=recipes[0].pk).update(is_favourite=False)
+        with patch("main_app.views.favourites_edit_online.delay") as delay:
+            with CaptureQueriesContext(connection) as many:
+                self.client.put(
+                    f"/favourites_edit/{recipes[0].id}/",
+                    {"is_favourite": True},
+                    content_type="application/json",
+                )
+            Recipes.objects.exclude(pk=recipes[0].pk).update(is_favourite=False)
+            Recipes.objects.filter(pk=recipes[0].pk).update(is_favourite=False)
+            with CaptureQueriesContext(connection) as single:
+                self.client.put(
+                    f"/favourites_edit/{recipes[0].id}/",
+                    {"is_favourite": True},
+                    content_type="application/json",
+                )
+        # Only the changed recipe is sent
+        data, operation, _ = delay.call_args_list[0].args
+        self.assertEqual(operation, "add")
+        self.assertEqual(data["recipe"]["id"], recipes[0].id)
+        self.assertEqual(len(many.captured_queries), len(single.captured_queries))
+
+
+class SearchPublicRecipesTests(QueryCountTestCase):
+    def create_public(self, name, description="Brak", score=0):
+        return Recipes.objects.create(
+            author=self.user,
+            recipe_name=name,
+            descripction=description,
+            score=score,
+            tea_type=self.tea,
+            is_public=True,
+        )
+
+    def test_search_ranked_by_relevance_and_score(self):
+        contains = self.create_public("Morning green tea", score=5)
+        starts_low = self.create_public("Green mint", score=1)
+        starts_high = self.create_public("Green lemon", score=4)
+        description = self.create_public("Earl grey", "Best with green apple")
+        self.create_public("Black tea")
+        response = self.client.get("/public_recipes/", {"search": "green"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]],
+            [starts_high.id, starts_low.id, contains.id, description.id],
+        )
+
+    def test_search_all_words(self):
+        match = self.create_public("Mint tea", "With honey")
+        self.create_public("Mint tea")
+        response = self.client.get("/public_recipes/", {"search": "honey mint"})
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]], [match.id]
+        )
+
+    def test_name_is_not_regex(self):
+        match = self.create_public("Tea (strong)")
+        self.create_public("Tea strong")
+        response = self.client.get("/public_recipes/", {"name": "(strong"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]], [match.id]
+        )
+
+
+class ExplainPublicFiltersTests(TestCase):
+    def test_filters_use_indexes(self):
+        output = io.StringIO()
+        call_command("explain_public_filters", recipes=300, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), len(FILTERS))
+        # Seeded data is rolled back
+        self.assertFalse(Recipes.objects.exists())
+        full_scans = [line for line in lines if not line.startswith("OK")]
+        if connection.vendor == "postgresql":
+            self.assertEqual(full_scans, [])
+        else:
+            # Name and fallback search have no index outside of PostgreSQL, without
+            # filters first page is read walking whole ordering index
+            self.assertEqual(
+                [line.split(maxsplit=2)[2] for line in full_scans],
+                ["no filters", "{'name': 'raspberry'}", "{'search': 'raspberry'}"],
+            )
+
+
+class KeysetPaginationTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = [
+            Recipes.objects.create(
+                author=self.user,
+                recipe_name=f"recipe {i % 5}",
+                is_favourite=i % 4 == 0,
+                is_public=True,
+                tea_type=self.tea,
+            )
+            for i in range(20)
+        ]
+        self.expected = list(
+            Recipes.objects.order_by("-is_favourite", "recipe_name", "id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_cursor_walk_forward_and_back(self):
+        pages = []
+        response = self.client.get("/public_recipes/", {"pagination": "cursor"})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn("count", data)
+            pages.append([recipe["id"] for recipe in data["results"]])
+            if data["next"] is None:
+                break
+            response = self.client.get(data["next"])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [6, 6, 6, 2])
+
+        # Walk back from the last page
+        for page in reversed(pages[:-1]):
+            response = self.client.get(data["previous"])
+            data = response.json()
+            self.assertEqual([recipe["id"] for recipe in data["results"]], page)
+        self.assertIsNone(data["previous"])
+
+    def test_cursor_skips_count_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get("/public_recipes/", {"pagination": "cursor"})
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in context.captured_queries)
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/public_recipes/", {"cursor": "abc"})
+        self.assertEqual(response.status_code, 404)
+        for values in (
+            [True, "a", "abc"],
+            [{"a": 1}, "a", 1],
+            [True, ["a"], 1],
+            [True, "a", None],
+            "abc",
+        ):
+            cursor = base64.urlsafe_b64encode(json.dumps([0, values]).encode()).decode()
+            response = self.client.get("/public_recipes/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_cursor_with_search_rejected(self):
+        response = self.client.get(
+            "/public_recipes/", {"pagination": "cursor", "search": "herbata"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("search", response.json())
+
+    def test_page_number_contract(self):
+        response = self.client.get("/public_recipes/", {"page": 2})
+        data = response.json()
+        self.assertEqual(data["count"], 20)
+        self.assertEqual(
+            [recipe["id"] for recipe in data["results"]], self.expected[6:12]
+        )
+
+
+class IngredientsFilterTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        first, second, third = self.ingredients
+        self.both = self.create_public([first, second])
+        self.all_three = self.create_public([first, second, third])
+        self.only_first = self.create_public([first])
+        self.none = self.create_public([])
+
+    def create_public(self, ingredients):
+        recipe = Recipes.objects.create(
+            author=self.user, recipe_name="recipe", tea_type=self.tea, is_public=True
+        )
+        for ingredient in ingredients:
+            IngredientsRecipes.objects.create(
+                recipe=recipe, ingredient=ingredient, ammount=5
+            )
+        return recipe
+
+    def get_ids(self, params):
+        response = self.client.get("/public_recipes/", params | {"size": 6})
+        self.assertEqual(response.status_code, 200)
+        return sorted(recipe["id"] for recipe in response.json()["results"])
+
+    def test_all_of(self):
+        first, second, _ = self.ingredients
+        self.assertEqual(
+            self.get_ids({"ingredients": f"{first.id},{second.id}"}),
+            [self.both.id, self.all_three.id],
+        )
+        # Legacy parameters
+        self.assertEqual(
+            self.get_ids({"ingredient_1": first.id, "ingredient_2": second.id}),
+            [self.both.id, self.all_three.id],
+        )
+
+    def test_any_of_distinct(self):
+        ids = ",".join(str(ingredient.id) for ingredient in self.ingredients)
+        self.assertEqual(
+            self.get_ids({"ingredients": ids, "ingredients_match": "any"}),
+            [self.both.id, self.all_three.id, self.only_first.id],
+        )
+
+    def test_single_subquery(self):
+        one = filter_recipes(
+            {"ingredients": str(self.ingredients[0].id)}, Recipes.objects.all()
+        )
+        three = filter_recipes(
+            {"ingredients": ",".join(str(i.id) for i in self.ingredients)},
+            Recipes.objects.all(),
+        )
+        self.assertEqual(str(one.query).count("JOIN"), 0)
+        self.assertEqual(str(three.query).count("JOIN"), 0)
+        self.assertEqual(str(three.query).count("SELECT"), 2)
+
+    def test_wrong_values(self):
+        response = self.client.get("/public_recipes/", {"ingredients": "a"})
+        self.assertEqual(response.status_code, 422)
+        response = self.client.get(
+            "/public_recipes/", {"ingredients": "1", "ingredients_match": "some"}
+        )
+        self.assertEqual(response.status_code, 422)
+
+
+class VotingTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipes(1, is_public=True)[0]
+
+    def vote(self, method, score, client=None):
+        return getattr(client or self.client, method)(
+            f"/recipes/{self.recipe.id}/vote/",
+            {"score": score},
+            content_type="application/json",
+        )
+
+    def test_add_and_change_vote(self):
+        self.assertEqual(self.vote("post", 4).json(), {"score": 4.0})
+        self.assertEqual(self.vote("post", 2).status_code, 400)
+        self.assertEqual(self.vote("put", 1).json(), {"score": 1.0})
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.votes, self.recipe.score_sum, self.recipe.score), (1, 1, 1.0)
+        )
+
+    def test_vote_single_recipe_update(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.vote("post", 3).status_code, 201)
+        writes = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(writes[1].startswith('UPDATE "recipes"'))
+
+    def statements(self, method, score):
+        with CaptureQueriesContext(connection) as context:
+            response = self.vote(method, score)
+        return response, [
+            query["sql"]
+            for query in context.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+
+    def test_vote_statements(self):
+        response, statements = self.statements("post", 3)
+        self.assertEqual(response.json(), {"score": 3.0})
+        self.assertEqual(len(statements), 2)
+        # Lock of vote, UPDATE of vote, UPDATE of recipe
+        response, statements = self.statements("put", 5)
+        self.assertEqual(response.json(), {"score": 5.0})
+        self.assertEqual(len(statements), 3)
+
+    def test_vote_missing_recipe(self):
+        response = self.client.post(
+            "/recipes/0/vote/", {"score": 3}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(VotedRecipes.objects.exists())
+        self.assertEqual(self.vote("post", 6).status_code, 400)
+
+
+class ConcurrentVotingTests(TransactionTestCase):
+    voters = 8
+
+    def setUp(self):
+        tea = Teas.objects.create(tea_name="Czarna herbata")
+        author = CustomUser.objects.create_user("author@wp.pl", "Test1234")
+        self.recipe = Recipes.objects.create(
+            author=author, recipe_name="test", tea_type=tea, is_public=True
+        )
+        self.clients = []
+        for i in range(self.voters):
+            user = CustomUser.objects.create_user(f"voter{i}@wp.pl", "Test1234")
+            token = Client().post("/token/", {"email": user.email, "password": "Test1234"})
+            self.clients.append(
+                Client(HTTP_AUTHORIZATION="Bearer {}".format(token.json()["access"]))
+            )
+
+    def vote(self, client, score, barrier):
+        barrier.wait()
+        try:
+            return client.post(
+                f"/recipes/{self.recipe.id}/vote/",
+                {"score": score},
+                content_type="application/json",
+            ).status_code
+        finally:
+            connection.close()
+
+    # Decided on test database, SQLite locks whole table for concurrent writers
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_parallel_votes_exact_average(self):
+        scores = [i % 6 for i in range(self.voters)]
+        barrier = threading.Barrier(self.voters)
+        with ThreadPoolExecutor(max_workers=self.voters) as executor:
+            statuses = list(
+                executor.map(
+                    self.vote, self.clients, scores, [barrier] * self.voters
+                )
+            )
+        self.assertEqual(statuses, [201] * self.voters)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.votes, self.voters)
+        self.assertEqual(self.recipe.score_sum, sum(scores))
+        self.assertEqual(self.recipe.score, sum(scores) / self.voters)
+
+
+class CatalogCacheTests(QueryCountTestCase):
+    def test_catalog_list_cached(self):
+        count, data = self.count_queries("/teas/", "teas")
+        self.assertEqual(count, 1)
+        self.assertEqual([tea["id"] for tea in data], [self.tea.id])
+        self.assertEqual(self.count_queries("/teas/", "teas")[0], 0)
+        count, data = self.count_queries("/ingredients/", "ingredients")
+        self.assertEqual(count, 1)
+        self.assertEqual(len(data), 3)
+        self.assertEqual(self.count_queries("/ingredients/", "ingredients")[0], 0)
+
+    def test_catalog_invalidated_on_change(self):
+        self.count_queries("/teas/")
+        tea = Teas.objects.create(tea_name="Zielona herbata")
+        self.assertEqual(len(self.count_queries("/teas/")[1]), 2)
+        tea.delete()
+        self.assertEqual(len(self.count_queries("/teas/")[1]), 1)
+        self.ingredients[0].ingredient_name = "Cukier"
+        self.ingredients[0].save()
+        data = self.count_queries("/ingredients/")[1]
+        self.assertEqual(data[0]["ingredient_name"], "Cukier")
+
+    def test_catalog_etag(self):
+        response = self.client.get("/teas/")
+        etag = response["ETag"]
+        response = self.client.get("/teas/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Teas.objects.create(tea_name="Zielona herbata")
+        response = self.client.get("/teas/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_write_recipe_validates_ingredients_from_catalog(self):
+        recipe = {
+            "recipe_name": "test",
+            "tea_type": self.tea.id,
+            "ingredients": [
+                {"ingredient_id": ingredient.id, "ammount": 10}
+                for ingredient in self.ingredients
+            ],
+        }
+        self.count_queries("/ingredients/")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                "/recipes/", recipe, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in context.captured_queries
+                if query["sql"].startswith('SELECT') and 'FROM "ingredients"' in query["sql"]
+            ]
+        )
+        recipe["ingredients"].append({"ingredient_id": 0, "ammount": 10})
+        response = self.client.post("/recipes/", recipe, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["ingredients"][3],
+            {"non_field_errors": ["Ingredient does not exist"]},
+        )
+
+    def test_write_recipe_ingredient_missing_from_catalog(self):
+        self.count_queries("/ingredients/")
+        # bulk_create does not send post_save, catalog entry keeps old list
+        (ingredient,) = Ingredients.objects.bulk_create(
+            [Ingredients(ingredient_name="Imbir", type=1)]
+        )
+        recipe = {
+            "recipe_name": "test",
+            "tea_type": self.tea.id,
+            "ingredients": [{"ingredient_id": ingredient.id, "ammount": 10}],
+        }
+        response = self.client.post("/recipes/", recipe, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(ingredient.id, ingredients_catalog.in_bulk([ingredient.id]))
+
+
+class WriteRecipeQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ingredients += [
+            Ingredients.objects.create(ingredient_name=f"Skladnik {i}", type=1)
+            for i in range(3, 20)
+        ]
+
+    def recipe_data(self, count):
+        return {
+            "recipe_name": "test",
+            "tea_type": self.tea.id,
+            "ingredients": [
+                {"ingredient_id": ingredient.id, "ammount": 10}
+                for ingredient in self.ingredients[:count]
+            ],
+        }
+
+    def count_write_queries(self, method, url, data):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(
+                url, data, content_type="application/json"
+            )
+        self.assertIn(response.status_code, (200, 201))
+        return len(context.captured_queries), response.json()
+
+    def test_create_constant_queries(self):
+        # Warm up ingredients catalog
+        self.client.get("/ingredients/")
+        counts = []
+        for size in (1, 5, 20):
+            count, data = self.count_write_queries(
+                "post", "/recipes/", self.recipe_data(size)
+            )
+            counts.append(count)
+            self.assertEqual(
+                IngredientsRecipes.objects.filter(recipe=data["id"]).count(), size
+            )
+        self.assertEqual(counts, [counts[0]] * 3)
+
+    def test_put_constant_queries(self):
+        self.client.get("/ingredients/")
+        recipe = self.create_recipes(1)[0]
+        counts = []
+        for size in (1, 5, 20):
+            count, _ = self.count_write_queries(
+                "put", f"/recipes/{recipe.id}/", self.recipe_data(size)
+            )
+            counts.append(count)
+            self.assertEqual(recipe.ingredients.count(), size)
+        self.assertEqual(counts, [counts[0]] * 3)
+
+    def test_patch_constant_queries(self):
+        self.client.get("/ingredients/")
+        recipe = self.create_recipes(1)[0]
+        self.client.put(
+            f"/recipes/{recipe.id}/",
+            self.recipe_data(20),
+            content_type="application/json",
+        )
+        rows = list(recipe.ingredients.order_by("id"))
+        counts = []
+        for size in (1, 5, 20):
+            data = {
+                "ingredients": [
+                    {"id": row.id, "ammount": size, "ingredient_id": self.ingredients[0].id}
+                    for row in rows[:size]
+                ]
+            }
+            count, _ = self.count_write_queries(
+                "patch", f"/recipes/{recipe.id}/", data
+            )
+            counts.append(count)
+            self.assertEqual(
+                recipe.ingredients.filter(
+                    ammount=size, ingredient=self.ingredients[0]
+                ).count(),
+                size,
+            )
+        self.assertEqual(counts, [counts[0]] * 3)
+
+    def test_patch_foreign_row(self):
+        recipe, other = self.create_recipes(2)
+        data = {"ingredients": [{"id": other.ingredients.first().id, "ammount": 1}]}
+        response = self.client.patch(
+            f"/recipes/{recipe.id}/", data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["ingredients"][0], {"id": ["Object does not exist"]}
+        )
+
+
+class SendRecipeTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.machine.machine_status = Machine.MachineStates.ON
+        self.machine.is_mug_ready = True
+        self.machine.water_container_weight = 1000
+        self.machine.save()
+        containers = [
+            (1, {"tea": self.tea}),
+            (2, {}),
+            (3, {"ingredient": self.ingredients[0]}),
+            (4, {"ingredient": self.ingredients[1]}),
+        ]
+        for number, kwargs in containers:
+            MachineContainers.objects.create(
+                machine=self.machine, container_number=number, ammount=100, **kwargs
+            )
+        self.recipe = Recipes.objects.create(
+            author=self.user, recipe_name="test", tea_type=self.tea
+        )
+        for ingredient in self.ingredients[:2]:
+            IngredientsRecipes.objects.create(
+                recipe=self.recipe, ingredient=ingredient, ammount=10
+            )
+
+    def send(self, data):
+        with patch("main_app.views.send_recipe.delay") as delay:
+            response = self.client.post(
+                "/send_recipe/", data, content_type="application/json"
+            )
+        return response, delay
+
+    def test_ready(self):
+        response, delay = self.send({"id": self.recipe.id, "tea_portion": 250})
+        self.assertEqual(response.status_code, 200)
+        data, machine_id = delay.call_args[0]
+        self.assertEqual(machine_id, self.machine.machine_id)
+        self.assertEqual(data["id"], self.recipe.id)
+        self.assertEqual(data["portion"], 250)
+        self.assertEqual(data["tea"], self.tea.id)
+        self.assertEqual(
+            data["ing"], [[ingredient.id, 10] for ingredient in self.ingredients[:2]]
+        )
+
+    def test_no_machine(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.machine = None
+            self.user.save()
+        response, delay = self.send({"id": self.recipe.id})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(delay.called)
+
+    def test_readiness_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response, _ = self.send({"id": self.recipe.id})
+        self.assertEqual(response.status_code, 200)
+        queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if '"machine_container"' in query["sql"]
+            or '"ingredients_recipes"' in query["sql"]
+            or '"recipes"' in query["sql"]
+        ]
+        self.assertEqual(len(queries), 2)
+
+    def test_shortfalls(self):
+        MachineContainers.objects.filter(container_number=3).update(ammount=5)
+        IngredientsRecipes.objects.create(
+            recipe=self.recipe, ingredient=self.ingredients[2], ammount=10
+        )
+        response, delay = self.send({"id": self.recipe.id, "tea_portion": 2000})
+        self.assertEqual(response.status_code, 400)
+        delay.assert_not_called()
+        shortfalls = response.json()["shortfalls"]
+        self.assertEqual(
+            [item["code"] for item in shortfalls],
+            ["not_enough_ingredient", "ingredient_not_available", "not_enough_water"],
+        )
+        self.assertEqual(shortfalls[0]["available"], 5)
+        self.assertEqual(shortfalls[1]["ingredient"], self.ingredients[2].id)
+        self.assertEqual(shortfalls[2]["required"], 2060)
+
+    def test_recipe_of_other_user(self):
+        other = CustomUser.objects.create_user("other@wp.pl", self.password)
+        self.recipe.author = other
+        self.recipe.save()
+        response, _ = self.send({"id": self.recipe.id})
+        self.assertEqual(response.json(), {"detail": "Recipe does not exist."})
+
+
+class TelemetryTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        # Token claims are updated after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.other = Machine.objects.create(machine_id="qc2")
+
+    def post(self, data):
+        return self.client.post(
+            "/machine/telemetry/", data, content_type="application/json"
+        )
+
+    def samples(self, count, start=0):
+        return [
+            {
+                "recorded_at": f"2026-10-17T12:00:{second:02}Z",
+                "brewing_temperature": 80 + second,
+                "mug_temperature": 40,
+            }
+            for second in range(start, start + count)
+        ]
+
+    def test_batch_stored_with_constant_queries(self):
+        counts = []
+        for size in (1, 50):
+            with CaptureQueriesContext(connection) as context:
+                response = self.post(
+                    [
+                        {"machine_id": "qc1", "samples": self.samples(size)},
+                        {"machine_id": "qc2", "samples": self.samples(size)},
+                    ]
+                )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json(), {"samples": 2 * size})
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(MachineTelemetry.objects.count(), 102)
+
+    def test_snapshot_from_newest_sample(self):
+        samples = self.samples(3)
+        samples[2]["mug_temperature"] = None
+        samples[1]["mug_temperature"] = 55
+        # Samples do not have to be ordered
+        response = self.post({"machine_id": "qc1", "samples": samples[::-1]})
+        self.assertEqual(response.status_code, 201)
+        self.machine.refresh_from_db()
+        self.assertEqual(self.machine.brewing_temperature, 82)
+        self.assertEqual(self.machine.mug_temperature, 55)
+        self.assertEqual(self.machine.air_temperature, 0)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.brewing_temperature, 0)
+
+    def test_wrong_batches(self):
+        response = self.post({"machine_id": "none", "samples": self.samples(1)})
+        self.assertEqual(response.status_code, 400)
+        response = self.post({"machine_id": "qc1", "samples": []})
+        self.assertEqual(response.status_code, 400)
+        response = self.post({"machine_id": "qc1", "samples": [{"mug_temperature": 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MachineTelemetry.objects.exists())
+
+    def test_admin_only(self):
+        self.user.is_staff = False
+        # Token claims are updated after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.post({"machine_id": "qc1", "samples": self.samples(1)})
+        self.assertEqual(response.status_code, 403)
+
+
+class TelemetryRollupTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = datetime(2026, 10, 17, 12, 0, tzinfo=dt_timezone.utc)
+        # Two hours of samples every 10 seconds
+        MachineTelemetry.objects.bulk_create(
+            MachineTelemetry(
+                machine=self.machine,
+                recorded_at=self.start + timedelta(seconds=10 * number),
+                brewing_temperature=number % 6,
+                mug_temperature=None if number % 2 else 40,
+            )
+            for number in range(720)
+        )
+
+    def get(self, **params):
+        response = self.client.get("/machine/telemetry/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rollups(self):
+        rollup_telemetry()
+        minutes = MachineTelemetryRollup.objects.filter(
+            resolution=MachineTelemetryRollup.Resolution.MINUTE
+        ).order_by("bucket")
+        self.assertEqual(len(minutes), 120)
+        self.assertEqual(minutes[0].samples, 6)
+        self.assertEqual(minutes[0].brewing_temperature_min, 0)
+        self.assertEqual(minutes[0].brewing_temperature_max, 5)
+        self.assertEqual(minutes[0].brewing_temperature_sum, 15)
+        self.assertEqual(minutes[0].mug_temperature_count, 3)
+        self.assertEqual(minutes[0].air_temperature_count, 0)
+        hours = MachineTelemetryRollup.objects.filter(
+            resolution=MachineTelemetryRollup.Resolution.HOUR
+        ).order_by("bucket")
+        self.assertEqual([hour.samples for hour in hours], [360, 360])
+        self.assertEqual(hours[0].bucket, self.start)
+
+    def test_incremental(self):
+        rollup_telemetry()
+        # Late sample of already rolled up minute and sample of new hour
+        MachineTelemetry.objects.create(
+            machine=self.machine, recorded_at=self.start, brewing_temperature=100
+        )
+        MachineTelemetry.objects.create(
+            machine=self.machine,
+            recorded_at=self.start + timedelta(hours=3),
+            brewing_temperature=1,
+        )
+        rollup_telemetry()
+        minute = MachineTelemetryRollup.objects.get(
+            resolution=MachineTelemetryRollup.Resolution.MINUTE, bucket=self.start
+        )
+        self.assertEqual(minute.samples, 7)
+        self.assertEqual(minute.brewing_temperature_max, 100)
+        hours = MachineTelemetryRollup.objects.filter(
+            resolution=MachineTelemetryRollup.Resolution.HOUR
+        ).order_by("bucket")
+        self.assertEqual([hour.samples for hour in hours], [361, 360, 1])
+
+    def test_range_query_resolution(self):
+        rollup_telemetry()
+        end = (self.start + timedelta(hours=2)).isoformat()
+        data = self.get(start=self.start.isoformat(), end=end, points=1000)
+        self.assertEqual(data["resolution"], "raw")
+        self.assertEqual(len(data["points"]), 720)
+        data = self.get(start=self.start.isoformat(), end=end, points=200)
+        self.assertEqual(data["resolution"], "minute")
+        self.assertEqual(len(data["points"]), 120)
+        self.assertEqual(
+            data["points"][0]["brewing_temperature"],
+            {"min": 0, "max": 5, "avg": 2.5},
+        )
+        self.assertIsNone(data["points"][0]["air_temperature"]["avg"])
+        data = self.get(start=self.start.isoformat(), end=end, points=10)
+        self.assertEqual(data["resolution"], "hour")
+        self.assertEqual(len(data["points"]), 2)
+
+    def test_range_query_wrong_params(self):
+        other = Machine.objects.create(machine_id="qc2")
+        response = self.client.get("/machine/telemetry/", {"machine_id": other.pk})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/machine/telemetry/", {"points": "a"})
+        self.assertEqual(response.status_code, 422)
+        response = self.client.get("/machine/telemetry/", {"start": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+
+class MachineStreamTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = self.client.defaults["HTTP_AUTHORIZATION"].split()[1]
+        self.container = MachineContainers.objects.create(
+            machine=self.machine, container_number=1
+        )
+
+    def test_broker_delivers_from_other_thread(self):
+        broker = LocalBroker()
+
+        async def receive():
+            subscription = broker.subscribe("channel")
+            thread = threading.Thread(
+                target=broker.publish, args=("channel", {"value": 1})
+            )
+            thread.start()
+            message = await subscription.get(timeout=5)
+            subscription.close()
+            return message
+
+        self.assertEqual(async_to_sync(receive)(), {"value": 1})
+        self.assertFalse(broker.subscriptions)
+
+    def test_slow_subscriber_resyncs(self):
+        broker = LocalBroker()
+
+        async def receive():
+            subscription = broker.subscribe("channel")
+            for value in range(SUBSCRIBER_QUEUE_SIZE + 1):
+                subscription.put({"value": value})
+            subscription.put({"value": "new"})
+            messages = [await subscription.get(timeout=1) for _ in range(3)]
+            subscription.close()
+            return messages
+
+        self.assertEqual(async_to_sync(receive)(), [RESYNC, {"value": "new"}, None])
+
+    def test_changes_published_after_commit(self):
+        async def receive():
+            subscription = get_broker().subscribe(machine_channel(self.machine.pk))
+            await sync_to_async(self.change)()
+            messages = [await subscription.get(timeout=5) for _ in range(2)]
+            subscription.close()
+            return messages
+
+        machine, container = async_to_sync(receive)()
+        self.assertEqual(machine["event"], "machine")
+        self.assertEqual(machine["data"]["state_of_the_tea_making_process"], 3)
+        self.assertEqual(container["event"], "container")
+        self.assertEqual(container["data"]["tea"]["id"], self.tea.id)
+
+    def change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.machine.state_of_the_tea_making_process = 3
+            self.machine.save()
+            self.container.tea = self.tea
+            self.container.save()
+
+    def ticket(self):
+        response = self.client.post("/machine/stream/ticket/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["ticket"]
+
+    def test_stream(self):
+        ticket = self.ticket()
+
+        async def read():
+            response = await AsyncClient().get("/machine/stream/", {"ticket": ticket})
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            stream = response.streaming_content.__aiter__()
+            snapshot = await stream.__anext__()
+            get_broker().publish(
+                machine_channel(self.machine.pk), {"event": "machine", "data": {"a": 1}}
+            )
+            event = await stream.__anext__()
+            await stream.aclose()
+            return snapshot, event
+
+        snapshot, event = async_to_sync(read)()
+        snapshot = snapshot.decode() if isinstance(snapshot, bytes) else snapshot
+        self.assertTrue(snapshot.startswith("event: snapshot\n"))
+        data = json.loads(snapshot.split("data: ", 1)[1])
+        self.assertEqual(data["machine"]["machine_id"], self.machine.pk)
+        self.assertEqual(len(data["containers"]), 1)
+        event = event.decode() if isinstance(event, bytes) else event
+        self.assertEqual(event, 'event: machine\ndata: {"a": 1}\n\n')
+
+    def test_stream_requires_token(self):
+        response = Client().get("/machine/stream/", {"ticket": "wrong"})
+        self.assertEqual(response.status_code, 401)
+        # Access tokens are not accepted in query string
+        response = Client().get("/machine/stream/", {"token": self.token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_ticket_expires(self):
+        ticket = self.ticket()
+        with patch("main_app.streams.TICKET_MAX_AGE", -1):
+            response = Client().get("/machine/stream/", {"ticket": ticket})
+        self.assertEqual(response.status_code, 401)
+
+    def receive_after(self, change, count):
+        async def receive():
+            subscription = get_broker().subscribe(machine_channel(self.machine.pk))
+            await sync_to_async(change)()
+            messages = [await subscription.get(timeout=5) for _ in range(count)]
+            subscription.close()
+            return messages
+
+        return async_to_sync(receive)()
+
+    def test_bulk_changes_published(self):
+        def ingest():
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest_telemetry(
+                    [
+                        {
+                            "machine_id": self.machine.pk,
+                            "samples": [
+                                {
+                                    "recorded_at": datetime.now(dt_timezone.utc),
+                                    "mug_temperature": 42,
+                                }
+                            ],
+                        }
+                    ]
+                )
+
+        (machine,) = self.receive_after(ingest, 1)
+        self.assertEqual(machine["event"], "machine")
+        self.assertEqual(machine["data"]["mug_temperature"], 42)
+
+        def provision():
+            with self.captureOnCommitCallbacks(execute=True):
+                create_containers([self.machine.pk], [(self.machine.pk, 1)])
+
+        containers = self.receive_after(provision, 4)
+        self.assertEqual(
+            [message["data"]["container_number"] for message in containers],
+            [1, 2, 3, 4],
+        )
+
+        def update():
+            self.container.ammount = 50
+            with self.captureOnCommitCallbacks(execute=True):
+                MachineContainers.objects.bulk_update([self.container], ["ammount"])
+
+        (container,) = self.receive_after(update, 1)
+        self.assertEqual(container["data"]["container_number"], 1)
+
+    def test_redis_listener_reconnects(self):
+        import redis
+
+        messages = [{"channel": b"ultimatea:events:c", "data": b'{"value": 1}'}]
+
+        class PubSub:
+            def __init__(self, connected):
+                self.connected = connected
+
+            def psubscribe(self, pattern):
+                pass
+
+            def listen(self):
+                if not self.connected:
+                    raise redis.ConnectionError("lost")
+                yield from messages
+                # Stops listener thread of test
+                raise SystemExit
+
+        connections = iter([False, True])
+        broker = RedisBroker.__new__(RedisBroker)
+        LocalBroker.__init__(broker)
+        broker.redis = unittest.mock.Mock(
+            pubsub=lambda **kwargs: PubSub(next(connections))
+        )
+        delivered = []
+        broker.deliver = lambda channel, message: delivered.append((channel, message))
+        broker.resync = lambda: delivered.append(RESYNC)
+        with patch("main_app.events.time.sleep"), self.assertLogs("main_app.events"):
+            with self.assertRaises(SystemExit):
+                broker.listen()
+        self.assertEqual(delivered, [RESYNC, ("c", {"value": 1})])
+
+
+class MachineInfoTests(QueryCountTestCase):
+    def test_get_single_read(self):
+        self.machine.state_of_the_tea_making_process = Machine.FINISHED_STATE
+        self.machine.save()
+        count, data = self.count_queries("/machine/")
+        self.assertEqual(count, 1)  # machine, user is rebuilt from token claims
+        self.assertEqual(data[0]["machine_id"], self.machine.pk)
+        self.machine.refresh_from_db()
+        self.assertEqual(
+            self.machine.state_of_the_tea_making_process, Machine.FINISHED_STATE
+        )
+
+    def test_etag(self):
+        response = self.client.get("/machine/")
+        etag = response["ETag"]
+        response = self.client.get("/machine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.machine.mug_temperature = 50
+        self.machine.save()
+        response = self.client.get("/machine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_acknowledge(self):
+        response = self.client.post("/machine/acknowledge/")
+        self.assertEqual(response.json(), {"acknowledged": False})
+        self.machine.state_of_the_tea_making_process = Machine.FINISHED_STATE
+        self.machine.save()
+        with patch("main_app.streams.publish_machine_event") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/machine/acknowledge/")
+        self.assertEqual(response.json(), {"acknowledged": True})
+        self.machine.refresh_from_db()
+        self.assertEqual(self.machine.state_of_the_tea_making_process, 0)
+        self.assertEqual(publish.call_args[0][2]["state_of_the_tea_making_process"], 0)
+
+
+class ContainerSyncTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.containers = [
+            MachineContainers.objects.create(
+                machine=self.machine, container_number=number
+            )
+            for number in range(1, 5)
+        ]
+
+    def edit(self, container, item_id):
+        kind = "tea" if container.container_number <= 2 else "ingredient"
+        response = self.client.patch(
+            f"/machine/containers/{kind}/{container.id}/",
+            {"id": item_id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def sync(self, edits):
+        "Make edits, then run all scheduled sync tasks, return sent messages"
+        with patch("main_app.container_sync.sync_containers.apply_async") as schedule:
+            for container, item_id in edits:
+                self.edit(container, item_id)
+        self.assertTrue(
+            all(call[1]["countdown"] > 0 for call in schedule.call_args_list)
+        )
+        with patch("main_app.container_sync.update_single_container.delay") as single:
+            with patch("main_app.container_sync.update_all_containers.delay") as full:
+                for call in schedule.call_args_list:
+                    sync_containers(*call[0][0])
+        return single, full
+
+    def test_burst_coalesced(self):
+        single, full = self.sync(
+            [
+                (self.containers[0], self.tea.id),
+                (self.containers[1], self.tea.id),
+                (self.containers[2], self.ingredients[0].id),
+                (self.containers[3], self.ingredients[1].id),
+                (self.containers[3], self.ingredients[2].id),
+            ]
+        )
+        self.assertEqual(single.call_count, 0)
+        self.assertEqual(full.call_count, 1)
+        data, machine_id = full.call_args[0]
+        self.assertEqual(machine_id, self.machine.pk)
+        self.assertEqual(data["c"][3], [4, self.ingredients[2].id, 0])
+        self.assertEqual([item[0] for item in data["c"]], [1, 2, 3, 4])
+
+    def test_single_container(self):
+        single, full = self.sync(
+            [
+                (self.containers[2], self.ingredients[0].id),
+                (self.containers[2], self.ingredients[1].id),
+            ]
+        )
+        self.assertEqual(full.call_count, 0)
+        self.assertEqual(single.call_count, 1)
+        data, number, machine_id = single.call_args[0]
+        self.assertEqual(number, 3)
+        self.assertEqual(data["c"], [[3, self.ingredients[1].id, 0]])
+
+    def test_separate_bursts(self):
+        single, full = self.sync([(self.containers[0], self.tea.id)])
+        single_next, _ = self.sync([(self.containers[0], None)])
+        self.assertEqual(single.call_count, 1)
+        self.assertEqual(single_next.call_count, 1)
+        self.assertIsNone(single_next.call_args[0][0]["c"][0][1])
+
+    def test_worker_without_web_cache(self):
+        "Celery worker has its own cache, sync state must come from database"
+        with patch("main_app.container_sync.sync_containers.apply_async") as schedule:
+            self.edit(self.containers[2], self.ingredients[0].id)
+        cache.clear()
+        with patch("main_app.container_sync.update_single_container.delay") as single:
+            self.assertTrue(sync_containers(*schedule.call_args[0][0]))
+            self.assertFalse(sync_containers(*schedule.call_args[0][0]))
+        self.assertEqual(single.call_count, 1)
+
+    def test_edit_during_flush_not_lost(self):
+        with patch("main_app.container_sync.sync_containers.apply_async") as schedule:
+            self.edit(self.containers[0], self.tea.id)
+            first = schedule.call_args[0][0]
+            self.edit(self.containers[2], self.ingredients[0].id)
+            second = schedule.call_args[0][0]
+        with patch("main_app.container_sync.update_single_container.delay"):
+            with patch("main_app.container_sync.update_all_containers.delay") as full:
+                # Superseded generation sends nothing and keeps edits pending
+                self.assertFalse(sync_containers(*first))
+                self.assertTrue(sync_containers(*second))
+        self.assertEqual(full.call_count, 1)
+        self.assertFalse(
+            MachineContainers.objects.filter(
+                machine=self.machine, sync_pending=True
+            ).exists()
+        )
+
+
+class ContainersLayoutTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(1, 5):
+            MachineContainers.objects.create(machine=self.machine, container_number=number)
+
+    def put(self, layout):
+        data = {
+            "containers": [
+                {"container_number": number, "id": item_id}
+                for number, item_id in layout.items()
+            ]
+        }
+        with patch("main_app.views.update_all_containers.delay") as delay:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.put(
+                    "/machine/containers/", data, content_type="application/json"
+                )
+        return response, delay, context
+
+    def test_set_layout(self):
+        # Warm up catalogs, ids are validated against them
+        self.client.get("/teas/")
+        self.client.get("/ingredients/")
+        response, delay, context = self.put(
+            {
+                1: self.tea.id,
+                2: None,
+                3: self.ingredients[0].id,
+                4: self.ingredients[1].id,
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(
+            delay.call_args[0][0]["c"],
+            [
+                [1, self.tea.id, 0],
+                [2, None, 0],
+                [3, self.ingredients[0].id, 0],
+                [4, self.ingredients[1].id, 0],
+            ],
+        )
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in context.captured_queries
+                if 'FROM "teas"' in query["sql"] or 'FROM "ingredients"' in query["sql"]
+            ]
+        )
+        containers = {
+            container.container_number: container
+            for container in MachineContainers.objects.filter(machine=self.machine)
+        }
+        self.assertEqual(containers[1].tea, self.tea)
+        self.assertIsNone(containers[2].tea)
+        self.assertEqual(containers[4].ingredient, self.ingredients[1])
+
+    def test_wrong_layout(self):
+        response, delay, _ = self.put({1: self.tea.id, 2: None, 3: None})
+        self.assertEqual(response.status_code, 400)
+        response, delay, _ = self.put({1: 0, 2: None, 3: None, 4: self.tea.id + 1000})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["containers"],
+            [
+                {"id": ["Tea does not exist."]},
+                {},
+                {},
+                {"id": ["Ingredient does not exist."]},
+            ],
+        )
+        delay.assert_not_called()
+
+
+class ProvisioningTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        # Token claims are updated after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+    def test_create_machine_atomic(self):
+        response = self.client.post(
+            "/machine/", {"machine_id": "new1"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            MachineContainers.objects.filter(machine="new1").count(), 4
+        )
+        with patch(
+            "main_app.views.create_containers", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.client.post(
+                "/machine/", {"machine_id": "new2"}, content_type="application/json"
+            )
+        self.assertFalse(Machine.objects.filter(pk="new2").exists())
+
+    def test_containers_created_concurrently_skipped(self):
+        # Other provisioning inserted containers after this one read existing rows
+        create_containers([self.machine.pk])
+        create_containers([self.machine.pk])
+        self.assertEqual(
+            MachineContainers.objects.filter(machine=self.machine).count(), 4
+        )
+
+    def test_container_number_unique(self):
+        MachineContainers.objects.create(machine=self.machine, container_number=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MachineContainers.objects.create(machine=self.machine, container_number=1)
+
+    def test_provision_idempotent(self):
+        # Half built machine, created without containers
+        MachineContainers.objects.create(machine=self.machine, container_number=1)
+        ids = ["p1", "p2", "p3", "p2", self.machine.pk]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                "/machine/provision/",
+                {"machine_ids": ids},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"created": 3, "skipped": 1})
+        inserts = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("INSERT")
+        ]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(
+            MachineContainers.objects.filter(
+                machine__in=["p1", "p2", "p3", self.machine.pk]
+            ).count(),
+            16,
+        )
+        response = self.client.post(
+            "/machine/provision/", {"machine_ids": ids}, content_type="application/json"
+        )
+        self.assertEqual(response.json(), {"created": 0, "skipped": 4})
+        self.assertEqual(MachineContainers.objects.count(), 16)
+
+    def test_provision_command_csv(self):
+        path = os.path.join(tempfile.mkdtemp(), "machines.csv")
+        with open(path, "w") as file:
+            file.write("machine_id\nc1\nc2\n\nc3\n")
+        output = io.StringIO()
+        call_command(
+            "provision_machines",
+            "c4",
+            csv_path=path,
+            header=True,
+            chunk_size=2,
+            stdout=output,
+        )
+        self.assertIn("Created 4, skipped 0", output.getvalue())
+        self.assertEqual(
+            MachineContainers.objects.filter(machine__in=["c1", "c4"]).count(), 8
+        )
+
+    def test_provision_admin_only(self):
+        self.user.is_staff = False
+        # Token claims are updated after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.post(
+            "/machine/provision/", {"machine_ids": ["p1"]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(DEVICE_TRANSPORT="main_app.delivery.DeviceSimulator")
+class DeliveryTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        DeviceSimulator.reset()
+        self.addCleanup(DeviceSimulator.reset)
+
+    def received(self):
+        return DeviceSimulator.received[self.machine.pk]
+
+    def make_due(self):
+        MachineMessage.objects.update(next_attempt_at=datetime.now(dt_timezone.utc))
+
+    def test_replayed_task_delivered_once(self):
+        for _ in range(2):
+            send_recipe.apply(({"id": 1}, self.machine.pk), task_id="task-1")
+        message = MachineMessage.objects.get()
+        self.assertEqual(
+            self.received(),
+            [
+                {
+                    "key": "task-1",
+                    "seq": message.id,
+                    "type": "send_recipe",
+                    "payload": {"id": 1},
+                }
+            ],
+        )
+        self.assertEqual(message.status, MachineMessage.Status.DELIVERED)
+        self.assertEqual(message.key, "task-1")
+
+    def test_retry_with_backoff_keeps_order(self):
+        DeviceSimulator.fail_next(self.machine.pk, 2)
+        with patch("main_app.tasks.deliver_machine_messages.apply_async") as retry:
+            send_recipe.apply(({"id": 1}, self.machine.pk), task_id="first")
+            update_all_containers.apply(({"containers": []}, self.machine.pk))
+        self.assertEqual(retry.call_args_list[0].kwargs["countdown"], 2)
+        self.assertEqual(self.received(), [])
+        # Not due yet
+        self.assertGreater(deliver_pending(self.machine.pk), 0)
+
+        self.make_due()
+        self.assertEqual(deliver_pending(self.machine.pk), 4)
+        self.make_due()
+        self.assertIsNone(deliver_pending(self.machine.pk))
+        self.assertEqual(
+            [message["type"] for message in self.received()],
+            ["send_recipe", "update_all_containers"],
+        )
+        self.assertEqual(MachineMessage.objects.get(key="first").attempts, 3)
+
+    def test_gives_up_after_max_attempts(self):
+        DeviceSimulator.fail_next(self.machine.pk, 1)
+        with patch("main_app.delivery.MAX_ATTEMPTS", 1):
+            send_recipe.apply(({"id": 1}, self.machine.pk), task_id="lost")
+            send_recipe.apply(({"id": 2}, self.machine.pk), task_id="next")
+        self.assertEqual(
+            MachineMessage.objects.get(key="lost").status, MachineMessage.Status.FAILED
+        )
+        self.assertEqual([message["key"] for message in self.received()], ["next"])
+
+    def test_metrics_per_type(self):
+        send_recipe.apply(({"id": 1}, self.machine.pk))
+        send_recipe.apply(({"id": 2}, self.machine.pk))
+        update_all_containers.apply(({}, self.machine.pk))
+        metrics = delivery_metrics(datetime.now(dt_timezone.utc) - timedelta(minutes=1))
+        self.assertEqual(metrics["send_recipe"]["delivered"], 2)
+        self.assertEqual(metrics["update_all_containers"]["delivered"], 1)
+        self.assertGreaterEqual(metrics["send_recipe"]["avg_latency"], 0)
+        output = io.StringIO()
+        call_command("delivery_stats", stdout=output)
+        self.assertIn("send_recipe: delivered 2", output.getvalue())
+
+    @override_settings(DEVICE_TRANSPORT=None)
+    def test_not_configured(self):
+        send_recipe.apply(({"id": 1}, self.machine.pk))
+        self.assertEqual(MachineMessage.objects.get().status, MachineMessage.Status.PENDING)
+        self.assertEqual(self.received(), [])
+
+    def test_leased_by_other_worker(self):
+        DeviceSimulator.fail_next(self.machine.pk, 1)
+        with patch("main_app.tasks.deliver_machine_messages.apply_async"):
+            send_recipe.apply(({"id": 1}, self.machine.pk))
+        MachineMessage.objects.update(
+            next_attempt_at=datetime.now(dt_timezone.utc),
+            leased_until=datetime.now(dt_timezone.utc) + timedelta(seconds=30),
+        )
+        self.assertGreater(deliver_pending(self.machine.pk), 0)
+        self.assertEqual(self.received(), [])
+        # Lease of dead worker expires
+        MachineMessage.objects.update(leased_until=datetime.now(dt_timezone.utc))
+        self.assertIsNone(deliver_pending(self.machine.pk))
+        self.assertEqual(len(self.received()), 1)
+        self.assertIsNone(MachineMessage.objects.get().leased_until)
+
+    def test_one_scheduled_delivery(self):
+        with patch("main_app.tasks.deliver_machine_messages.apply_async") as schedule:
+            self.assertTrue(schedule_delivery(self.machine.pk, 10))
+            self.assertFalse(schedule_delivery(self.machine.pk, 20))
+            self.assertFalse(schedule_delivery(self.machine.pk, 10))
+            # Earlier delivery is scheduled
+            self.assertTrue(schedule_delivery(self.machine.pk, 2))
+        self.assertEqual(
+            [call.kwargs["countdown"] for call in schedule.call_args_list], [10, 2]
+        )
+
+    def test_simulator_history_bounded(self):
+        with patch("main_app.delivery.SIMULATOR_HISTORY", 2):
+            for number in range(3):
+                send_recipe.apply(({"id": number}, self.machine.pk))
+        self.assertEqual(
+            [message["payload"]["id"] for message in self.received()], [1, 2]
+        )
+
+
+class WireFormatTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipes(1, tea_portion=200)[0]
+
+    def test_recipe_message(self):
+        recipe = load_recipe(self.user, self.recipe.id)
+        with self.assertNumQueries(0):
+            message = recipe_message(recipe, tea_portion=150)
+        self.assertEqual(message["v"], 1)
+        self.assertEqual(message["tea"], self.tea.id)
+        self.assertEqual(message["portion"], 150)
+        self.assertEqual(
+            message["ing"], [[ingredient.id, 10] for ingredient in self.ingredients]
+        )
+        full = PrepareRecipeSerializer(recipe, context={"tea_portion": ""}).data
+        self.assertLess(len(wire.dumps(message)), len(json.dumps(full)) / 2)
+
+    def test_codecs(self):
+        message = {"v": 1, "c": [[1, 2, 10.5], [3, None, 0]]}
+        for codec in (wire.MSGPACK, wire.JSON):
+            encoded = wire.dumps(message, codec)
+            self.assertEqual(encoded[:2], bytes((wire.WIRE_VERSION, codec)))
+            self.assertEqual(wire.loads(encoded), message)
+        # Plain JSON of older producers
+        self.assertEqual(wire.loads(json.dumps(message)), message)
+        with self.assertRaises(ValueError):
+            wire.loads(bytes((wire.WIRE_VERSION + 1, wire.MSGPACK)))
+
+    def test_celery_serializer(self):
+        content_type, encoding, body = kombu_dumps(
+            ((recipe_message(self.recipe),), {}, {}), serializer="ultimatea"
+        )
+        self.assertEqual(content_type, wire.CONTENT_TYPE)
+        args, _, _ = kombu_loads(body, content_type, encoding)
+        self.assertEqual(args[0]["id"], self.recipe.id)
+
+
+class FavouritesSyncTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = self.create_recipes(3)
+
+    def toggle(self, recipe, is_favourite):
+        with patch("main_app.views.favourites_edit_online.delay") as delay:
+            response = self.client.put(
+                f"/favourites_edit/{recipe.id}/",
+                {"is_favourite": is_favourite},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        return delay
+
+    def test_deltas_carry_versions(self):
+        added = self.toggle(self.recipes[0], True)
+        data, operation, machine_id = added.call_args[0]
+        self.assertEqual((operation, machine_id), ("add", self.machine.pk))
+        self.assertEqual(data["version"], 1)
+        self.assertEqual(data["recipe"]["ing"][0], [self.ingredients[0].id, 10])
+
+        # Unchanged state is not sent
+        self.toggle(self.recipes[0], True).assert_not_called()
+
+        removed = self.toggle(self.recipes[0], False)
+        self.assertEqual(
+            removed.call_args[0][:2], ({"version": 2, "id": self.recipes[0].id}, "remove")
+        )
+        self.machine.refresh_from_db()
+        self.assertEqual(self.machine.favourites_version, 2)
+
+    def test_resync(self):
+        self.toggle(self.recipes[1], True)
+        self.toggle(self.recipes[2], True)
+        response = self.client.get("/machine/favourites/", {"version": 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["version"], 2)
+        self.assertEqual(
+            [recipe["id"] for recipe in data["recipes"]],
+            [self.recipes[1].id, self.recipes[2].id],
+        )
+        response = self.client.get("/machine/favourites/", {"version": 2})
+        self.assertEqual(response.json(), {"version": 2, "recipes": None})
+        response = self.client.get("/machine/favourites/", {"version": "x"})
+        self.assertEqual(response.status_code, 422)
+
+
+class ClaimsAuthenticationTests(QueryCountTestCase):
+    def token(self):
+        response = Client().post(
+            "/token/", {"email": self.user.email, "password": self.password}
+        )
+        return response.json()
+
+    def test_no_queries(self):
+        # User is loaded once, then comes from cache
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get("/check_token/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/check_token/")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_local_cache(self):
+        # Changes published in other workers would not be seen, user is always loaded
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                response = self.client.get("/check_token/")
+            self.assertEqual(response.status_code, 200)
+
+    def test_changed_claims(self):
+        other = Machine.objects.create(machine_id="qc2")
+        self.user.machine = other
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        # Token was issued for qc1, cached claims win
+        response = self.client.get("/machine/")
+        self.assertEqual(response.json()[0]["machine_id"], "qc2")
+
+    def test_revoked(self):
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get("/check_token/").status_code, 401)
+        # Evicted state is loaded from database, user stays rejected
+        cache.clear()
+        self.assertEqual(self.client.get("/check_token/").status_code, 401)
+
+    def test_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get("/check_token/").status_code, 401)
+        cache.clear()
+        self.assertEqual(self.client.get("/check_token/").status_code, 401)
+
+    def test_refresh(self):
+        refresh = self.token()["refresh"]
+        response = Client().post("/token/refresh/", {"refresh": refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("lifetime", response.json())
+        self.assertNotEqual(response.json()["refresh"], refresh)
+        # Claims are kept, requests with refreshed token use cached user state
+        token = AccessToken(response.json()["access"])
+        self.assertEqual(token["machine_id"], self.machine.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        response = Client().post("/token/refresh/", {"refresh": refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_without_claims(self):
+        token = AccessToken.for_user(self.user)
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+        # User is loaded from database
+        with CaptureQueriesContext(connection) as context:
+            response = client.get("/machine/favourites/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('FROM "authorization_customuser"', context.captured_queries[0]["sql"])
+        self.assertEqual(client.get("/check_token/").status_code, 200)
+
+
+class OwnershipTests(QueryCountTestCase):
+    def user_queries(self, context):
+        return [
+            query["sql"]
+            for query in context.captured_queries
+            if 'FROM "authorization_customuser"' in query["sql"]
+        ]
+
+    def test_container_update(self):
+        container = MachineContainers.objects.create(
+            machine=self.machine, container_number=1
+        )
+        with patch("main_app.views.schedule_container_sync"):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.put(
+                    f"/machine/containers/tea/{container.id}/",
+                    {"id": self.tea.id, "ammount": 10},
+                    content_type="application/json",
+                )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user_queries(context), [])
+        self.assertNotIn("JOIN", context.captured_queries[0]["sql"])
+
+    def test_recipe_ingredient_delete(self):
+        recipe = self.create_recipes(1)[0]
+        row = recipe.ingredients.first()
+        other = CustomUser.objects.create_user("other@wp.pl", self.password)
+        foreign = Recipes.objects.create(author=other, recipe_name="x", tea_type=self.tea)
+        foreign_row = IngredientsRecipes.objects.create(
+            recipe=foreign, ingredient=self.ingredients[0], ammount=1
+        )
+        response = self.client.delete(f"/recipe_ingredient/{foreign_row.id}/")
+        self.assertEqual(response.status_code, 403)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete(f"/recipe_ingredient/{row.id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.user_queries(context), [])
+        # Row with its author, DELETE
+        self.assertEqual(len(context.captured_queries), 2)
+
+
+class AsyncViewsTests(QueryCountTestCase):
+    def test_hot_endpoints_async(self):
+        for path in (
+            "/check_token/",
+            "/machine/",
+            "/machine/containers/",
+            "/public_recipes/",
+            "/send_recipe/",
+        ):
+            self.assertTrue(iscoroutinefunction(resolve(path).func), path)
+
+    def test_async_client(self):
+        MachineContainers.objects.create(
+            machine=self.machine, container_number=1, tea=self.tea
+        )
+        client = AsyncClient()
+        headers = {"Authorization": self.client.defaults["HTTP_AUTHORIZATION"]}
+        response = async_to_sync(client.get)("/machine/", headers=headers)
+        self.assertEqual(response.json()[0]["machine_id"], self.machine.pk)
+        response = async_to_sync(client.get)("/machine/containers/", headers=headers)
+        self.assertEqual(
+            response.json()["tea_containers"][0]["tea"]["id"], self.tea.id
+        )
+        self.assertEqual(response.json()["ingredient_containers"], [])
+
+
+class ReplicaRoutingTests(QueryCountTestCase):
+    @override_settings(DATABASE_REPLICAS=["replica"])
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Recipes))
+        with replica_reads(self.user):
+            self.assertEqual(router.db_for_read(Recipes), "replica")
+            self.assertIsNone(router.db_for_write(Recipes))
+        self.assertIsNone(router.db_for_read(Recipes))
+        self.assertFalse(router.allow_migrate("replica", "main_app"))
+        self.assertIsNone(router.allow_migrate("default", "main_app"))
+
+    def test_no_replicas(self):
+        with replica_reads(self.user):
+            self.assertIsNone(ReplicaRouter().db_for_read(Recipes))
+
+    @override_settings(DATABASE_REPLICAS=["replica"], SHARED_CACHE=False)
+    def test_local_cache(self):
+        # Writes remembered by one worker would not be seen by others
+        with replica_reads(self.user):
+            self.assertIsNone(ReplicaRouter().db_for_read(Recipes))
+
+    # Replica alias is default database, routing decisions are counted
+    @override_settings(DATABASE_REPLICAS=["default"])
+    def test_reads_own_writes(self):
+        (recipe,) = self.create_recipes(1, is_public=True)
+        with patch.object(
+            routing, "choose_replica", wraps=routing.choose_replica
+        ) as choose:
+            for path in ("/public_recipes/", "/recipes/"):
+                self.assertEqual(self.client.get(path).status_code, 200)
+            self.assertTrue(choose.called)
+            # Reads of other endpoints stay on default database
+            choose.reset_mock()
+            self.client.get(f"/recipes/{recipe.id}/")
+            self.assertFalse(choose.called)
+
+            response = self.client.post(
+                f"/recipes/{recipe.id}/vote/",
+                {"score": 4},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 201)
+            for path in ("/public_recipes/", "/recipes/"):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+            self.assertFalse(choose.called)
+            self.assertEqual(response.json()[0]["score"], 4)
+
+            # Other users read from replica
+            other = CustomUser.objects.create_user("replica@wp.pl", self.password)
+            response = Client().post(
+                "/token/", {"email": other.email, "password": self.password}
+            )
+            headers = {"HTTP_AUTHORIZATION": f"Bearer {response.json()['access']}"}
+            self.client.get("/public_recipes/", **headers)
+            self.assertTrue(choose.called)
+
+    @override_settings(DATABASE_REPLICAS=["default"])
+    def test_failed_write_not_sticky(self):
+        self.client.post(
+            "/recipes/0/vote/", {"score": 4}, content_type="application/json"
+        )
+        self.assertFalse(routing.reads_own_writes(self.user))
+
+
+@override_settings(SHARED_CACHE=True, DATABASE_REPLICAS=["replica"])
+class ReplicaDatabaseTests(TransactionTestCase):
+    # replica is second connection to test database (TEST MIRROR), it sees committed rows
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create_user("replica@wp.pl", "Test1234")
+        response = Client().post("/token/", {"email": user.email, "password": "Test1234"})
+        self.client = Client(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.recipe = Recipes.objects.create(
+            author=user,
+            recipe_name="recipe",
+            tea_type=Teas.objects.create(tea_name="Czarna herbata"),
+            is_public=True,
+        )
+
+    def request(self, method, path, data=None):
+        "Response and SQL run on default and replica connections"
+        with CaptureQueriesContext(connections["default"]) as default:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = getattr(self.client, method)(
+                    path, data, content_type="application/json"
+                )
+        return (
+            response,
+            [query["sql"] for query in default.captured_queries],
+            [query["sql"] for query in replica.captured_queries],
+        )
+
+    def test_reads_from_replica(self):
+        response, default, replica = self.request("get", "/public_recipes/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]], [self.recipe.id]
+        )
+        self.assertTrue(any('FROM "recipes"' in sql for sql in replica))
+        self.assertFalse(any('FROM "recipes"' in sql for sql in default))
+
+        response, default, replica = self.request(
+            "post", f"/recipes/{self.recipe.id}/vote/", {"score": 4}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(any(sql.startswith("INSERT") for sql in default))
+        self.assertEqual(replica, [])
+
+        # Writer reads own writes from default database
+        response, default, replica = self.request("get", "/public_recipes/")
+        self.assertEqual(response.json()["results"][0]["score"], 4)
+        self.assertTrue(any('FROM "recipes"' in sql for sql in default))
+        self.assertEqual(replica, [])
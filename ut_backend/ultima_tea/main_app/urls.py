@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import *
+from .streams import machine_stream
 
 app_name = "main_app"
 
@@ -18,12 +19,24 @@ urlpatterns = [
     # path("machine/<slug:pk>", GetMachineInfo.as_view(), name="get_machine"),
     path("public_recipes/", ListPublicRecipes.as_view(), name="list_public_recipes"),
     path("check_token/", CheckTokenView.as_view(), name='check_token'),
+    path("machine/", MachineView.as_view(), name="machine"),
     path("send_recipe/", SendRecipeView.as_view(), name="send_recipe"),
         path(
         "machine/containers/",
         GetMachineContainers.as_view(),
         name="list_machine_containers",
     ),
+    path("machine/stream/", machine_stream, name="machine_stream"),
+    path(
+        "machine/stream/ticket/",
+        MachineStreamTicketView.as_view(),
+        name="machine_stream_ticket",
+    ),
+    path(
+        "machine/telemetry/",
+        MachineTelemetryView.as_view(),
+        name="machine_telemetry",
+    ),
     path(
         "machine/containers/tea/<int:pk>/",
         UpdateTeaContainersView.as_view(),
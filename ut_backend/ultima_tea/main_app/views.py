@@ -1,5 +1,6 @@
 from django.db.models import query
 from django.db.models.query import QuerySet
+from datetime import timedelta
 from django.http import request
 from rest_framework.views import APIView
 from rest_framework import permissions
@@ -7,27 +8,55 @@ from rest_framework.response import Response
 from rest_framework import generics, mixins, pagination
 from authorization.models import Machine, CustomUser
 from rest_framework import viewsets
-from rest_framework.exceptions import APIException, ValidationError
-from django.db.models import Q
+from rest_framework.exceptions import (
+    APIException,
+    NotFound,
+    PermissionDenied,
+    ValidationError,
+)
+from django.db import IntegrityError, transaction
+from asgiref.sync import sync_to_async
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
 from .models import *
 from .tasks import *
 from .serializers import *
+from .cache import data_etag, ingredients_catalog, teas_catalog
+from .async_views import AsyncAPIView, publish
+from .favourites import favourites_delta, favourites_snapshot
+from .pagination import KeysetPagination
+from .search import search_recipes
+from .streams import publish_after_commit, stream_ticket
+from .container_sync import containers_payload, schedule_container_sync
+from .provisioning import create_containers, provision_machines
+from .routing import reads_from_replica
+from .readiness import check_readiness, load_machine, load_recipe
+from .telemetry import ingest_telemetry, query_telemetry
+from .wire import containers_message, recipe_message
 from rest_framework.decorators import action
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 MAX_RECIPES_PER_USER = 50
+MAX_TELEMETRY_SAMPLES = 10000
+DEFAULT_TELEMETRY_POINTS = 500
+MAX_TELEMETRY_POINTS = 5000
 
 
 def filter_recipes(params: dict, queryset: QuerySet):
     """
     List public recipes. List of query parameters
-    name - name of recipe
+    name - part of recipe name
+    search - phrase searched in name and description, results ordered by relevance
     tea_type
+    ingredients - comma separated ingredient ids
     ingredient_1
     ingredient_2
     ingredient_3
+    ingredients_match - all (default): recipe contains all ingredients, any: at least one
     brewing_temperature_down
     brewing_temperature_up
     brewing_time_down
@@ -37,14 +66,14 @@ def filter_recipes(params: dict, queryset: QuerySet):
     """
     for param in params:
         if param == "name":
-            queryset = queryset.filter(recipe_name__iregex=f".*(?={params[param]}).*")
+            queryset = queryset.filter(recipe_name__icontains=params[param])
+            continue
+        if param == "search":
+            queryset = search_recipes(queryset, params[param])
             continue
         if param == "tea_type":
             queryset = queryset.filter(tea_type__pk=params[param])
             continue
-        if "ingredient" in param:
-            queryset = queryset.filter(ingredients__ingredient__pk=params[param])
-            continue
         if param == "brewing_temperature_down":
             queryset = queryset.filter(brewing_temperature__gte=params[param])
             continue
@@ -65,9 +94,80 @@ def filter_recipes(params: dict, queryset: QuerySet):
             continue
         if param == "min_score":
             queryset = queryset.filter(score__gte=params[param])
+    ingredient_ids = get_ingredient_ids(params)
+    if ingredient_ids:
+        queryset = filter_by_ingredients(
+            queryset, ingredient_ids, params.get("ingredients_match", "all")
+        )
     return queryset
 
 
+def get_ingredient_ids(params: dict):
+    "Collect ingredient ids from ingredients and ingredient_<n> query parameters"
+    values = []
+    for param in params:
+        if param == "ingredients":
+            if hasattr(params, "getlist"):
+                values += params.getlist(param)
+            else:
+                values.append(params[param])
+        elif param.startswith("ingredient_"):
+            values.append(params[param])
+    return {int(pk) for value in values for pk in value.split(",") if pk.strip()}
+
+
+def filter_by_ingredients(queryset: QuerySet, ingredient_ids: set, match="all"):
+    """
+    Filter recipes containing all (match="all") or any (match="any") of given ingredients.
+    Compiles to single subquery on ingredients_recipes, so number of ingredients
+    does not add joins and recipes are never duplicated.
+    """
+    recipes = IngredientsRecipes.objects.filter(ingredient_id__in=ingredient_ids)
+    if match == "all":
+        recipes = (
+            recipes.values("recipe")
+            .annotate(matched=Count("ingredient", distinct=True))
+            .filter(matched=len(ingredient_ids))
+        )
+    elif match != "any":
+        raise WrongQuerystringValue(
+            {"ingredients_match": "Allowed values are all and any."}
+        )
+    return queryset.filter(pk__in=recipes.values("recipe"))
+
+
+def conditional_response(request, data, etag=None):
+    "Response with ETag, 304 Not Modified if client has current version of data"
+    if etag is None:
+        etag = data_etag(data)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(data)
+    response["ETag"] = etag
+    return response
+
+
+def catalog_response(request, catalog):
+    "List cached catalog, answer 304 Not Modified if client has current version"
+    entry = catalog.get()
+    return conditional_response(request, entry["data"], entry["etag"])
+
+
+def parse_query_datetime(params, name, default):
+    "Read aware datetime from query string, naive datetimes are in default time zone"
+    if name not in params:
+        return default
+    try:
+        value = parse_datetime(params[name])
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({name: "Wrong datetime format, use ISO 8601."})
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
 class WrongQuerystringValue(APIException):
     status_code = 422
     default_detail = "Invalid query string. Value must be numeric type."
@@ -80,28 +180,39 @@ class NoMachineException(APIException):
     default_code = "no_machine"
 
 
+def machine_of(obj):
+    "Id of machine owning object, None for objects owned by recipe author"
+    if isinstance(obj, Machine):
+        return obj.pk
+    if isinstance(obj, MachineContainers):
+        return obj.machine_id
+    return None
+
+
+def author_of(obj):
+    "Id of author of recipe ingredient row, annotated by query or loaded with recipe"
+    try:
+        return obj.recipe_author_id
+    except AttributeError:
+        return obj.recipe.author_id
+
+
 class IsOwnerOrAdmin(permissions.BasePermission):
+    """
+    Machine and containers of user's machine, ingredient rows of user's recipes.
+    Owner is resolved from ids loaded with object and user's machine from token,
+    without querying users.
+    """
+
     def has_object_permission(self, request, view, obj):
         if request.user.is_anonymous:
             return False
-        try:
-            obj.customuser_set.get(pk=request.user.id)
+        machine_id = machine_of(obj)
+        if machine_id is None:
+            return author_of(obj) == request.user.id
+        if machine_id == request.user.machine_id:
             return True
-        except CustomUser.DoesNotExist:
-            if request.user.is_superuser:
-                return True
-        except AttributeError:
-            try:
-                obj.machine.customuser_set.get(pk=request.user.id)
-                return True
-            except CustomUser.DoesNotExist:
-                if request.user.is_superuser:
-                    return True
-            except AttributeError:
-                if obj.recipe.author.id == request.user.id:
-                    return True
-                return False
-            return False
+        return request.user.is_superuser
 
     def has_permission(self, request, view):
         if request.user.is_anonymous:
@@ -125,83 +236,125 @@ class IsAuthorOrAdmin(permissions.BasePermission):
         return True
 
 
-class MachineInfoViewSet(
-    viewsets.GenericViewSet,
-    mixins.ListModelMixin,
-    mixins.CreateModelMixin,
-    mixins.DestroyModelMixin,
-):
+class MachineView(AsyncAPIView):
     """
-    List all user machines info
-    Query params: all=bool - List all machines. Require admin permissions.
+    GET: user machine info. Query params: all=bool - List all machines. Require admin permissions.
+    POST: create machine with its containers. Require admin permissions.
+    """
+
+    serializer_class = MachineInfoSerializer
+    permission_classes_by_method = {
+        "GET": [IsOwnerOrAdmin],
+        "POST": [permissions.IsAdminUser],
+    }
+
+    def get_permissions(self):
+        try:
+            return [
+                permission()
+                for permission in self.permission_classes_by_method[self.request.method]
+            ]
+        except KeyError:
+            return [permissions.IsAdminUser()]
+
+    async def get(self, request, format=None):
+        # Read only, pollers with current ETag get 304 Not Modified
+        if request.query_params.get("all", False) and request.user.is_superuser:
+            machines = [machine async for machine in Machine.objects.all()]
+        else:
+            # Single SELECT of user machine
+            if request.user.machine_id is None:
+                raise NoMachineException()
+            machines = [
+                machine
+                async for machine in Machine.objects.filter(pk=request.user.machine_id)
+            ]
+            if len(machines) == 0:
+                raise NoMachineException()
+        serializer = MachineInfoSerializer(machines, many=True)
+        response = conditional_response(request, serializer.data)
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    @swagger_auto_schema(request_body=MachineInfoSerializer)
+    async def post(self, request, format=None):
+        return await sync_to_async(self.create_machine)(request.data)
+
+    def create_machine(self, data):
+        machine = MachineInfoSerializer(data=data)
+        machine.is_valid(raise_exception=True)
+        # Machine and its four containers are created together or not at all
+        with transaction.atomic():
+            instance = machine.save()
+            create_containers([instance.machine_id])
+        return Response(machine.data)
+
+
+class MachineInfoViewSet(viewsets.GenericViewSet, mixins.DestroyModelMixin):
+    """
+    Machine actions, machine info and creating machines are served by MachineView
     """
 
     serializer_class = MachineInfoSerializer
     permission_classes = [IsOwnerOrAdmin]
     queryset = Machine.objects.all()
     permission_classes_by_action = {
-        "list": [IsOwnerOrAdmin],
+        "acknowledge": [IsOwnerOrAdmin],
+        "favourites": [IsOwnerOrAdmin],
     }
 
-    def list(self, request, *args, **kwargs):
+    @action(detail=False, methods=["post"])
+    def acknowledge(self, request, *args, **kwargs):
+        """
+        Acknowledge finished tea making, move machine from Machine.FINISHED_STATE back to
+        READY_TO_WORK. Returns {"acknowledged": bool}, false if tea making was not finished.
+        """
         self.check_permissions(request)
-        if self.request.query_params.get("all", False):
-            obj = self.get_queryset()
-        else:
-            obj = self.get_queryset()
-            if len(obj) == 0:
-                raise NoMachineException()
-            obj = obj[0]
-            if obj.state_of_the_tea_making_process == 5:
-                obj.state_of_the_tea_making_process = 0
-                obj.save()
-        result = super().list(request, *args, **kwargs)
-        return result
+        if request.user.machine_id is None:
+            raise NoMachineException()
+        # Conditional UPDATE, concurrent state change of machine is not overwritten
+        acknowledged = Machine.objects.filter(
+            pk=request.user.machine_id,
+            state_of_the_tea_making_process=Machine.FINISHED_STATE,
+        ).update(
+            state_of_the_tea_making_process=Machine.StatesOfTeaMakingProcess.READY_TO_WORK
+        )
+        if acknowledged:
+            publish_after_commit(machine_ids=[request.user.machine_id])
+        return Response({"acknowledged": bool(acknowledged)})
+
+    @action(detail=False, methods=["get"])
+    def favourites(self, request, *args, **kwargs):
+        """
+        Full resync of favourites, for machine which missed some change.
+        Query params: version=int - version held by machine, recipes are null if it is current.
+        Returns {"version": int, "recipes": [compact recipes] or null}.
+        """
+        self.check_permissions(request)
+        if request.user.machine_id is None:
+            raise NoMachineException()
+        version = request.query_params.get("version")
+        try:
+            version = None if version is None else int(version)
+        except ValueError:
+            raise WrongQuerystringValue()
+        return Response(favourites_snapshot(request.user, version))
 
-    def create(self, request, *args, **kwargs):
+    @swagger_auto_schema(
+        operation_description="Provision many machines with their containers",
+        request_body=ProvisionMachinesSerializer,
+    )
+    @action(detail=False, methods=["post"])
+    def provision(self, request, *args, **kwargs):
+        """
+        Create machines with empty containers in atomic chunks. Existing machines are
+        skipped. Returns numbers of created and skipped machines. Require admin permissions.
+        """
         self.check_permissions(request)
-        machine = MachineInfoSerializer(data=request.data)
-        if machine.is_valid(raise_exception=True):
-            machine.save()
-        tea_container1 = TeasConatainerSerializer(
-            data={
-                "container_number": 1,
-                "machine": request.data["machine_id"],
-                "tea": None,
-            }
-        )
-        tea_container2 = TeasConatainerSerializer(
-            data={
-                "container_number": 2,
-                "machine": request.data["machine_id"],
-                "tea": None,
-            }
-        )
-        ing_container1 = IngredientsConatainerSerializer(
-            data={
-                "container_number": 3,
-                "machine": request.data["machine_id"],
-                "ingredient": None,
-            }
-        )
-        ing_container2 = IngredientsConatainerSerializer(
-            data={
-                "container_number": 4,
-                "machine": request.data["machine_id"],
-                "ingredient": None,
-            }
-        )
-        if (
-            tea_container1.is_valid(raise_exception=True)
-            and tea_container2.is_valid(raise_exception=True)
-            and ing_container1.is_valid(raise_exception=True)
-            and ing_container2.is_valid(raise_exception=True)
-        ):
-            tea_container1.save()
-            tea_container2.save()
-            ing_container1.save()
-            ing_container2.save()
-        return Response(machine.data)
+        serializer = ProvisionMachinesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = provision_machines(serializer.validated_data["machine_ids"])
+        return Response(result, status=201)
 
     def get_permissions(self):
         try:
@@ -221,15 +374,98 @@ class MachineInfoViewSet(
         return Machine.objects.filter(customuser=self.request.user)
 
 
-class CheckTokenView(APIView):
-    queryset = CustomUser.objects.all()
-    permission_classes = (permissions.IsAuthenticated,)
+class MachineTelemetryView(APIView):
+    """
+    GET: sensor curves of machine. Query params:
+    machine_id - default user machine, other machines require admin permissions
+    start, end - ISO datetimes, default last hour
+    points - maximal number of points (default 500), raw samples, minute or hour
+    buckets are returned, whichever is finest and fits
+    POST: ingest sensor readings of machines. Body is one batch or list of batches:
+    {"machine_id": str, "samples": [{"recorded_at": datetime, "brewing_temperature": float,
+    "air_temperature": float, "mug_temperature": float, "water_container_weight": float}]}
+    Sensor values are optional. Require admin permissions.
+    """
+
+    permission_classes_by_method = {
+        "GET": [permissions.IsAuthenticated],
+        "POST": [permissions.IsAdminUser],
+    }
+
+    def get_permissions(self):
+        try:
+            return [
+                permission()
+                for permission in self.permission_classes_by_method[self.request.method]
+            ]
+        except KeyError:
+            return [permissions.IsAdminUser()]
 
     def get(self, request, format=None):
         self.check_permissions(request)
+        params = request.query_params
+        machine_id = params.get("machine_id", request.user.machine_id)
+        if machine_id is None:
+            raise NoMachineException()
+        if machine_id != request.user.machine_id and not request.user.is_staff:
+            raise PermissionDenied()
+        try:
+            points = int(params.get("points", DEFAULT_TELEMETRY_POINTS))
+        except ValueError:
+            raise WrongQuerystringValue()
+        if not 0 < points <= MAX_TELEMETRY_POINTS:
+            raise ValidationError(
+                {"points": f"Value must be in range <1;{MAX_TELEMETRY_POINTS}>."}
+            )
+        end = parse_query_datetime(params, "end", timezone.now())
+        start = parse_query_datetime(params, "start", end - timedelta(hours=1))
+        if start >= end:
+            raise ValidationError({"start": "Must be earlier than end."})
+        resolution, data = query_telemetry(machine_id, start, end, points)
+        return Response({"resolution": resolution, "points": data})
+
+    def post(self, request, format=None):
+        self.check_permissions(request)
+        many = isinstance(request.data, list)
+        serializer = TelemetryBatchSerializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        batches = serializer.validated_data if many else [serializer.validated_data]
+        if sum(len(batch["samples"]) for batch in batches) > MAX_TELEMETRY_SAMPLES:
+            raise ValidationError(
+                {"samples": f"At most {MAX_TELEMETRY_SAMPLES} samples per request."}
+            )
+        machine_ids = {batch["machine_id"] for batch in batches}
+        unknown = machine_ids - set(
+            Machine.objects.filter(pk__in=machine_ids).values_list("pk", flat=True)
+        )
+        if unknown:
+            raise ValidationError({"machine_id": f"Unknown machines: {sorted(unknown)}"})
+        return Response({"samples": ingest_telemetry(batches)}, status=201)
+
+
+class CheckTokenView(AsyncAPIView):
+    queryset = CustomUser.objects.all()
+    permission_classes = (permissions.IsAuthenticated,)
+
+    async def get(self, request, format=None):
+        # Token and permissions were checked by dispatch, without database
         return Response(status=200)
 
 
+class MachineStreamTicketView(AsyncAPIView):
+    """
+    Ticket opening machine stream (machine/stream/?ticket=...) for clients which can not
+    send Authorization header, like EventSource in browsers. Ticket expires in 30 seconds.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+
+    async def post(self, request, format=None):
+        if request.user.machine_id is None:
+            raise NoMachineException()
+        return Response({"ticket": stream_ticket(request.user.machine_id)})
+
+
 class UpdateTeaContainersView(generics.UpdateAPIView):
     """
     List or edit tea containers
@@ -239,28 +475,14 @@ class UpdateTeaContainersView(generics.UpdateAPIView):
     permission_classes = [IsOwnerOrAdmin]
     queryset = MachineContainers.objects.all()
 
-    def update(self, request, pk, *args, **kwargs):
-        data = super().update(request, pk, *args, **kwargs)
-        machine = request.user.machine
-        containers = MachineContainers.objects.filter(
-            machine__customuser=self.request.user
-        )
-        ingredients = containers.filter(container_number__gte=3)
-        teas = containers.filter(container_number__lte=2)
-        ingredients = IngredientsConatainerSerializer(ingredients, many=True)
-        teas = TeasConatainerSerializer(teas, many=True)
-        update_all_containers.delay(
-            {
-                "tea_containers": teas.data,
-                "ingredient_containers": ingredients.data,
-            },
-            machine.machine_id,
-        )
-        return data
+    def perform_update(self, serializer):
+        container = serializer.save()
+        # Bursts of edits are sent to machine as one message
+        schedule_container_sync(container.machine_id, container.container_number)
 
     def get_queryset(self):
         return MachineContainers.objects.filter(
-            Q(machine__customuser=self.request.user) & (Q(container_number__lte=2))
+            machine_id=self.request.user.machine_id, container_number__lte=2
         )
 
 
@@ -275,51 +497,75 @@ class UpdateIngredientContainersView(generics.UpdateAPIView):
 
     def get_queryset(self):
         return MachineContainers.objects.filter(
-            Q(machine__customuser=self.request.user) & (Q(container_number__gte=3))
+            machine_id=self.request.user.machine_id, container_number__gte=3
         )
 
-    def update(self, request, pk, *args, **kwargs):
-        data = super().update(request, pk, *args, **kwargs)
-        machine = request.user.machine
-        containers = MachineContainers.objects.filter(
-            machine__customuser=self.request.user
-        )
-        ingredients = containers.filter(container_number__gte=3)
-        teas = containers.filter(container_number__lte=2)
-        ingredients = IngredientsConatainerSerializer(ingredients, many=True)
-        teas = TeasConatainerSerializer(teas, many=True)
-        update_all_containers.delay(
-            {
-                "tea_containers": teas.data,
-                "ingredient_containers": ingredients.data,
-            },
-            machine.machine_id,
-        )
-        return data
+    def perform_update(self, serializer):
+        container = serializer.save()
+        # Bursts of edits are sent to machine as one message
+        schedule_container_sync(container.machine_id, container.container_number)
 
 
-class GetMachineContainers(generics.ListAPIView):
+class GetMachineContainers(AsyncAPIView, generics.ListAPIView):
 
     queryset = MachineContainers.objects.all()
     permission_classes = [IsOwnerOrAdmin]
     serializer_class = IngredientsConatainerSerializer
 
-    def get_queryset(self):
-        return MachineContainers.objects.filter(machine__customuser=self.request.user)
+    async def get(self, request, *args, **kwargs):
+        containers = [
+            container
+            async for container in MachineContainers.objects.filter(
+                machine_id=request.user.machine_id
+            )
+            .select_related("tea", "ingredient")
+            .order_by("container_number")
+        ]
+        return Response(containers_payload(containers))
 
-    def list(self, request, *args, **kwargs):
-        self.check_permissions(request)
-        queryset = self.get_queryset()
-        ingredients = queryset.filter(container_number__gte=3)
-        teas = queryset.filter(container_number__lte=2)
-        ingredients = IngredientsConatainerSerializer(ingredients, many=True)
-        teas = TeasConatainerSerializer(teas, many=True)
-        return Response(
-            {"tea_containers": teas.data, "ingredient_containers": ingredients.data}
+    @swagger_auto_schema(
+        operation_description="Set all containers of user machine at once",
+        request_body=ContainersLayoutSerializer,
+    )
+    async def put(self, request, *args, **kwargs):
+        """
+        Body: {"containers": [{"container_number": 1-4, "id": tea (1-2) or ingredient (3-4)
+        id or null}]}, every container must be given. Machine gets one update_all_containers.
+        """
+        if request.user.machine_id is None:
+            raise NoMachineException()
+        data, containers = await sync_to_async(self.set_layout)(request)
+        await publish(
+            update_all_containers,
+            containers_message(containers),
+            request.user.machine_id,
         )
+        return Response(data)
+
+    def set_layout(self, request):
+        serializer = ContainersLayoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        layout = {
+            item["container_number"]: item["object"]
+            for item in serializer.validated_data["containers"]
+        }
+        with transaction.atomic():
+            containers = list(
+                MachineContainers.objects.select_for_update()
+                .filter(machine_id=request.user.machine_id)
+                .order_by("container_number")
+            )
+            for container in containers:
+                if container.container_number <= 2:
+                    container.tea = layout[container.container_number]
+                else:
+                    container.ingredient = layout[container.container_number]
+            MachineContainers.objects.bulk_update(containers, ["tea", "ingredient"])
+            data = containers_payload(containers)
+        return data, containers
 
 
-class ListPublicRecipes(generics.ListAPIView):
+class ListPublicRecipes(AsyncAPIView, generics.ListAPIView):
     """
     List public recipes with filters
     """
@@ -329,23 +575,54 @@ class ListPublicRecipes(generics.ListAPIView):
         page_size_query_param = "size"
         max_page_size = 6
 
+    class RecipesKeysetPagination(KeysetPagination):
+        # Default ordering of recipes, id makes it unique
+        ordering = ("-is_favourite", "recipe_name", "id")
+        page_size = 6
+        page_size_query_param = "size"
+        max_page_size = 6
+
     # serializer_class = RecipesSerializer2
     serializer_class = RecipesSerializer
     permission_classes = [permissions.IsAuthenticated]
     queryset = Recipes.objects.filter(is_public=True)
     pagination_class = RecipesSetPagination
 
+    @property
+    def paginator(self):
+        """
+        Page number pagination by default. Cursor pagination (no COUNT, no OFFSET) is used
+        with pagination=cursor or cursor query param. It always uses default ordering,
+        so it can not be used with search (results ordered by relevance).
+        """
+        request = getattr(self, "request", None)
+        if not hasattr(self, "_paginator") and request is not None:
+            params = request.query_params
+            if "cursor" in params or params.get("pagination") == "cursor":
+                if "search" in params:
+                    raise ValidationError(
+                        {"search": "Search results use page number pagination."}
+                    )
+                self._paginator = self.RecipesKeysetPagination()
+        return super().paginator
+
     def get_queryset(self):
         try:
             return filter_recipes(
                 self.request.query_params,
-                Recipes.objects.filter(Q(is_public=True)),
+                Recipes.objects.filter(Q(is_public=True))
+                .for_read()
+                .with_user_vote(self.request.user),
             )
         except ValueError:
             raise WrongQuerystringValue()
 
+    async def get(self, request, *args, **kwargs):
+        # Filtering, pagination and serialization are one database unit
+        return await sync_to_async(self.list)(request, *args, **kwargs)
+
+    @reads_from_replica
     def list(self, request, *args, **kwargs):
-        self.check_permissions(request)
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -397,9 +674,16 @@ class UserRecipesViewSet(viewsets.ModelViewSet):
             )
         return super().create(request, *args, **kwargs)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in permissions.SAFE_METHODS:
+            return queryset.for_read().with_user_vote(self.request.user)
+        return queryset
+
+    @reads_from_replica
     def list(self, request, *args, **kwargs):
         self.check_permissions(request)
-        queryset = Recipes.objects.filter(author=request.user)
+        queryset = self.get_queryset().filter(author=request.user)
         serializer = self.serializer_class(queryset, many=True)
         return Response(serializer.data)
 
@@ -413,40 +697,43 @@ class UserRecipesViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["post", "put"])
     def vote(self, request, pk):
+        # Vote is written in two statements (three for change), existence of recipe and
+        # uniqueness of vote are checked by database
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise NotFound()
+        serializer = RecipeVoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        score = serializer.validated_data["score"]
         if request.method == "PUT":
             # Modify score
-            try:
-                obj = VotedRecipes.objects.get(
-                    Q(user_id=request.user.pk) & Q(recipe_id=pk)
+            with transaction.atomic():
+                # Lock vote, so previous score can not change until recipe is updated
+                obj = (
+                    VotedRecipes.objects.select_for_update()
+                    .filter(Q(user_id=request.user.pk) & Q(recipe_id=pk))
+                    .first()
                 )
-                prev_score = obj.score
-                serializer = RecipeVoteSerializer(
-                    instance=obj,
-                    data=request.data | {"user": request.user.pk, "recipe": pk},
+                if obj is not None:
+                    VotedRecipes.objects.filter(pk=obj.pk).update(score=score)
+                    score = Recipes.objects.change_vote(pk, obj.score, score)
+                    return Response({"score": score}, status=200)
+        # Create new score
+        try:
+            with transaction.atomic():
+                VotedRecipes.objects.create(
+                    user_id=request.user.pk, recipe_id=pk, score=score
                 )
-                if serializer.is_valid(raise_exception=True):
-                    obj = serializer.save()
-                    recipe = Recipes.objects.get(pk=pk)
-                    recipe.score = (
-                        (recipe.score * recipe.votes) - prev_score + obj.score
-                    ) / (recipe.votes)
-                    recipe.save()
-                    return Response({"score": recipe.score}, status=200)
-            except VotedRecipes.DoesNotExist:
-                pass
-        serializer = RecipeVoteSerializer(
-            data={"user": request.user.pk, "recipe": pk} | request.data
-        )
-        if serializer.is_valid(raise_exception=True):
-            # Create new score
-            obj = serializer.save()
-            recipe = Recipes.objects.get(pk=pk)
-            recipe.score = ((recipe.score * recipe.votes) + obj.score) / (
-                recipe.votes + 1
+                score = Recipes.objects.add_vote(pk, score)
+                if score is None:
+                    raise NotFound()
+        except IntegrityError:
+            # Vote of the same user
+            raise ValidationError(
+                {"non_field_errors": ["The fields user, recipe must make a unique set."]}
             )
-            recipe.votes += 1
-            recipe.save()
-        return Response({"score": recipe.score}, status=201)
+        return Response({"score": score}, status=201)
 
 
 class IngredientsViewSet(viewsets.ModelViewSet):
@@ -467,7 +754,7 @@ class IngredientsViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         self.check_permissions(request)
-        return super().list(request, *args, **kwargs)
+        return catalog_response(request, ingredients_catalog)
 
     def retrieve(self, request, *args, **kwargs):
         self.check_permissions(request)
@@ -492,7 +779,7 @@ class TeasViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         self.check_permissions(request)
-        return super().list(request, *args, **kwargs)
+        return catalog_response(request, teas_catalog)
 
     def retrieve(self, request, *args, **kwargs):
         self.check_permissions(request)
@@ -500,7 +787,8 @@ class TeasViewSet(viewsets.ModelViewSet):
 
 
 class DeleteRecipeIngredient(generics.DestroyAPIView):
-    queryset = IngredientsRecipes.objects.all()
+    # Author is loaded with the row for ownership check
+    queryset = IngredientsRecipes.objects.annotate(recipe_author_id=F("recipe__author_id"))
     permission_classes = [IsOwnerOrAdmin]
     serializer_class = IngredientsRecipesSerializer
 
@@ -512,10 +800,10 @@ class ListTeas(generics.ListAPIView):
 
     def list(self, request, *args, **kwargs):
         self.check_permissions(request)
-        return super().list(request, *args, **kwargs)
+        return catalog_response(request, teas_catalog)
 
 
-class SendRecipeView(APIView):
+class SendRecipeView(AsyncAPIView):
     queryset = IngredientsRecipes.objects.all()
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = PrepareRecipeSerializer
@@ -531,69 +819,42 @@ class SendRecipeView(APIView):
             },
         ),
     )
-    def post(self, request, format=None):
-        self.check_permissions(request)
+    async def post(self, request, format=None):
+        if request.user.machine_id is None:
+            raise NoMachineException()
         try:
-            recipe = PrepareRecipeSerializer(
-                data=request.data,
-                context={"tea_portion": request.data["tea_portion"]},
-            )
-        except:
+            recipe_id = int(request.data["id"])
+            tea_portion = request.data.get("tea_portion", "")
+            tea_portion = None if tea_portion in ("", None) else float(tea_portion)
+        except (KeyError, TypeError, ValueError):
             raise ValidationError({"detail": "Wrong data"})
-
-        if recipe.is_valid(raise_exception=True):
-            recipe = recipe.data
-            print(recipe)
-            validation_errors = []
-            machine = Machine.objects.get(pk=request.user.machine.machine_id)
-            if machine.machine_status == 0:
-                validation_errors.append("Machine is not connected.")
-            if not machine.is_mug_ready:
-                validation_errors.append("Mug is not ready.")
-            tea_containers = MachineContainers.objects.filter(
-                Q(machine=machine) & Q(container_number__lte=2)
+        try:
+            recipe, shortfalls = await sync_to_async(self.readiness)(
+                request.user, recipe_id, tea_portion
             )
-            no_tea = True
-            for tea_container in tea_containers:
-                if tea_container.tea.id == recipe["tea_type"]["id"]:
-                    if tea_container.ammount >= recipe["tea_herbs_ammount"]:
-                        no_tea = False
-                    else:
-                        validation_errors.append("Not enough tea herbs in container.")
-                    break
-            if no_tea:
-                validation_errors.append(
-                    "Given tea type is not available in your tea containers."
-                )
-
-            ingredient_containers = MachineContainers.objects.filter(
-                Q(machine=request.user.machine) & Q(container_number__gte=3)
+        except Recipes.DoesNotExist:
+            raise ValidationError({"detail": "Recipe does not exist."})
+        except Machine.DoesNotExist:
+            raise NoMachineException()
+        if shortfalls:
+            # Not ValidationError, it would turn ammounts in shortfalls into strings
+            return Response(
+                {
+                    "detail": [item["detail"] for item in shortfalls],
+                    "shortfalls": shortfalls,
+                },
+                status=400,
             )
 
-            ingredients = recipe["ingredients"]
-            for ingredient in ingredients:
-                for ingredient_container in ingredient_containers:
-                    no_ingredient = True
-                    if ingredient_container.ingredient == ingredient["ingredient"]:
-                        if ingredient_container.ammount >= ingredient["ammount"]:
-                            no_ingredient = False
-                        else:
-                            validation_errors.append(
-                                "Not enough ingredient in container."
-                            )
-                        break
-                if no_ingredient:
-                    validation_errors.append(
-                        f"Ingredient: {ingredient['ingredient']['ingredient_name']}, of required ammount: {ingredient['ammount']}, is not avaible in your machine."
-                    )
-            if not machine.water_container_weight >= (recipe["tea_portion"] + 60):
-                validation_errors.append("Not enough water.")
-
-            if len(validation_errors) > 0:
-                raise ValidationError({"detail": validation_errors})
+        await publish(
+            send_recipe, recipe_message(recipe, tea_portion), request.user.machine_id
+        )
+        return Response({}, status=200)
 
-            send_recipe.delay(recipe, machine.machine_id)
-            return Response({}, status=200)
+    def readiness(self, user, recipe_id, tea_portion):
+        recipe = load_recipe(user, recipe_id)
+        machine, containers = load_machine(user.machine_id)
+        return recipe, check_readiness(machine, containers, recipe, tea_portion)
 
 
 class AddToFavouritesView(generics.UpdateAPIView):
@@ -605,10 +866,12 @@ class AddToFavouritesView(generics.UpdateAPIView):
     def get_queryset(self):
         return Recipes.objects.filter(author=self.request.user)
 
-    def update(self, request, pk, *args, **kwargs):
-        data = super().update(request, *args, **kwargs)
-        machine = request.user.machine
-        recipes = Recipes.objects.filter(Q(author=request.user) & Q(is_favourite=True))
-        recipes = PrepareRecipeSerializer(recipes, many=True)
-        favourites_edit_offline.delay(recipes.data, machine.machine_id)
-        return data
+    def perform_update(self, serializer):
+        was_favourite = serializer.instance.is_favourite
+        recipe = serializer.save()
+        machine_id = self.request.user.machine_id
+        if machine_id is None or recipe.is_favourite == was_favourite:
+            return
+        # Only the change is sent, machine resyncs whole list when it misses version
+        operation, data = favourites_delta(self.request.user, recipe)
+        favourites_edit_online.delay(data, operation, machine_id)
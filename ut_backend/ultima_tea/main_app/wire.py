@@ -0,0 +1,102 @@
+"""
+Compact format of messages for machines. Messages carry ids of teas and ingredients instead
+of nested serializer output, machine keeps its own catalog. Layout of version 1:
+
+    recipe:     {"v": 1, "id", "name", "temp", "brew", "mix", "tea", "herbs", "portion",
+                 "ing": [[ingredient id, ammount], ...]}
+    containers: {"v": 1, "c": [[container number, tea or ingredient id, ammount], ...]}
+
+Encoded messages (and Celery task bodies, serializer "ultimatea") start with two bytes,
+format version and codec. Payload is msgpack, or JSON if msgpack is not installed.
+Plain JSON without header is accepted too.
+
+Module is imported by Celery app before Django is set up, do not import models here.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MESSAGE_VERSION = 1
+WIRE_VERSION = 1
+MSGPACK = 1
+JSON = 2
+
+CONTENT_TYPE = "application/x-ultimatea"
+SERIALIZER_NAME = "ultimatea"
+
+
+def recipe_message(recipe, tea_portion=None):
+    "Recipe to prepare, tea_portion overrides portion of recipe"
+    return {
+        "v": MESSAGE_VERSION,
+        "id": recipe.id,
+        "name": recipe.recipe_name,
+        "temp": recipe.brewing_temperature,
+        "brew": recipe.brewing_time,
+        "mix": recipe.mixing_time,
+        "tea": recipe.tea_type_id,
+        "herbs": recipe.tea_herbs_ammount,
+        "portion": recipe.tea_portion if tea_portion is None else tea_portion,
+        "ing": [[row.ingredient_id, row.ammount] for row in recipe.ingredients.all()],
+    }
+
+
+def container_item(container):
+    item_id = container.tea_id if container.container_number <= 2 else container.ingredient_id
+    return [container.container_number, item_id, container.ammount]
+
+
+def containers_message(containers):
+    return {
+        "v": MESSAGE_VERSION,
+        "c": [container_item(container) for container in containers],
+    }
+
+
+def default(value):
+    "Values msgpack and json do not know (dates, decimals)"
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    return DjangoJSONEncoder().default(value)
+
+
+def dumps(data, codec=None):
+    codec = codec or (MSGPACK if msgpack is not None else JSON)
+    if codec == MSGPACK:
+        body = msgpack.packb(data, default=default, use_bin_type=True)
+    else:
+        body = json.dumps(data, default=default, separators=(",", ":")).encode()
+    return bytes((WIRE_VERSION, codec)) + body
+
+
+def loads(data):
+    if isinstance(data, str):
+        data = data.encode()
+    if data[:1] in (b"{", b"[", b'"'):
+        return json.loads(data)
+    version, codec, body = data[0], data[1], data[2:]
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unknown wire format version {version}")
+    if codec == MSGPACK:
+        if msgpack is None:
+            raise ValueError("Message is encoded with msgpack, which is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if codec == JSON:
+        return json.loads(body)
+    raise ValueError(f"Unknown wire format codec {codec}")
+
+
+def register_serializer():
+    "Make format available to Celery as CELERY_TASK_SERIALIZER = 'ultimatea'"
+    from kombu.serialization import register
+
+    register(
+        SERIALIZER_NAME,
+        dumps,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding="binary",
+    )
@@ -9,8 +9,17 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ultima_tea.settings')
 
 application = get_asgi_application()
+
+# Every ASGI request runs sync code in new thread, its persistent connection is never
+# reused, so every request would open connection and leave it open for CONN_MAX_AGE
+if settings.DB_CONN_MODE == "persistent":
+    raise ImproperlyConfigured(
+        "DB_CONN_MODE=persistent does not reuse connections under ASGI, use pgbouncer."
+    )
@@ -10,6 +10,10 @@ app = Celery('ultima_tea')
 # Using a string here means the worker will not have to
 # pickle the object when using Windows.
 app.config_from_object('django.conf:settings')
+
+from main_app.wire import register_serializer
+
+register_serializer()
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
 
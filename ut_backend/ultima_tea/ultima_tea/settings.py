@@ -8,9 +8,13 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
 from datetime import timedelta
 
+import django
+from django.core.exceptions import ImproperlyConfigured
+
 SIMPLE_JWT = {
     # TODO Change lifetime
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
@@ -64,6 +68,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "main_app.routing.replica_stickiness_middleware",
 ]
 
 ROOT_URLCONF = "ultima_tea.urls"
@@ -92,7 +97,7 @@ WSGI_APPLICATION = "ultima_tea.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.environ.get("DB_NAME", "server"),
         "USER": os.environ.get("DB_USER", "postgres"),
         "PASSWORD": os.environ.get("DB_PASSWORD", "postgres"),
@@ -101,6 +106,68 @@ DATABASES = {
     },
 }
 
+# Reuse of database connections, DB_CONN_MODE:
+# none - new connection for every request
+# persistent - connection is kept for DB_CONN_MAX_AGE seconds and checked before reuse,
+#   for WSGI workers and Celery (under ASGI every request runs in new thread, so
+#   persistent connections are never reused, asgi.py rejects it)
+# pgbouncer - persistent connections to local pgbouncer (DB_POOL_HOST, DB_POOL_PORT)
+#   in transaction pooling mode. Mode for the shipped image (entrypoint.sh runs ASGI
+#   workers, Python 3.8 with psycopg2 can not run pool mode)
+# pool - psycopg pool in every process (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE), requires
+#   Django 5.1+ and psycopg[pool], suits ASGI workers
+# bench_db_connections command compares latency of the modes.
+DB_CONN_MODES = ("none", "persistent", "pgbouncer", "pool")
+DB_CONN_MODE = os.environ.get("DB_CONN_MODE", "none")
+if DB_CONN_MODE not in DB_CONN_MODES:
+    raise ImproperlyConfigured(
+        f"Unknown DB_CONN_MODE {DB_CONN_MODE!r}, use one of {', '.join(DB_CONN_MODES)}."
+    )
+if DB_CONN_MODE in ("persistent", "pgbouncer"):
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+if DB_CONN_MODE == "pgbouncer":
+    DATABASES["default"]["HOST"] = os.environ.get("DB_POOL_HOST", "127.0.0.1")
+    DATABASES["default"]["PORT"] = os.environ.get("DB_POOL_PORT", "6432")
+    # Transactions of one connection may run on different server connections
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+if DB_CONN_MODE == "pool":
+    if django.VERSION < (5, 1):
+        raise ImproperlyConfigured("DB_CONN_MODE=pool requires Django 5.1 or newer.")
+    if not all(map(importlib.util.find_spec, ("psycopg", "psycopg_pool"))):
+        raise ImproperlyConfigured("DB_CONN_MODE=pool requires psycopg[pool].")
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        }
+    }
+
+# Read replicas, DB_REPLICA_HOSTS is comma separated list of host[:port] with the same
+# database and credentials as default. Reads of chosen endpoints go to replicas, see
+# main_app/routing.py.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(",")), 1
+):
+    host, _, port = replica.strip().partition(":")
+    alias = f"replica_{number}"
+    DATABASES[alias] = dict(
+        DATABASES["default"],
+        HOST=host,
+        PORT=port or DATABASES["default"]["PORT"],
+        TEST={"MIRROR": "default"},
+    )
+    DATABASE_REPLICAS.append(alias)
+# Second connection to default database, tests of replica routing list it in
+# DATABASE_REPLICAS. Nothing is routed to it otherwise.
+DATABASES["replica"] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+DATABASE_ROUTERS = ["main_app.routing.ReplicaRouter"]
+# Seconds after user's write in which the user reads from default database,
+# longer than replication lag
+REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -150,12 +217,47 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # User is rebuilt from token claims, without database (authorization/authentication.py)
+        "authorization.authentication.ClaimsJWTAuthentication",
     ],
 }
 
 AUTH_USER_MODEL = "authorization.CustomUser"
 
+# Teas and ingredients catalogs (main_app/cache.py) and users of access tokens
+# (authorization/authentication.py) are cached. Set REDIS_URL to share cache between
+# all workers and Celery, local memory cache is per process. Features which need all
+# processes to see the same cache check SHARED_CACHE.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+SHARED_CACHE = bool(os.environ.get("REDIS_URL"))
+# Users who wrote are remembered in cache, every worker must see it (main_app/routing.py)
+if DATABASE_REPLICAS and not SHARED_CACHE:
+    raise ImproperlyConfigured("DB_REPLICA_HOSTS requires REDIS_URL.")
+
+# Pub/sub of machine state streams (main_app/events.py). Local broker reaches only clients
+# connected to the same process, Redis broker reaches clients of all workers.
+MACHINE_EVENTS_BROKER = "main_app.events.LocalBroker"
+if os.environ.get("REDIS_URL"):
+    MACHINE_EVENTS_BROKER = "main_app.events.RedisBroker"
+    MACHINE_EVENTS_REDIS_URL = os.environ["REDIS_URL"]
+
+# Delivery of messages to machines (main_app/delivery.py). Without device gateway messages
+# stay pending. For local development set DEVICE_TRANSPORT to
+# main_app.delivery.DeviceSimulator, in-memory machines acknowledging every message.
+DEVICE_TRANSPORT = os.environ.get("DEVICE_TRANSPORT")
+if os.environ.get("DEVICE_GATEWAY_URL"):
+    DEVICE_TRANSPORT = "main_app.delivery.HttpTransport"
+    DEVICE_GATEWAY_URL = os.environ["DEVICE_GATEWAY_URL"]
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
@@ -166,9 +268,14 @@ DEFAULT_FROM_EMAIL = "UltimaTeaService@gmail.com"
 
 
 BROKER_URL = os.environ.get("BROKER_URL", f"pyamqp://guest@{IP}")
-CELERY_ACCEPT_CONTENT = ["application/json"]
-CELERY_TASK_SERIALIZER = "json"
+# Tasks carry messages for machines, compact binary format is in main_app/wire.py.
+# JSON is still accepted, set CELERY_TASK_SERIALIZER to "json" to send plain JSON.
+CELERY_ACCEPT_CONTENT = ["application/json", "application/x-ultimatea"]
+CELERY_TASK_SERIALIZER = os.environ.get("CELERY_TASK_SERIALIZER", "ultimatea")
 CELERY_RESULT_SERIALIZER = "json"
+CELERYBEAT_SCHEDULE = {
+    "rollup_telemetry": {"task": "rollup_telemetry", "schedule": 60.0},
+}
 
 CORS_ORIGIN_WHITELIST = ["http://localhost:3000"]
 